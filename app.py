@@ -1,40 +1,52 @@
 import streamlit as st
+import re
 import time
+import uuid
 from datetime import datetime
 from dotenv import load_dotenv
 import os
 
-from utils.memory_manager import MemoryManager
-from utils.mood_analyzer import MoodAnalyzer
-from utils.model_router import ModelRouter
-from utils.helpers import get_greeting, get_ui_theme, handle_easter_egg, get_level_from_messages
+from utils.engine import ConversationEngine, Session
+from utils.calendar_service import context as calendar_context
+from utils.helpers import get_greeting, get_ui_theme
+from utils.commands import registry as command_registry
 from utils.prompts import AYRA_SYSTEM_PROMPT
+from utils.tracing import tracer, serve_metrics
 
 load_dotenv()
 
+# Metrics endpoint (Prometheus /metrics, JSON /metrics.json) kalau diset
+if os.getenv("AYRA_METRICS_PORT"):
+    serve_metrics(os.getenv("AYRA_METRICS_PORT"))
+
 # -------------------------------------------------------------------
-# Initialise components (singleton in session state)
+# Initialise components
 # -------------------------------------------------------------------
-if "memory" not in st.session_state:
-    st.session_state.memory = MemoryManager()
-if "mood" not in st.session_state:
-    st.session_state.mood = MoodAnalyzer()
-if "router" not in st.session_state:
-    st.session_state.router = ModelRouter()
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-if "last_activity" not in st.session_state:
-    st.session_state.last_activity = []
-if "fatigue" not in st.session_state:
-    st.session_state.fatigue = False
-if "fatigue_until" not in st.session_state:
-    st.session_state.fatigue_until = 0
-if "mood_score" not in st.session_state:
-    st.session_state.mood_score = 0.0
-if "comfort_mode" not in st.session_state:
-    st.session_state.comfort_mode = False
-if "current_story_id" not in st.session_state:
-    st.session_state.current_story_id = None
+@st.cache_resource
+def get_engine():
+    # Satu engine (memory + router) dikongsi semua session dalam process ni
+    return ConversationEngine()
+
+def visitor_id():
+    # Setiap pelawat ada id sendiri (history, ringkasan, fakta, cerita, badge & rate limit).
+    # Disimpan dalam URL (?u=) supaya refresh / bookmark kekal user yang sama.
+    # AYRA_STREAMLIT_USER: deployment peribadi, semua tab kongsi satu user (cth. "default")
+    shared = os.getenv("AYRA_STREAMLIT_USER")
+    if shared:
+        return shared
+    uid = st.query_params.get("u", "")
+    if not re.fullmatch(r"[0-9a-f]{32}", uid):
+        uid = uuid.uuid4().hex
+        st.query_params["u"] = uid
+    return uid
+
+engine = get_engine()
+if "session" not in st.session_state:
+    st.session_state.session = Session(user_id=visitor_id())
+session = st.session_state.session
+
+# Masa rerun lepas satu turn (diukur sampai chat history siap dipaparkan)
+rerun_started = st.session_state.pop("rerun_started", None)
 
 # -------------------------------------------------------------------
 # UI Setup
@@ -275,7 +287,9 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # GREETING
-greeting_msg = get_greeting()
+# Satu CalendarContext setiap rerun, dikongsi greeting dan tema
+calendar_ctx = calendar_context()
+greeting_msg = get_greeting(calendar_ctx)
 st.markdown(f"""
 <div class="greeting-box">
     {greeting_msg}
@@ -286,14 +300,19 @@ st.markdown(f"""
 with st.sidebar:
     st.header("AYRA")
 
-    # Level and stats
-    msg_count = st.session_state.memory.get_stat("total_messages")
-    level, level_name = get_level_from_messages(msg_count)
-    st.metric("Friendship Level", f"{level} · {level_name}")
-    st.metric("Total Messages", msg_count)
+    # Level, streak & badges: nilai yang dah dikira masa save_interaction
+    progress = engine.memory.get_progress(session.user_id)
+    st.metric("Friendship Level", f"{progress['level']} · {progress['level_name']}")
+    st.metric("Total Messages", progress["messages"])
+    if progress["streak"]:
+        st.metric("Streak", f"🔥 {progress['streak']} hari")
+    if progress["badges"]:
+        st.caption(" ".join(badge.split()[0] for badge in progress["badges"]))
+    for badge in st.session_state.pop("new_badges", []):
+        st.toast(f"Badge baru: {badge}", icon="🏅")
 
     # Mood indicator
-    mood_val = st.session_state.mood_score
+    mood_val = session.mood_score
     if mood_val > 0.2:
         mood_text = "😊 Ceria"
     elif mood_val < -0.2:
@@ -303,13 +322,13 @@ with st.sidebar:
     st.metric("Mood AYRA", mood_text)
 
     if st.button("🔄 New Chat"):
-        st.session_state.chat_history = []
+        session.chat_history = []
         st.rerun()
 
     st.divider()
     st.subheader("👨‍💻 Uncle Jiji's Something...")
     st.write("Cuba taip ni kalau nak 'surprise':")
-    st.code("/ais-krim 🍦 /penat 😮‍💨 /cerita 📖 /sambung 🔄 /mood 😊 /level 📊 /badges 🏅 /dream 🌙 /food 🍜 /trending 📈")
+    st.code(" ".join(f"{c.name} {c.help.split()[0]}" for c in command_registry.commands()))
     st.caption("Jangan tanya apa, just try! 😉")
 
     st.divider()
@@ -346,6 +365,31 @@ with st.sidebar:
     st.markdown("📝 **Bagi feedback?**")
     st.markdown("[Klik sini](https://forms.gle/jfzyLqPx94oWs1du6) — tolong kami improve AYRA! 🙏")
 
+    # Hidden admin panel: ?admin=<AYRA_ADMIN_TOKEN>
+    admin_token = os.getenv("AYRA_ADMIN_TOKEN")
+    if admin_token and st.query_params.get("admin") == admin_token:
+        st.divider()
+        with st.expander("🛠️ Admin · Latency"):
+            stage_stats = tracer.summary()
+            st.dataframe([
+                {"stage": name, "count": s["count"], "p50 ms": round(s["p50_ms"], 1),
+                 "p95 ms": round(s["p95_ms"], 1), "p99 ms": round(s["p99_ms"], 1)}
+                for name, s in sorted(stage_stats.items())
+            ], hide_index=True)
+            st.json(dict(tracer.counters))
+            st.caption("LLM governor")
+            st.json(engine.router.governor.state())
+            st.caption("Coalesced model calls")
+            st.json(engine.router.singleflight.get_stats())
+            st.caption("Speculative prefetch")
+            st.json(engine.prefetcher.get_stats())
+            st.caption("Memory read cache")
+            st.json(engine.memory.get_cache_stats())
+            st.caption("Memory dedup")
+            st.json(engine.memory.get_dedup_stats())
+            st.download_button("metrics.json", tracer.export_json(), file_name="metrics.json")
+            st.download_button("metrics.prom", tracer.export_prometheus(), file_name="metrics.prom")
+
     st.divider()
     with st.expander("🔬 Public Testing Notice"):
         st.markdown("""
@@ -359,202 +403,55 @@ with st.sidebar:
         """)
 
 # Display chat history
-for msg in st.session_state.chat_history:
+for msg in session.chat_history:
     with st.chat_message(msg["role"]):
         st.write(msg["content"])
 
+if rerun_started is not None:
+    tracer.record("turn.rerun", (time.perf_counter() - rerun_started) * 1000)
+
 # -------------------------------------------------------------------
 # Handle user input
 # -------------------------------------------------------------------
 # Handle file analysis
 if st.session_state.get('analyze_file', False):
     uploaded_file = st.session_state.uploaded_file
-    file_type = st.session_state.file_type
-    analysis_option = st.session_state.analysis_option
-    custom_q = st.session_state.custom_q
-    
+
     # Reset flag
     st.session_state.analyze_file = False
-    
+
     # Tampilkan mesej user
     with st.chat_message("user"):
         st.write(f"[Uploaded file: {uploaded_file.name}]")
-    
-    # Proses ikut jenis fail
-    file_content = ""
-    if file_type.startswith("📸"):
-        # Guna Gemini vision
-        import PIL.Image
-        image = PIL.Image.open(uploaded_file)
-        # ... (panggil model vision)
-    elif file_type.startswith("📄"):
-        import PyPDF2
-        pdf_reader = PyPDF2.PdfReader(uploaded_file)
-        for page in pdf_reader.pages[:5]:
-            file_content += page.extract_text()
-    elif file_type.startswith("📊"):
-        import pandas as pd
-        if uploaded_file.name.endswith('.csv'):
-            df = pd.read_csv(uploaded_file)
-        else:
-            df = pd.read_excel(uploaded_file)
-        file_content = f"Data shape: {df.shape}\nColumns: {list(df.columns)}\nPreview:\n{df.head().to_string()}"
-    elif file_type.startswith("📝"):
-        from docx import Document
-        doc = Document(uploaded_file)
-        for para in doc.paragraphs[:20]:
-            file_content += para.text + "\n"
-    else:
-        file_content = uploaded_file.read().decode()
-    
-    # Potong panjang
-    if len(file_content) > 3000:
-        file_content = file_content[:3000] + "...[truncated]"
-    
-    # Hantar ke model (guna router atau terus Gemini)
+
     with st.spinner("AYRA sedang baca fail..."):
-        prompt_text = f"Analisis fail ini: {analysis_option}\n\nKandungan:\n{file_content}\n\nSoalan tambahan: {custom_q if custom_q else 'Tiada'}"
-        response, model_used = st.session_state.router.route(prompt_text, [])
-        # Simpan dan papar
-        st.session_state.chat_history.append({"role": "assistant", "content": response})
-        with st.chat_message("assistant"):
-            st.write(response)
-        st.session_state.memory.save_interaction(f"[Upload] {uploaded_file.name}", response, st.session_state.mood_score, model_used)
-        st.rerun()
+        result = engine.handle_file(
+            session,
+            uploaded_file,
+            st.session_state.file_type,
+            st.session_state.analysis_option,
+            st.session_state.custom_q
+        )
+    with st.chat_message("assistant"):
+        st.write(result["response"])
+    st.session_state.rerun_started = time.perf_counter()
+    st.rerun()
 
 
 if prompt := st.chat_input("Type your message..."):
-    # Add user message to history
-    st.session_state.chat_history.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.write(prompt)
 
-    # ---- 0. CRISIS DETECTION (SAFETY FIRST!) ----
-    from utils.crisis_detector import detect_crisis, format_crisis_response, contains_crisis_keywords
-    
-    # Get user's name from memory if available
-    user_name = st.session_state.memory.get_profile("name") or "awak"
-    
-    # Check for crisis
-    is_crisis, keyword = detect_crisis(prompt)
-    if is_crisis:
-        # Log crisis event
-        st.session_state.memory.log_crisis_event(prompt, keyword)
-        
-        # Format and send crisis response
-        crisis_response = format_crisis_response(user_name)
-        
-        # Add to chat
-        st.session_state.chat_history.append({"role": "user", "content": prompt})
-        st.session_state.chat_history.append({"role": "assistant", "content": crisis_response})
-        
-        # Save interaction
-        st.session_state.memory.save_interaction(prompt, crisis_response, st.session_state.mood_score, "Crisis Alert")
-        
-        # Display and stop further processing
-        with st.chat_message("user"):
-            st.write(prompt)
-        with st.chat_message("assistant"):
-            st.write(crisis_response)
-        st.rerun()
+    result = engine.handle_turn(session, prompt)
 
-    # ---- 1. Check for Easter eggs ----
-    egg_response = handle_easter_egg(prompt, memory=st.session_state.memory)
-    if egg_response:
-        response = egg_response
-        model_used = "Easter Egg"
-    else:
-        # ---- 2. Fatigue simulation ----
-        now = time.time()
-        st.session_state.last_activity.append(now)
-        st.session_state.last_activity = st.session_state.last_activity[-10:]
-
-        if st.session_state.fatigue:
-            if now > st.session_state.fatigue_until:
-                st.session_state.fatigue = False
-            else:
-                response = "AYRA: Kejap eh awak, Ayra nak 'recharge' jap. awak pun pergilah rehat, asyik tengok skrin jer!"
-                model_used = "Fatigue"
-                # Log but skip model
-                st.session_state.chat_history.append({"role": "assistant", "content": response})
-                st.session_state.memory.save_interaction(prompt, response, st.session_state.mood_score, model_used)
-                with st.chat_message("assistant"):
-                    st.write(response)
-                st.rerun()
-
-        if not st.session_state.fatigue and len(st.session_state.last_activity) >= 5:
-            time_window = st.session_state.last_activity[-1] - st.session_state.last_activity[-5]
-            if time_window < 120:  # 50 messages in 2 minutes
-                st.session_state.fatigue = True
-                st.session_state.fatigue_until = now + 300
-                response = "AYRA: Kejap eh awak, Ayra nak 'recharge' jap. awak pun pergilah rehat, asyik tengok skrin jer!"
-                model_used = "Fatigue"
-                st.session_state.chat_history.append({"role": "assistant", "content": response})
-                st.session_state.memory.save_interaction(prompt, response, st.session_state.mood_score, model_used)
-                with st.chat_message("assistant"):
-                    st.write(response)
-                st.rerun()
-
-        # ---- 3. Normal processing ----
-        if not st.session_state.fatigue:
-            # Get context from memory
-            context = st.session_state.memory.get_recent_conversations(limit=5)
-            # Build profile dict for router
-            profile = {
-                "name": st.session_state.memory.get_profile("name"),
-                "birthday": st.session_state.memory.get_profile("birthday")
-            }
-            # Call router
-            response, model_used = st.session_state.router.route(prompt, context, memory_profile=profile)
-
-            # Update mood
-            new_mood = st.session_state.mood.update(prompt)
-            st.session_state.mood_score = new_mood
-
-            # Comfort mode flag (for UI)
-            if new_mood < -0.1:
-                st.session_state.comfort_mode = True
-            else:
-                st.session_state.comfort_mode = False
-
-            # Save interaction
-            st.session_state.memory.save_interaction(prompt, response, new_mood, model_used)
-            st.session_state.memory.save_to_vault(prompt, response, new_mood, model_used)
-            
-            # Selepas dapat response dan sebelum save ke SQLite
-            # Simpan ke ChromaVault untuk long-term memory
-            is_important = any(word in prompt.lower() for word in ['suka', 'minat', 'nama', 'birthday', 'janji', 'teh tarik'])
-            st.session_state.memory.save_to_vault(
-                prompt, 
-                response, 
-                st.session_state.mood_score, 
-                model_used,
-                is_important=is_important
-            )
-
-            # Increment message count
-            st.session_state.memory.increment_stat("total_messages")
-
-            # Handle story continuation if needed
-            if prompt.lower().startswith("/sambung"):
-                # Special case: continue story
-                story = st.session_state.memory.get_latest_story()
-                if story:
-                    # Append new part to story (we'll just use the response as continuation)
-                    st.session_state.memory.update_story(story["id"], "\n\n" + response)
-                    st.session_state.current_story_id = story["id"]
-
-            elif prompt.lower().startswith("/cerita"):
-                # New story started – save it
-                story_id = st.session_state.memory.save_story("User Story", response)
-                st.session_state.current_story_id = story_id
-
-    # Append and display Ayra's response
-    st.session_state.chat_history.append({"role": "assistant", "content": response})
+    # Display Ayra's response
     with st.chat_message("assistant"):
-        st.write(response)
-        if model_used != "Easter Egg" and model_used != "Fatigue":
-            st.caption(f"*via {model_used}*")
+        st.write(result["response"])
+        if result["model_used"] not in ("Easter Egg", "Fatigue", "Crisis Alert"):
+            st.caption(f"*via {result['model_used']}*")
+    # Ditunjuk selepas rerun (toast hilang kalau dipanggil sebelum st.rerun)
+    st.session_state.new_badges = result["badges"]
 
     # Rerun to update UI (theme might change)
-    st.rerun()
\ No newline at end of file
+    st.session_state.rerun_started = time.perf_counter()
+    st.rerun()
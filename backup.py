@@ -0,0 +1,243 @@
+# backup.py
+
+"""
+Backup, migration and snapshot tooling for AYRA's memory.
+
+    python backup.py export ayra-memory.jsonl.zst            # memory.db -> compressed JSONL
+    python backup.py export ayra-memory.jsonl.gz --vault ./chroma_db
+    python backup.py import ayra-memory.jsonl.zst --db new-memory.db
+    python backup.py snapshot backups/memory.db               # online copy (SQLite backup API)
+
+Export format: one JSON object per line. The first line is a header
+{"format": "ayra-memory", "version", "created_at", "schema"}; every other
+line is {"t": table, "r": {column: value}}. Vault vectors use the table
+name "vault". .zst needs the `zstandard` package, anything else is gzip.
+Export and import stream rows in batches, so memory stays flat however
+big the database is.
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:  # optional: fallback ke gzip
+    zstandard = None
+
+from utils.memory_manager import DB_PATH, MemoryManager
+
+FORMAT = "ayra-memory"
+FORMAT_VERSION = 1
+BATCH_SIZE = 1000
+# Data pengguna sahaja; rate_buckets / fatigue_state cuma state sementara
+TABLES = [
+    "conversations", "conversation_summaries", "user_profile", "facts",
+    "stories", "story_chunks", "dreams", "user_stats", "user_counters", "user_badges", "crisis_log",
+]
+VAULT_COLLECTION = "ayra_memories"
+
+
+# -------------------------------------------------------------------
+# Compressed line streams
+# -------------------------------------------------------------------
+def _open_write(path):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            sys.exit("zstandard is not installed: pip install zstandard, or use a .gz file")
+        raw = open(path, "wb")
+        return io.TextIOWrapper(zstandard.ZstdCompressor(level=10).stream_writer(raw), encoding="utf-8")
+    return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+
+
+def _open_read(path):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            sys.exit("zstandard is not installed: pip install zstandard")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), encoding="utf-8")
+    return gzip.open(path, "rt", encoding="utf-8")
+
+
+def _dump(out, record):
+    out.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+    out.write("\n")
+
+
+# -------------------------------------------------------------------
+# Export
+# -------------------------------------------------------------------
+def export_memory(db_path, out_path, vault_dir=None):
+    """Stream every user-data table (and optionally the Chroma vault) to out_path"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    schema = dict(conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name IN ({','.join('?' * len(TABLES))})",
+        TABLES
+    ).fetchall())
+    counts = {}
+    with _open_write(out_path) as out:
+        _dump(out, {"format": FORMAT, "version": FORMAT_VERSION,
+                    "created_at": datetime.now().isoformat(), "schema": schema})
+        for table in TABLES:
+            if table not in schema:
+                continue
+            cursor = conn.execute(f"SELECT * FROM {table}")
+            columns = [c[0] for c in cursor.description]
+            counts[table] = 0
+            while rows := cursor.fetchmany(BATCH_SIZE):
+                for row in rows:
+                    _dump(out, {"t": table, "r": dict(zip(columns, row))})
+                counts[table] += len(rows)
+        if vault_dir:
+            counts["vault"] = _export_vault(out, vault_dir)
+    conn.close()
+    return counts
+
+
+def _export_vault(out, vault_dir):
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=vault_dir).get_or_create_collection(VAULT_COLLECTION)
+    total = 0
+    for offset in range(0, collection.count(), BATCH_SIZE):
+        page = collection.get(limit=BATCH_SIZE, offset=offset, include=["documents", "metadatas", "embeddings"])
+        for i, doc_id in enumerate(page["ids"]):
+            embedding = page["embeddings"][i]
+            _dump(out, {"t": "vault", "r": {
+                "id": doc_id, "document": page["documents"][i], "metadata": page["metadatas"][i],
+                "embedding": [round(float(x), 6) for x in embedding] if embedding is not None else None,
+            }})
+        total += len(page["ids"])
+    return total
+
+
+# -------------------------------------------------------------------
+# Import
+# -------------------------------------------------------------------
+def import_memory(in_path, db_path, vault_dir=None):
+    """Load an export into db_path (rows with the same primary key are replaced)"""
+    # MemoryManager cipta/migrate schema semasa dulu, jadi export lama pun masuk
+    conn = MemoryManager(db_path=db_path).conn
+    counts = {}
+    batch_table, batch_columns, batch = None, None, []
+    vault_batch = []
+    collection = None
+
+    def flush():
+        if batch:
+            placeholders = ",".join("?" * len(batch_columns))
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {batch_table} ({','.join(batch_columns)}) VALUES ({placeholders})", batch
+            )
+            batch.clear()
+
+    with _open_read(in_path) as stream:
+        header = json.loads(next(stream))
+        if header.get("format") != FORMAT or header.get("version", 0) > FORMAT_VERSION:
+            sys.exit(f"unsupported export: {header.get('format')} v{header.get('version')}")
+        existing = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for table, sql in header["schema"].items():
+            if table not in existing and table in TABLES:
+                conn.execute(sql)
+        target_columns = {
+            table: {row[1] for row in conn.execute(f"PRAGMA table_info({table})")} for table in header["schema"]
+        }
+
+        # REPLACE padam baris lama secara dalaman; tanpa ni trigger FTS (delete) tak jalan
+        conn.execute("PRAGMA recursive_triggers = ON")
+        conn.execute("BEGIN")
+        for line in stream:
+            record = json.loads(line)
+            table, row = record["t"], record["r"]
+            counts[table] = counts.get(table, 0) + 1
+            if table == "vault":
+                if vault_dir:
+                    vault_batch.append(row)
+                    if len(vault_batch) >= BATCH_SIZE:
+                        collection = _import_vault(vault_dir, vault_batch, collection)
+                continue
+            if table not in target_columns:
+                continue
+            columns = [c for c in row if c in target_columns[table]]
+            if table != batch_table or columns != batch_columns or len(batch) >= BATCH_SIZE:
+                flush()
+                batch_table, batch_columns = table, columns
+            batch.append([row[c] for c in columns])
+        flush()
+        conn.execute("COMMIT")
+    if vault_batch:
+        _import_vault(vault_dir, vault_batch, collection)
+    return counts
+
+
+def _import_vault(vault_dir, rows, collection=None):
+    if collection is None:
+        import chromadb
+        collection = chromadb.PersistentClient(path=vault_dir).get_or_create_collection(
+            VAULT_COLLECTION, metadata={"hnsw:space": "cosine"}
+        )
+    with_vectors = all(r["embedding"] is not None for r in rows)
+    collection.upsert(
+        ids=[r["id"] for r in rows],
+        documents=[r["document"] for r in rows],
+        metadatas=[r["metadata"] for r in rows],
+        embeddings=[r["embedding"] for r in rows] if with_vectors else None,
+    )
+    rows.clear()
+    return collection
+
+
+# -------------------------------------------------------------------
+# Snapshot
+# -------------------------------------------------------------------
+def snapshot(db_path, out_path, vault_dir=None):
+    """
+    Online copy of a live database via the SQLite backup API, in one step.
+    memory.db runs in WAL mode (RateLimiter sets it), so the copy reads a
+    consistent snapshot while chats keep writing. A stepped backup would
+    restart on every write from another connection and may never finish.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    src = sqlite3.connect(db_path, timeout=30)
+    dst = sqlite3.connect(out_path)
+    start = time.perf_counter()
+    with dst:
+        src.backup(dst)
+    src.close()
+    dst.close()
+    if vault_dir:
+        shutil.copytree(vault_dir, out_path + ".vault", dirs_exist_ok=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AYRA memory export / import / snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in [("export", "write a compressed JSONL export"),
+                            ("import", "load an export into a database"),
+                            ("snapshot", "online copy of memory.db")]:
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument("path", help="export / snapshot file")
+        cmd.add_argument("--db", default=DB_PATH, help=f"memory database (default {DB_PATH})")
+        cmd.add_argument("--vault", help="Chroma vault directory to include (needs chromadb)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "export":
+        counts = export_memory(args.db, args.path, args.vault)
+    elif args.command == "import":
+        counts = import_memory(args.path, args.db, args.vault)
+    else:
+        counts = {"seconds": round(snapshot(args.db, args.path, args.vault), 3)}
+    print(json.dumps(counts, indent=2))
+    print(f"{args.command} done in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# benchmark.py
+
+"""
+End-to-end benchmarks for AYRA (no Streamlit, no API key).
+
+    python benchmark.py --out bench.json
+    python benchmark.py --out bench.json --baseline bench_baseline.json --tolerance 0.25
+
+Turns go through utils.engine.ConversationEngine. The model is replaced by utils.fake_model.FakeModel, so numbers measure
+AYRA's own overhead plus whatever latency/token rate you configure.
+Exit code is 1 when any benchmark's p50 regresses past the tolerance.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from utils.crisis_detector import detect_crisis
+from utils.embeddings import EmbeddingService
+from utils.engine import ConversationEngine, Session
+from utils.fake_model import FakeModel
+from utils.language import detect_language
+from utils.file_extractor import extract_file_content
+from utils.llm_governor import LLMGovernor
+from utils.location import FOOD_INDEX, PLACES
+from utils.memory_manager import MemoryManager
+from utils.model_router import ModelRouter
+from utils.mood_analyzer import MoodAnalyzer
+from utils.rate_limiter import FatigueEngine, RateLimiter
+from utils.tracing import _quantile
+
+SAMPLE_PROMPTS = [
+    "Hari ni penat gila kerja, boss bagi deadline esok",
+    "Saya suka teh tarik kurang manis",
+    "Apa idea marketing untuk kedai kek online?",
+    "Best nya cuaca hari ni, rasa nak jalan-jalan",
+    "Can you help me plan a product launch in KL?",
+    "Esok ada meeting penting, takut sikit",
+    "/ais-krim",
+    "Nanti kita sambung cerita semalam ya",
+]
+
+
+# -------------------------------------------------------------------
+# Harness
+# -------------------------------------------------------------------
+def measure(func, iterations):
+    durations = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(i)
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    total = sum(durations)
+    return {
+        "iterations": iterations,
+        "mean_ms": total / iterations,
+        "p50_ms": _quantile(durations, 0.5),
+        "p95_ms": _quantile(durations, 0.95),
+        "p99_ms": _quantile(durations, 0.99),
+        "ops_per_sec": iterations / (total / 1000) if total else float("inf"),
+    }
+
+
+def _docx_file():
+    from docx import Document
+    doc = Document()
+    for i in range(50):
+        doc.add_paragraph(f"Perenggan {i}: jualan meningkat di Lembah Klang.")
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    buffer.name = "laporan.docx"
+    return buffer.getvalue()
+
+
+def _xlsx_file():
+    import pandas as pd
+    df = pd.DataFrame({"bulan": range(1, 501), "jualan": range(500, 1000)})
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def _as_upload(data, name):
+    buffer = io.BytesIO(data)
+    buffer.name = name
+    return buffer
+
+
+def run_benchmarks(args):
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="ayra-bench-")
+    memory = MemoryManager(db_path=os.path.join(workdir, "memory.db"))
+    mood = MoodAnalyzer()
+    governor = LLMGovernor(rpm=10**9, tpm=10**12)
+    router = ModelRouter(
+        model=FakeModel(latency_ms=args.latency_ms, tokens_per_sec=args.tokens_per_sec), governor=governor
+    )
+    n = args.iterations
+
+    results["memory.write"] = measure(
+        lambda i: memory.save_interaction(SAMPLE_PROMPTS[i % len(SAMPLE_PROMPTS)], "Okay lah!", 0.1, "Bench"), n
+    )
+    results["memory.context"] = measure(lambda i: memory.get_context(), n)
+    results["memory.stat"] = measure(lambda i: memory.get_stat("total_messages"), n)
+    results["memory.progress"] = measure(lambda i: memory.get_progress(), n)
+    results["memory.search_text"] = measure(lambda i: memory.search_text(SAMPLE_PROMPTS[i % len(SAMPLE_PROMPTS)]), n)
+    embedder = EmbeddingService(cache_path=os.path.join(workdir, "embeddings.db"))
+    results["embed.miss"] = measure(lambda i: embedder.embed(f"{SAMPLE_PROMPTS[i % len(SAMPLE_PROMPTS)]} {i}"), n)
+    results["embed.hit"] = measure(lambda i: embedder.embed(SAMPLE_PROMPTS[i % len(SAMPLE_PROMPTS)]), n)
+    results["embed.batch64"] = measure(
+        lambda i: embedder.embed_many([f"{p} {i}-{j}" for j, p in enumerate(SAMPLE_PROMPTS * 8)]), max(1, n // 10)
+    )
+    results["language.detect"] = measure(lambda i: detect_language(SAMPLE_PROMPTS[i % len(SAMPLE_PROMPTS)]), n * 10)
+    places = list(PLACES.values())
+    results["location.nearest"] = measure(lambda i: FOOD_INDEX.nearest(*places[i % len(places)], k=3), n * 10)
+    results["crisis.detect"] = measure(lambda i: detect_crisis(SAMPLE_PROMPTS[i % len(SAMPLE_PROMPTS)]), n * 10)
+    limiter = RateLimiter(memory.db_path)
+    results["ratelimit.check"] = measure(lambda i: limiter.check(f"bench-{i % 50}"), n)
+    results["mood.update"] = measure(lambda i: mood.update(SAMPLE_PROMPTS[i % len(SAMPLE_PROMPTS)]), n)
+
+    text_bytes = ("Laporan jualan Q3. " * 10_000).encode()
+    results["file.text"] = measure(
+        lambda i: extract_file_content(_as_upload(text_bytes, "laporan.txt"), "📃 Teks"), max(1, n // 10)
+    )
+    try:
+        docx_bytes = _docx_file()
+        results["file.docx"] = measure(
+            lambda i: extract_file_content(_as_upload(docx_bytes, "laporan.docx"), "📝 Word"), max(1, n // 10)
+        )
+    except ImportError:
+        print("skip file.docx (python-docx not installed)", file=sys.stderr)
+    try:
+        xlsx_bytes = _xlsx_file()
+        results["file.xlsx"] = measure(
+            lambda i: extract_file_content(_as_upload(xlsx_bytes, "jualan.xlsx"), "📊 Excel"), max(1, n // 10)
+        )
+    except ImportError:
+        print("skip file.xlsx (pandas/openpyxl not installed)", file=sys.stderr)
+
+    fatigue = FatigueEngine(RateLimiter(memory.db_path, global_rpm=1_000_000))
+    engine = ConversationEngine(memory=memory, router=router, fatigue=fatigue)
+
+    def turn(i):
+        # User baru setiap 4 turn supaya rate limit (fatigue) tak potong pipeline
+        if i % 4 == 0:
+            turn.session = Session(user_id=f"bench-{i}")
+        engine.handle_turn(turn.session, SAMPLE_PROMPTS[i % len(SAMPLE_PROMPTS)])
+
+    results["turn.pipeline"] = measure(turn, n)
+    memory.conn.close()
+    return results
+
+
+# -------------------------------------------------------------------
+# Baseline comparison
+# -------------------------------------------------------------------
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous.get("p50_ms"):
+            continue
+        ratio = current["p50_ms"] / previous["p50_ms"]
+        current["baseline_p50_ms"] = previous["p50_ms"]
+        current["change"] = ratio - 1
+        if ratio > 1 + tolerance:
+            regressions.append((name, previous["p50_ms"], current["p50_ms"], ratio - 1))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AYRA benchmark suite")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="fake model latency per call")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="fake model token rate (0 = instant)")
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "latency_ms": args.latency_ms,
+            "tokens_per_sec": args.tokens_per_sec,
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, r in results.items():
+        change = f"  ({r['change']:+.0%} vs baseline)" if "change" in r else ""
+        print(f"{name:22s} p50 {r['p50_ms']:8.3f} ms  p95 {r['p95_ms']:8.3f} ms  {r['ops_per_sec']:10.0f} ops/s{change}")
+    for name, before, after, change in regressions:
+        print(f"REGRESSION {name}: p50 {before:.3f} -> {after:.3f} ms ({change:+.0%})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# loadtest.py
+
+"""
+Local load test for the AYRA API server.
+
+    python loadtest.py --users 200 --duration 30                 # in-process server + FakeModel
+    python loadtest.py --url http://127.0.0.1:8080 --users 50    # existing server
+    python loadtest.py --ws --users 100                          # WebSocket streaming
+
+Reports requests per second, p50/p95/p99 latency (time to first chunk
+for --ws) and how many requests the server shed with 503. Each virtual
+user's first request (connection setup) is left out of the latency stats.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+import aiohttp
+from aiohttp import web
+
+from server import build_stub_engine, create_app
+from utils.tracing import _quantile
+
+PROMPTS = [
+    "Apa khabar AYRA?",
+    "Bagi idea nama kedai kopi",
+    "Hari ni rasa penat sikit",
+    "Macam mana nak naikkan sales online?",
+    "Cerita sikit pasal nasi lemak",
+]
+# Tukar session setiap beberapa mesej supaya fatigue tak mengganggu ukuran
+TURNS_PER_SESSION = 4
+
+
+async def _user(http, base_url, user_id, deadline, stats, use_ws, delay):
+    # Ramp up: 100 connects serentak boleh penuhkan listen backlog (SYN retry = tail palsu)
+    await asyncio.sleep(delay)
+    for n in itertools.count():
+        if time.perf_counter() >= deadline:
+            return
+        session_id = f"load-{user_id}-{n // TURNS_PER_SESSION}"
+        message = random.choice(PROMPTS)
+        start = time.perf_counter()
+        try:
+            if use_ws:
+                ok = await _ws_turn(http, base_url, session_id, message, start, stats, warm=n > 0)
+            else:
+                async with http.post(f"{base_url}/v1/turn", json={"session_id": session_id, "message": message}) as r:
+                    await r.read()
+                    ok = r.status == 200
+                    if r.status == 503:
+                        stats["rejected"] += 1
+                        await asyncio.sleep(0.05)
+                    elif ok and n > 0:  # request pertama = connection setup
+                        stats["latencies"].append((time.perf_counter() - start) * 1000)
+            stats["ok" if ok else "failed"] += 1
+        except aiohttp.ClientError:
+            stats["failed"] += 1
+
+
+async def _ws_turn(http, base_url, session_id, message, start, stats, warm):
+    async with http.ws_connect(f"{base_url}/v1/stream") as ws:
+        await ws.send_json({"session_id": session_id, "message": message})
+        first = True
+        async for msg in ws:
+            event = json.loads(msg.data)
+            if event["type"] == "chunk" and first:
+                if warm:
+                    stats["latencies"].append((time.perf_counter() - start) * 1000)
+                first = False
+            elif event["type"] == "error":
+                stats["rejected"] += event["error"] == "overloaded"
+                return False
+            elif event["type"] == "done":
+                return True
+    return False
+
+
+async def run(args):
+    runner = None
+    base_url = args.url
+    if not base_url:
+        engine = build_stub_engine(args.stub_latency_ms, args.stub_tokens_per_sec)
+        runner = web.AppRunner(create_app(engine, args.max_inflight, args.max_waiting))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        base_url = f"http://127.0.0.1:{port}"
+
+    stats = {"ok": 0, "failed": 0, "rejected": 0, "latencies": []}
+    connector = aiohttp.TCPConnector(limit=args.users)
+    async with aiohttp.ClientSession(connector=connector) as http:
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*[
+            _user(http, base_url, i, deadline, stats, args.ws, args.ramp_up * i / args.users)
+            for i in range(args.users)
+        ])
+        elapsed = time.perf_counter() - start
+
+    if runner:
+        await runner.cleanup()
+
+    latencies = sorted(stats["latencies"])
+    label = "first chunk" if args.ws else "latency"
+    print(f"users={args.users} duration={elapsed:.1f}s mode={'ws' if args.ws else 'rest'}")
+    print(f"ok={stats['ok']} failed={stats['failed']} rejected(503)={stats['rejected']}")
+    print(f"throughput: {stats['ok'] / elapsed:.1f} req/s")
+    if latencies:
+        print(f"{label}: p50 {_quantile(latencies, 0.5):.1f} ms  "
+              f"p95 {_quantile(latencies, 0.95):.1f} ms  p99 {_quantile(latencies, 0.99):.1f} ms  "
+              f"max {latencies[-1]:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AYRA API load test")
+    parser.add_argument("--url", help="target server (default: start one in-process with FakeModel)")
+    parser.add_argument("--users", type=int, default=100, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="seconds to spread user start-up over")
+    parser.add_argument("--ws", action="store_true", help="use the WebSocket streaming endpoint")
+    parser.add_argument("--max-inflight", type=int, default=64)
+    parser.add_argument("--max-waiting", type=int, default=256)
+    parser.add_argument("--stub-latency-ms", type=float, default=200.0)
+    parser.add_argument("--stub-tokens-per-sec", type=float, default=200.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
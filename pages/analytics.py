@@ -0,0 +1,88 @@
+# pages/analytics.py
+
+"""
+Read-only operational dashboard (Streamlit multipage, next to app.py).
+Reads only the rollup tables in analytics.db, never memory.db, so opening
+it does not compete with chat turns. Keep it fresh with
+`python rollup.py --watch 60` or AYRA_ROLLUP_INTERVAL on the API server.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import streamlit as st
+from dotenv import load_dotenv
+
+from utils.analytics import ANALYTICS_DB, DAY, HOUR, AnalyticsReader
+from utils.calendar_service import MALAYSIA_TZ
+
+load_dotenv()
+
+st.set_page_config(page_title="AYRA Analytics", page_icon="📊", layout="wide")
+
+# Admin sahaja, sama macam panel admin dalam app.py: ?admin=<AYRA_ADMIN_TOKEN>
+admin_token = os.getenv("AYRA_ADMIN_TOKEN")
+if not admin_token or st.query_params.get("admin") != admin_token:
+    st.warning("Dashboard ni untuk admin sahaja.")
+    st.stop()
+
+
+@st.cache_resource
+def get_reader(path):
+    return AnalyticsReader(path)
+
+
+@st.cache_data(ttl=60)
+def load(path, days):
+    # Cache 60s: banyak tab dashboard tetap satu set query kecil seminit
+    reader = get_reader(path)
+    now = datetime.now(MALAYSIA_TZ)
+    since_day = (now - timedelta(days=days)).strftime("%Y-%m-%d")
+    since_hour = (now - timedelta(hours=48)).strftime("%Y-%m-%dT%H")
+    return (pd.DataFrame(reader.series(HOUR, since_hour)), pd.DataFrame(reader.series(DAY, since_day)),
+            pd.DataFrame(reader.model_mix(DAY, since_day)), reader.state())
+
+
+st.title("📊 AYRA Analytics")
+days = st.sidebar.slider("Tempoh (hari)", 7, 90, 30)
+path = os.getenv("AYRA_ANALYTICS_DB", ANALYTICS_DB)
+try:
+    hourly, daily, models, state = load(path, days)
+except Exception:
+    st.info(f"Belum ada rollup dalam {path}. Jalankan `python rollup.py` dulu.")
+    st.stop()
+if daily.empty:
+    st.info("Tiada data dalam tempoh ni.")
+    st.stop()
+
+# ===== SUMMARY =====
+today = daily.iloc[-1]
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Mesej hari ni", int(today["messages"]))
+col2.metric("User aktif hari ni", int(today["active_users"]))
+col3.metric(f"Krisis ({days} hari)", int(daily["crisis_events"].sum()))
+col4.metric("Purata panjang respons", f"{daily['avg_response_chars'].mean():.0f} aksara")
+
+# ===== CHARTS =====
+st.subheader("Mesej sejam (48 jam)")
+if not hourly.empty:
+    st.bar_chart(hourly.set_index("bucket")[["messages", "crisis_events"]])
+
+left, right = st.columns(2)
+with left:
+    st.subheader("Trend mood harian")
+    st.line_chart(daily.set_index("bucket")["avg_mood"])
+    st.subheader("Krisis harian")
+    st.bar_chart(daily.set_index("bucket")["crisis_events"])
+with right:
+    st.subheader("Model mix")
+    if not models.empty:
+        st.bar_chart(models.pivot_table(index="bucket", columns="model", values="messages", fill_value=0))
+    st.subheader("Panjang respons (aksara)")
+    st.line_chart(daily.set_index("bucket")[["avg_response_chars", "max_response_chars"]])
+
+# ===== FRESHNESS =====
+for source, info in state.items():
+    updated = datetime.fromtimestamp(info["updated_at"], MALAYSIA_TZ).strftime("%d %b %H:%M:%S")
+    st.caption(f"{source}: sehingga id {info['high_water']}, rollup terakhir {updated}")
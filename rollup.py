@@ -0,0 +1,53 @@
+# rollup.py
+
+"""
+Incremental analytics rollups for AYRA (see utils/analytics.py).
+
+    python rollup.py                          # roll up new rows once (cron)
+    python rollup.py --watch 60               # keep rolling up every 60 s
+    python rollup.py --export daily.csv       # roll up, then export daily rollups (.csv / .json)
+    python rollup.py --export hourly.json --grain hour
+
+Reads memory.db read-only and writes analytics.db (AYRA_ANALYTICS_DB);
+the Streamlit page pages/analytics.py only reads analytics.db.
+"""
+
+import argparse
+import json
+import time
+
+from utils.analytics import ANALYTICS_DB, DAY, GRAINS, AnalyticsReader, RollupJob
+from utils.memory_manager import DB_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AYRA analytics rollups")
+    parser.add_argument("--db", default=DB_PATH, help=f"memory database (default {DB_PATH})")
+    parser.add_argument("--out", default=ANALYTICS_DB, help=f"analytics database (default {ANALYTICS_DB})")
+    parser.add_argument("--watch", type=float, default=0, help="repeat every N seconds")
+    parser.add_argument("--export", help="write rollups to a .csv or .json file after rolling up")
+    parser.add_argument("--grain", choices=sorted(GRAINS), default=DAY, help="grain for --export")
+    args = parser.parse_args()
+
+    job = RollupJob(args.db, args.out)
+    try:
+        while True:
+            start = time.perf_counter()
+            counts = job.run_once()
+            print(json.dumps({**counts, "seconds": round(time.perf_counter() - start, 3)}))
+            if not args.watch:
+                break
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        job.close()
+
+    if args.export:
+        reader = AnalyticsReader(args.out)
+        print(f"exported {reader.export(args.export, args.grain)} {args.grain} rows to {args.export}")
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
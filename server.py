@@ -0,0 +1,412 @@
+# server.py
+
+"""
+HTTP/WebSocket API for AYRA (runs alongside the Streamlit UI).
+
+    python server.py --port 8080            # real Gemini (GEMINI_API_KEY)
+    python server.py --port 8080 --stub     # FakeModel, for load tests
+
+Endpoints:
+    POST /v1/session  -> {"session_id"} (a new server-issued id)
+    POST /v1/turn     {"session_id", "message"} -> {"response", "model_used", "crisis"}
+    GET  /v1/stream   WebSocket; send {"session_id", "message"[, "speak": true]},
+                      receive {"type": "chunk", "text"} ... {"type": "done", ...};
+                      with speak, {"type": "audio", "seq", "data": base64 WAV}
+                      per sentence as soon as each is synthesized
+    GET  /v1/voice    WebSocket, ?session_id=&rate=16000&channels=1; send binary
+                      PCM16 chunks (then {"type": "end"}), receive
+                      {"type": "speech_start" | "partial" | "final", ...} and
+                      the turn's chunk/done events after each final transcript
+    GET  /healthz     liveness + load
+    GET  /metrics     Prometheus text (utils.tracing)
+
+Each worker process owns one ConversationEngine. Turns for the same
+session are serialised; total in-flight turns are capped and extra
+requests wait in a bounded queue, beyond which the server answers 503.
+
+A session_id is the user's identity (memory, /cari, stories, badges).
+With AYRA_SESSION_SECRET set, only ids issued by POST /v1/session are
+accepted (HMAC-signed, so another user's id cannot be guessed or forged).
+Without it any client-chosen id is trusted: run it on a trusted network
+only (e.g. behind your own backend), never exposed directly to browsers.
+
+With AYRA_ROLLUP_INTERVAL > 0 the server also runs the analytics rollup
+job (utils/analytics.py) on its own thread, outside the turn executor.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from aiohttp import web, WSMsgType
+from dotenv import load_dotenv
+
+from utils.analytics import RollupJob
+from utils.engine import ConversationEngine, Session
+from utils.location import weather
+from utils.tracing import tracer
+from utils.tts import SpeechStream, default_tts
+from utils.voice import SAMPLE_RATE, VoiceStream, get_stt_backend
+
+MAX_MESSAGE_CHARS = 4000
+MAX_AUDIO_CHUNK = 256 * 1024  # bait setiap mesej binary (~8s audio 16 kHz mono)
+MAX_INFLIGHT = 64
+MAX_WAITING = 256
+MAX_SESSIONS = 10_000
+SESSION_IDLE_TTL = 3600  # saat
+ROLLUP_INTERVAL = float(os.getenv("AYRA_ROLLUP_INTERVAL", "0"))  # saat; 0 = guna rollup.py (cron)
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Backpressure:
+    """Cap concurrent turns; reject instead of queueing without bound"""
+
+    def __init__(self, max_inflight=MAX_INFLIGHT, max_waiting=MAX_WAITING):
+        self._semaphore = asyncio.Semaphore(max_inflight)
+        self.max_inflight = max_inflight
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self.inflight = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            tracer.incr("api_rejected")
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self._semaphore.release()
+
+
+class SessionStore:
+    """LRU of live sessions with idle expiry; one lock per session"""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_ttl=SESSION_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        entry = self._sessions.get(session_id)
+        if entry is None or now - entry["last_seen"] > self.idle_ttl:
+            entry = {"session": Session(user_id=session_id), "lock": asyncio.Lock(), "last_seen": now}
+            self._sessions[session_id] = entry
+        entry["last_seen"] = now
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return entry
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+# -------------------------------------------------------------------
+# Session ids
+# -------------------------------------------------------------------
+def _sign(uid, secret):
+    return hmac.new(secret.encode(), uid.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def _session_secret():
+    # Dibaca setiap kali (bukan masa import) supaya nilai dari .env (load_dotenv dalam main) dipakai.
+    # Kosong = trusted network, session_id tak disemak
+    return os.getenv("AYRA_SESSION_SECRET", "")
+
+
+def issue_session_id(secret=None):
+    """New random id; '<uid>.<hmac>' when a secret is configured"""
+    secret = _session_secret() if secret is None else secret
+    uid = uuid.uuid4().hex
+    return f"{uid}.{_sign(uid, secret)}" if secret else uid
+
+
+def verify_session_id(session_id, secret=None):
+    """The user id behind session_id, or raise 401 if it was not issued by this server"""
+    secret = _session_secret() if secret is None else secret
+    if not secret:
+        return session_id
+    uid, _, signature = session_id.partition(".")
+    if not uid or not hmac.compare_digest(signature, _sign(uid, secret)):
+        raise web.HTTPUnauthorized(text="invalid session_id; get one from POST /v1/session")
+    return uid
+
+
+# -------------------------------------------------------------------
+# Handlers
+# -------------------------------------------------------------------
+def _parse_turn(payload):
+    session_id = str(payload.get("session_id") or "").strip()
+    message = str(payload.get("message") or "").strip()
+    if not session_id or not message:
+        raise web.HTTPBadRequest(text="session_id and message are required")
+    if len(message) > MAX_MESSAGE_CHARS:
+        raise web.HTTPRequestEntityTooLarge(max_size=MAX_MESSAGE_CHARS, actual_size=len(message))
+    return verify_session_id(session_id), message
+
+
+async def handle_session(request):
+    return web.json_response({"session_id": issue_session_id()})
+
+
+async def handle_turn(request):
+    app = request.app
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="invalid JSON")
+    session_id, message = _parse_turn(payload)
+
+    entry = app["sessions"].get(session_id)
+    try:
+        # Session lock first, so one chatty session can't hold many slots
+        async with entry["lock"]:
+            async with app["backpressure"].slot():
+                result = await app["engine"].ahandle_turn(entry["session"], message)
+    except Overloaded:
+        return web.json_response({"error": "overloaded"}, status=503, headers={"Retry-After": "1"})
+    return web.json_response(result)
+
+
+async def handle_stream(request):
+    app = request.app
+    ws = web.WebSocketResponse(heartbeat=30, max_msg_size=MAX_MESSAGE_CHARS * 4)
+    await ws.prepare(request)
+
+    async for msg in ws:
+        if msg.type != WSMsgType.TEXT:
+            continue
+        try:
+            payload = json.loads(msg.data)
+            session_id, message = _parse_turn(payload)
+        except (json.JSONDecodeError, AttributeError, web.HTTPException) as e:
+            await ws.send_json({"type": "error", "error": getattr(e, "text", None) or "invalid request"})
+            continue
+
+        entry = app["sessions"].get(session_id)
+        speech = SpeechStream(app["tts"]) if payload.get("speak") else None
+        try:
+            async with entry["lock"]:
+                async with app["backpressure"].slot():
+                    seq = 0
+                    async for event in app["engine"].astream_turn(entry["session"], message):
+                        await ws.send_json(event)
+                        if speech is None:
+                            continue
+                        if event["type"] == "chunk":
+                            # Ayat yang dah lengkap mula disintesis sementara model masih menulis
+                            speech.push(event["text"])
+                            clips = list(speech.ready())
+                        elif event["type"] == "done":
+                            clips = await asyncio.get_running_loop().run_in_executor(
+                                None, lambda: list(speech.finish())
+                            )
+                        else:
+                            clips = []
+                        for clip in clips:
+                            await ws.send_json({"type": "audio", "seq": seq, "format": "wav",
+                                                "data": base64.b64encode(clip).decode()})
+                            seq += 1
+        except Overloaded:
+            await ws.send_json({"type": "error", "error": "overloaded"})
+    return ws
+
+
+async def handle_voice(request):
+    app = request.app
+    session_id = request.query.get("session_id", "").strip()
+    try:
+        rate = int(request.query.get("rate", SAMPLE_RATE))
+        channels = int(request.query.get("channels", 1))
+    except ValueError:
+        raise web.HTTPBadRequest(text="rate and channels must be integers")
+    if not session_id or not 8000 <= rate <= 96000 or channels not in (1, 2):
+        raise web.HTTPBadRequest(text="session_id, rate (8000-96000) and channels (1-2) are required")
+    session_id = verify_session_id(session_id)
+
+    ws = web.WebSocketResponse(heartbeat=30, max_msg_size=MAX_AUDIO_CHUNK)
+    await ws.prepare(request)
+    loop = asyncio.get_running_loop()
+    stream = VoiceStream(app["stt"], rate, channels)
+    ended = False
+    async for msg in ws:
+        if msg.type == WSMsgType.BINARY:
+            events = await loop.run_in_executor(None, stream.feed, msg.data)
+        elif msg.type == WSMsgType.TEXT and _is_end(msg.data):
+            ended = True
+            events = await loop.run_in_executor(None, stream.close)
+        else:
+            continue
+        for event in events:
+            await _send_voice_event(app, ws, session_id, event)
+        if ended:
+            break
+    if not ended:
+        stream.close()
+    await ws.close()
+    return ws
+
+
+def _is_end(data):
+    try:
+        return json.loads(data).get("type") == "end"
+    except (json.JSONDecodeError, AttributeError):
+        return False
+
+
+async def _send_voice_event(app, ws, session_id, event):
+    speech_end = event.pop("speech_end", None)
+    await ws.send_json(event)
+    if event["type"] != "final" or not event["text"]:
+        return
+    entry = app["sessions"].get(session_id)
+    try:
+        async with entry["lock"]:
+            async with app["backpressure"].slot():
+                eos_ms = None  # kekal None kalau model tak pulangkan apa-apa chunk
+                async for reply in app["engine"].astream_turn(entry["session"], event["text"]):
+                    if eos_ms is None and reply["type"] == "chunk":
+                        eos_ms = (time.perf_counter() - speech_end) * 1000
+                        tracer.record("voice.eos_to_first_token", eos_ms)
+                    if reply["type"] == "done":
+                        reply = {**reply, "eos_latency_ms": eos_ms}
+                    await ws.send_json(reply)
+    except Overloaded:
+        await ws.send_json({"type": "error", "error": "overloaded"})
+
+
+async def handle_health(request):
+    app = request.app
+    backpressure = app["backpressure"]
+    return web.json_response({
+        "status": "ok",
+        "sessions": len(app["sessions"]),
+        "inflight": backpressure.inflight,
+        "waiting": backpressure.waiting,
+        "rejected": backpressure.rejected,
+        "llm": app["engine"].router.governor.state(),
+        "coalescing": app["engine"].router.singleflight.get_stats(),
+        "prefetch": app["engine"].prefetcher.get_stats(),
+        "dedup": app["engine"].memory.get_dedup_stats(),
+        "tts_cache": app["tts"].cache.get_stats(),
+        "weather": weather.get_stats(),
+    })
+
+
+async def handle_metrics(request):
+    return web.Response(text=tracer.export_prometheus(), content_type="text/plain")
+
+
+# -------------------------------------------------------------------
+# App factory
+# -------------------------------------------------------------------
+def create_app(engine=None, max_inflight=MAX_INFLIGHT, max_waiting=MAX_WAITING):
+    app = web.Application(client_max_size=64 * 1024)
+    app["engine_factory"] = (lambda: engine) if engine else ConversationEngine
+    app["max_inflight"] = max_inflight
+    app["max_waiting"] = max_waiting
+    app["sessions"] = SessionStore()
+    app.on_startup.append(_on_startup)
+    app.on_cleanup.append(_on_cleanup)
+    app.router.add_post("/v1/session", handle_session)
+    app.router.add_post("/v1/turn", handle_turn)
+    app.router.add_get("/v1/stream", handle_stream)
+    app.router.add_get("/v1/voice", handle_voice)
+    app.router.add_get("/healthz", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+async def _on_startup(app):
+    # Blocking model/SQLite work runs here; size it to the in-flight cap
+    app["executor"] = ThreadPoolExecutor(max_workers=app["max_inflight"], thread_name_prefix="ayra-turn")
+    asyncio.get_running_loop().set_default_executor(app["executor"])
+    app["engine"] = app["engine_factory"]()
+    app["stt"] = get_stt_backend()
+    app["tts"] = default_tts()
+    app["backpressure"] = Backpressure(app["max_inflight"], app["max_waiting"])
+    if ROLLUP_INTERVAL > 0:
+        app["rollup_task"] = asyncio.create_task(_rollup_loop(app["engine"].memory.db_path))
+
+
+async def _rollup_loop(db_path):
+    # Satu thread khas: sambungan SQLite job kekal dalam thread yang sama, worker turn tak terganggu
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ayra-rollup")
+    job = await loop.run_in_executor(executor, RollupJob, db_path)
+    try:
+        while True:
+            try:
+                await loop.run_in_executor(executor, job.run_once)
+            except Exception:
+                tracer.incr("analytics_rollup_failed")
+            await asyncio.sleep(ROLLUP_INTERVAL)
+    finally:
+        executor.submit(job.close)
+        executor.shutdown(wait=False)
+
+
+async def _on_cleanup(app):
+    if "rollup_task" in app:
+        app["rollup_task"].cancel()
+    app["executor"].shutdown(wait=False)
+
+
+def build_stub_engine(latency_ms=200.0, tokens_per_sec=50.0, db_path=None):
+    """Engine backed by FakeModel and a throwaway database (load tests)"""
+    import tempfile
+    from utils.fake_model import FakeModel
+    from utils.memory_manager import MemoryManager
+    from utils.model_router import ModelRouter
+    from utils.llm_governor import LLMGovernor
+    from utils.rate_limiter import FatigueEngine, RateLimiter
+
+    db_path = db_path or os.path.join(tempfile.mkdtemp(prefix="ayra-stub-"), "memory.db")
+    # Tiada quota sebenar untuk dilindungi, jadi budget & global bucket dibuka luas
+    governor = LLMGovernor(max_concurrent=MAX_INFLIGHT, rpm=10**9, tpm=10**12)
+    router = ModelRouter(model=FakeModel(latency_ms=latency_ms, tokens_per_sec=tokens_per_sec), governor=governor)
+    fatigue = FatigueEngine(RateLimiter(db_path, global_rpm=1_000_000))
+    return ConversationEngine(memory=MemoryManager(db_path=db_path), router=router, fatigue=fatigue)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AYRA API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-inflight", type=int, default=MAX_INFLIGHT)
+    parser.add_argument("--max-waiting", type=int, default=MAX_WAITING)
+    parser.add_argument("--stub", action="store_true", help="use FakeModel instead of Gemini")
+    parser.add_argument("--stub-latency-ms", type=float, default=200.0)
+    parser.add_argument("--stub-tokens-per-sec", type=float, default=50.0)
+    args = parser.parse_args()
+
+    load_dotenv()
+    engine = build_stub_engine(args.stub_latency_ms, args.stub_tokens_per_sec) if args.stub else None
+    web.run_app(create_app(engine, args.max_inflight, args.max_waiting), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
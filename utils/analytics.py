@@ -0,0 +1,266 @@
+# utils/analytics.py
+
+"""
+Operational analytics from hourly and daily rollups.
+RollupJob reads new conversations and crisis_log rows past a high-water
+mark (by id) from memory.db through its own read-only connection, in
+small batches. It adds them to aggregate tables in a separate analytics
+database. Each batch and its new high-water mark commit together, so a
+row is never counted twice and a crashed run resumes where it stopped.
+memory.db runs in WAL mode, so these reads never block chat writes, and
+dashboards only ever open analytics.db.
+
+Buckets are Malaysia local time ("2026-10-19T22" / "2026-10-19"). A
+merged near-duplicate (repeat_count) is counted once, when it is first
+stored.
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import time
+
+from .tracing import tracer
+
+ANALYTICS_DB = os.getenv("AYRA_ANALYTICS_DB", "analytics.db")
+ROLLUP_BATCH = 2000
+HOUR, DAY = "hour", "day"
+GRAINS = {HOUR: 13, DAY: 10}  # panjang prefix timestamp ISO untuk setiap grain
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        source TEXT PRIMARY KEY,
+        high_water INTEGER NOT NULL,
+        updated_at REAL
+    );
+    CREATE TABLE IF NOT EXISTS rollups (
+        grain TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        messages INTEGER DEFAULT 0,
+        mood_sum REAL DEFAULT 0,
+        response_chars INTEGER DEFAULT 0,
+        response_chars_max INTEGER DEFAULT 0,
+        crisis_events INTEGER DEFAULT 0,
+        PRIMARY KEY (grain, bucket)
+    );
+    CREATE TABLE IF NOT EXISTS rollup_models (
+        grain TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        model TEXT NOT NULL,
+        messages INTEGER DEFAULT 0,
+        PRIMARY KEY (grain, bucket, model)
+    );
+    CREATE TABLE IF NOT EXISTS rollup_users (
+        grain TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        PRIMARY KEY (grain, bucket, user_id)
+    );
+"""
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+class RollupJob:
+    def __init__(self, db_path, analytics_path=ANALYTICS_DB, batch_size=ROLLUP_BATCH):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.out = _connect(analytics_path)
+        self._source = None
+
+    def _src(self):
+        if self._source is None:
+            self._source = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=30)
+        return self._source
+
+    def _high_water(self, source):
+        row = self.out.execute("SELECT high_water FROM rollup_state WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else 0
+
+    def run_once(self):
+        """Roll up everything new since the last run. Returns {"conversations": n, "crisis_log": n}"""
+        start = time.perf_counter()
+        counts = {"conversations": self._drain("conversations", self._conversation_batch),
+                  "crisis_log": self._drain("crisis_log", self._crisis_batch)}
+        tracer.record("analytics.rollup", (time.perf_counter() - start) * 1000, rows=sum(counts.values()))
+        return counts
+
+    def _drain(self, source, apply_batch):
+        total = 0
+        while True:
+            try:
+                rows = apply_batch(self._high_water(source))
+            except sqlite3.OperationalError as e:
+                if "no such table" in str(e):  # crisis_log baru dicipta pada krisis pertama
+                    return total
+                raise
+            if not rows:
+                return total
+            total += rows
+            if rows < self.batch_size:
+                return total
+
+    def _conversation_batch(self, after):
+        rows = self._src().execute(
+            "SELECT id, timestamp, mood_score, model_used, user_id, length(ayra_response) FROM conversations "
+            "WHERE id > ? ORDER BY id LIMIT ?", (after, self.batch_size)
+        ).fetchall()
+        if not rows:
+            return 0
+        totals, models, users = {}, {}, set()
+        for _, timestamp, mood, model, user_id, chars in rows:
+            if not timestamp:
+                continue
+            for grain, width in GRAINS.items():
+                key = (grain, timestamp[:width])
+                entry = totals.setdefault(key, [0, 0.0, 0, 0])
+                entry[0] += 1
+                entry[1] += mood or 0.0
+                entry[2] += chars or 0
+                entry[3] = max(entry[3], chars or 0)
+                models[(*key, model or "unknown")] = models.get((*key, model or "unknown"), 0) + 1
+                users.add((*key, user_id or "default"))
+        with self.out:
+            self.out.executemany("""
+                INSERT INTO rollups (grain, bucket, messages, mood_sum, response_chars, response_chars_max)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (grain, bucket) DO UPDATE SET
+                    messages = messages + excluded.messages,
+                    mood_sum = mood_sum + excluded.mood_sum,
+                    response_chars = response_chars + excluded.response_chars,
+                    response_chars_max = MAX(response_chars_max, excluded.response_chars_max)
+            """, [(*key, *values) for key, values in totals.items()])
+            self.out.executemany("""
+                INSERT INTO rollup_models (grain, bucket, model, messages) VALUES (?, ?, ?, ?)
+                ON CONFLICT (grain, bucket, model) DO UPDATE SET messages = messages + excluded.messages
+            """, [(*key, n) for key, n in models.items()])
+            self.out.executemany("INSERT OR IGNORE INTO rollup_users VALUES (?, ?, ?)", users)
+            self._advance("conversations", rows[-1][0])
+        return len(rows)
+
+    def _crisis_batch(self, after):
+        rows = self._src().execute(
+            "SELECT id, timestamp FROM crisis_log WHERE id > ? ORDER BY id LIMIT ?", (after, self.batch_size)
+        ).fetchall()
+        if not rows:
+            return 0
+        events = {}
+        for _, timestamp in rows:
+            for grain, width in GRAINS.items():
+                if timestamp:
+                    events[(grain, timestamp[:width])] = events.get((grain, timestamp[:width]), 0) + 1
+        with self.out:
+            self.out.executemany("""
+                INSERT INTO rollups (grain, bucket, crisis_events) VALUES (?, ?, ?)
+                ON CONFLICT (grain, bucket) DO UPDATE SET crisis_events = crisis_events + excluded.crisis_events
+            """, [(*key, n) for key, n in events.items()])
+            self._advance("crisis_log", rows[-1][0])
+        return len(rows)
+
+    def _advance(self, source, high_water):
+        self.out.execute(
+            "INSERT INTO rollup_state (source, high_water, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (source) DO UPDATE SET high_water = excluded.high_water, updated_at = excluded.updated_at",
+            (source, high_water, time.time())
+        )
+
+    def close(self):
+        if self._source is not None:
+            self._source.close()
+        self.out.close()
+
+
+# ===== READERS (dashboard, export) =====
+class AnalyticsReader:
+    """Read-only view over analytics.db; never touches memory.db"""
+
+    def __init__(self, analytics_path=ANALYTICS_DB):
+        self.conn = sqlite3.connect(f"file:{analytics_path}?mode=ro", uri=True, check_same_thread=False)
+
+    def series(self, grain=HOUR, since=""):
+        """[{bucket, messages, active_users, avg_mood, avg_response_chars, max_response_chars, crisis_events}]"""
+        rows = self.conn.execute("""
+            SELECT r.bucket, r.messages, COUNT(u.user_id), r.mood_sum, r.response_chars, r.response_chars_max,
+                   r.crisis_events
+            FROM rollups r LEFT JOIN rollup_users u ON u.grain = r.grain AND u.bucket = r.bucket
+            WHERE r.grain = ? AND r.bucket >= ?
+            GROUP BY r.bucket ORDER BY r.bucket
+        """, (grain, since)).fetchall()
+        return [{"bucket": bucket, "messages": messages, "active_users": users,
+                 "avg_mood": mood_sum / messages if messages else None,
+                 "avg_response_chars": chars / messages if messages else None,
+                 "max_response_chars": max_chars, "crisis_events": crisis}
+                for bucket, messages, users, mood_sum, chars, max_chars, crisis in rows]
+
+    def model_mix(self, grain=DAY, since=""):
+        """[{bucket, model, messages}]"""
+        return [{"bucket": bucket, "model": model, "messages": n} for bucket, model, n in self.conn.execute(
+            "SELECT bucket, model, messages FROM rollup_models WHERE grain = ? AND bucket >= ? ORDER BY bucket, model",
+            (grain, since)
+        )]
+
+    def state(self):
+        """{source: {"high_water", "updated_at"}}"""
+        return {source: {"high_water": hw, "updated_at": updated_at} for source, hw, updated_at in
+                self.conn.execute("SELECT source, high_water, updated_at FROM rollup_state")}
+
+    def export(self, path, grain=DAY):
+        """Write the series (plus model mix columns) as CSV, or JSON if path ends with .json"""
+        rows = self.series(grain)
+        models = {}
+        for entry in self.model_mix(grain):
+            models.setdefault(entry["bucket"], {})[f"model:{entry['model']}"] = entry["messages"]
+        rows = [{**row, **models.get(row["bucket"], {})} for row in rows]
+        if path.endswith(".json"):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(rows, f, ensure_ascii=False, indent=1)
+            return len(rows)
+        columns = list(dict.fromkeys(key for row in rows for key in row)) or ["bucket"]
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+        return len(rows)
+
+    def close(self):
+        self.conn.close()
+
+
+# For testing
+if __name__ == "__main__":
+    import random
+    import tempfile
+    from datetime import datetime, timedelta
+
+    from .memory_manager import MALAYSIA_TZ, MemoryManager
+
+    workdir = tempfile.mkdtemp(prefix="ayra-analytics-")
+    memory = MemoryManager(os.path.join(workdir, "memory.db"))
+    random.seed(1)
+    base = datetime.now(MALAYSIA_TZ) - timedelta(days=14)
+    rows = [((base + timedelta(minutes=i)).isoformat(), f"mesej {i}", "balas " * random.randint(5, 80),
+             random.uniform(-1, 1), random.choice(["Gemini", "Gemini (Ayra)", "Fatigue"]), f"u{i % 9}")
+            for i in range(20000)]
+    memory.conn.executemany("INSERT INTO conversations (timestamp, user_message, ayra_response, mood_score, "
+                            "model_used, user_id) VALUES (?, ?, ?, ?, ?, ?)", rows)
+    memory.conn.commit()
+    memory.log_crisis_event("test", "putus asa")
+
+    job = RollupJob(memory.db_path, os.path.join(workdir, "analytics.db"))
+    for label in ("first run", "incremental (nothing new)"):
+        start = time.perf_counter()
+        counts = job.run_once()
+        print(f"{label:26s} {counts} in {(time.perf_counter() - start) * 1000:.0f} ms")
+    reader = AnalyticsReader(os.path.join(workdir, "analytics.db"))
+    start = time.perf_counter()
+    daily = reader.series(DAY)
+    print(f"dashboard read: {(time.perf_counter() - start) * 1000:.1f} ms")
+    for row in daily[-3:]:
+        print(row)
+    print(reader.model_mix(DAY)[-3:])
@@ -0,0 +1,296 @@
+# utils/calendar_service.py
+
+"""
+Malaysian calendar for greetings, UI themes and prompts.
+Each year is turned once into a sorted table of boundaries: prayer times
+(computed for KL with JAKIM angles), fixed day parts, Ramadan sahur and
+berbuka windows, with the public holiday and Ramadan flag of every day.
+"What period is it" is a bisect on that table, and the answer is kept
+until the next boundary, so a rerun usually costs one comparison.
+context() gives the per-rerun CalendarContext shared by the greeting, the
+theme and the prompt.
+Lunar dates (Ramadan, Raya, CNY, Wesak, Deepavali...) after 2026 are
+astronomical estimates; update the tables when the official dates are
+announced.
+"""
+
+import math
+import threading
+import time
+from bisect import bisect_right
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+
+from .tracing import tracer
+
+MALAYSIA_TZ = timezone(timedelta(hours=8))  # tiada DST, tak perlu pytz
+LATITUDE, LONGITUDE = 3.1390, 101.6869  # Kuala Lumpur (zon WLY01)
+FAJR_ANGLE, ISHA_ANGLE = 20.0, 18.0  # parameter JAKIM
+IHTIYATI_MIN = 2  # minit ihtiyati ditambah pada waktu solat
+IMSAK_MIN = 10  # imsak = subuh - 10 minit
+
+# (1 Ramadan, 1 Syawal) di Malaysia
+RAMADAN = (
+    ("2024-03-12", "2024-04-10"),
+    ("2025-03-02", "2025-03-31"),
+    ("2026-02-19", "2026-03-21"),
+    ("2027-02-08", "2027-03-10"),
+    ("2028-01-28", "2028-02-27"),
+    ("2029-01-16", "2029-02-15"),
+    ("2030-01-06", "2030-02-05"),
+    ("2030-12-26", "2031-01-25"),
+)
+# Cuti umum kebangsaan bertarikh lunar; Aidilfitri diambil dari RAMADAN
+LUNAR_HOLIDAYS = {
+    "Tahun Baru Cina": ("2024-02-10", "2025-01-29", "2026-02-17", "2027-02-06", "2028-01-26", "2029-02-13",
+                        "2030-02-03"),
+    "Hari Wesak": ("2024-05-22", "2025-05-12", "2026-05-31", "2027-05-20", "2028-05-09", "2029-05-27",
+                   "2030-05-16"),
+    "Hari Raya Aidiladha": ("2024-06-17", "2025-06-07", "2026-05-27", "2027-05-17", "2028-05-06", "2029-04-25",
+                            "2030-04-14"),
+    "Awal Muharram": ("2024-07-07", "2025-06-27", "2026-06-17", "2027-06-06", "2028-05-26", "2029-05-15",
+                      "2030-05-05"),
+    "Maulidur Rasul": ("2024-09-16", "2025-09-05", "2026-08-25", "2027-08-15", "2028-08-03", "2029-07-24",
+                       "2030-07-13"),
+    "Deepavali": ("2024-10-31", "2025-10-20", "2026-11-08", "2027-10-29", "2028-10-17", "2029-11-05",
+                  "2030-10-26"),
+}
+FIXED_HOLIDAYS = {
+    (5, 1): "Hari Pekerja",
+    (8, 31): "Hari Kebangsaan",
+    (9, 16): "Hari Malaysia",
+    (12, 25): "Hari Krismas",
+}
+
+# Bahagian hari, ikut urutan; sahur_akhir dan berbuka hanya dalam Ramadan
+SLOT_LABELS = {
+    "dinihari": "dinihari",
+    "sahur_akhir": "hujung waktu sahur",
+    "subuh": "waktu subuh",
+    "pagi": "pagi",
+    "tengah_hari": "tengah hari",
+    "petang": "petang",
+    "senja": "senja, dah nak maghrib",
+    "berbuka": "dah nak berbuka puasa",
+    "maghrib": "waktu maghrib",
+    "malam": "malam",
+    "lewat_malam": "lewat malam",
+}
+DAYS = ("Isnin", "Selasa", "Rabu", "Khamis", "Jumaat", "Sabtu", "Ahad")
+MONTHS = ("Januari", "Februari", "Mac", "April", "Mei", "Jun", "Julai", "Ogos", "September", "Oktober",
+          "November", "Disember")
+
+
+# ===== PRAYER TIMES =====
+def _sun(jd):
+    """(declination in degrees, equation of time in hours) for a Julian day"""
+    d = jd - 2451545.0
+    g = math.radians((357.529 + 0.98560028 * d) % 360)
+    q = (280.459 + 0.98564736 * d) % 360
+    lam = math.radians((q + 1.915 * math.sin(g) + 0.020 * math.sin(2 * g)) % 360)
+    e = math.radians(23.439 - 0.00000036 * d)
+    ra = math.degrees(math.atan2(math.cos(e) * math.sin(lam), math.cos(lam))) / 15
+    eqt = q / 15 - ra % 24
+    eqt = (eqt + 12) % 24 - 12
+    return math.degrees(math.asin(math.sin(e) * math.sin(lam))), eqt
+
+
+def prayer_times(day, lat=LATITUDE, lon=LONGITUDE):
+    """Local (UTC+8) prayer times for one day: imsak, subuh, syuruk, zohor, asar, maghrib, isyak"""
+    jd = day.toordinal() + 1721424.5 - lon / 360
+    decl, eqt = _sun(jd + 0.5)
+    noon = 12 - eqt - lon / 15 + 8
+    phi, delta = math.radians(lat), math.radians(decl)
+
+    def hour_angle(altitude):
+        cos_t = (math.sin(math.radians(altitude)) - math.sin(phi) * math.sin(delta)) / (math.cos(phi) * math.cos(delta))
+        return math.degrees(math.acos(max(-1.0, min(1.0, cos_t)))) / 15
+
+    asr_altitude = math.degrees(math.atan(1 / (1 + math.tan(abs(phi - delta)))))  # bayang = 1x (Syafie)
+    hours = {
+        "subuh": noon - hour_angle(-FAJR_ANGLE),
+        "syuruk": noon - hour_angle(-0.833),
+        "zohor": noon,
+        "asar": noon + hour_angle(asr_altitude),
+        "maghrib": noon + hour_angle(-0.833),
+        "isyak": noon + hour_angle(-ISHA_ANGLE),
+    }
+    midnight = datetime(day.year, day.month, day.day, tzinfo=MALAYSIA_TZ)
+    times = {name: midnight + timedelta(hours=h, minutes=0 if name == "syuruk" else IHTIYATI_MIN)
+             for name, h in hours.items()}
+    times["imsak"] = times["subuh"] - timedelta(minutes=IMSAK_MIN)
+    return times
+
+
+# ===== TABLES =====
+def _day(text):
+    return date.fromisoformat(text)
+
+
+@lru_cache(maxsize=None)
+def _day_flags():
+    """date -> (holiday name or None, in Ramadan) for every special day in the tables"""
+    holidays = {}
+    for name, days in LUNAR_HOLIDAYS.items():
+        for text in days:
+            holidays[_day(text)] = name
+            if name == "Tahun Baru Cina":
+                holidays[_day(text) + timedelta(days=1)] = "Tahun Baru Cina (hari kedua)"
+    ramadan = set()
+    for start, syawal in RAMADAN:
+        start, syawal = _day(start), _day(syawal)
+        ramadan.update(start + timedelta(days=i) for i in range((syawal - start).days))
+        holidays[syawal] = holidays[syawal + timedelta(days=1)] = "Hari Raya Aidilfitri"
+    return holidays, frozenset(ramadan)
+
+
+def holiday_on(day):
+    """Public holiday name for a date, or None"""
+    if (day.month, day.day) in FIXED_HOLIDAYS:
+        return FIXED_HOLIDAYS[(day.month, day.day)]
+    if day.month == 6 and day.weekday() == 0 and day.day <= 7:
+        return "Hari Keputeraan Agong"  # Isnin pertama bulan Jun
+    return _day_flags()[0].get(day)
+
+
+def is_ramadan(day):
+    return day in _day_flags()[1]
+
+
+def _day_boundaries(day):
+    """[(datetime, slot)] for one day, sorted"""
+    times = prayer_times(day)
+    midnight = datetime(day.year, day.month, day.day, tzinfo=MALAYSIA_TZ)
+    bounds = [
+        (midnight, "dinihari"),
+        (times["subuh"], "subuh"),
+        (times["syuruk"], "pagi"),
+        (midnight + timedelta(hours=11), "tengah_hari"),
+        (midnight + timedelta(hours=14), "petang"),
+        (times["maghrib"] - timedelta(minutes=90), "senja"),
+        (times["maghrib"], "maghrib"),
+        (times["isyak"], "malam"),
+        (midnight + timedelta(hours=23), "lewat_malam"),
+    ]
+    if is_ramadan(day):
+        bounds += [(times["imsak"] - timedelta(minutes=45), "sahur_akhir"),
+                   (times["maghrib"] - timedelta(minutes=60), "berbuka")]
+    return sorted(bounds)
+
+
+@lru_cache(maxsize=4)
+def _year_table(year):
+    """(sorted boundary timestamps, [(slot, date)]) for a whole year, built once"""
+    start = time.perf_counter()
+    stamps, entries = [], []
+    day = date(year, 1, 1)
+    while day.year == year:
+        for moment, slot in _day_boundaries(day):
+            stamps.append(moment.timestamp())
+            entries.append((slot, day))
+        day += timedelta(days=1)
+    tracer.record("calendar.build_year", (time.perf_counter() - start) * 1000, boundaries=len(stamps))
+    return stamps, entries
+
+
+# ===== LOOKUP =====
+class Period:
+    """One stretch between two boundaries: what the greeting, theme and prompt need"""
+    __slots__ = ("slot", "day", "start", "end", "holiday", "ramadan", "prompt_hint")
+
+    def __init__(self, slot, day, start, end):
+        self.slot = slot
+        self.day = day
+        self.start = start
+        self.end = end
+        self.holiday = holiday_on(day)
+        self.ramadan = is_ramadan(day)
+        hint = (f"Waktu sekarang di Malaysia: {SLOT_LABELS[slot]}, "
+                f"{DAYS[day.weekday()]} {day.day} {MONTHS[day.month - 1]} {day.year}")
+        if self.holiday:
+            hint += f", cuti umum {self.holiday}"
+        if self.ramadan:
+            hint += ", bulan Ramadan (user mungkin berpuasa)"
+        self.prompt_hint = hint + "."
+
+
+def lookup(timestamp):
+    """Period containing a Unix timestamp (O(log n) bisect in the year's table)"""
+    year = datetime.fromtimestamp(timestamp, MALAYSIA_TZ).year
+    stamps, entries = _year_table(year)
+    i = bisect_right(stamps, timestamp) - 1
+    end = stamps[i + 1] if i + 1 < len(stamps) else datetime(year + 1, 1, 1, tzinfo=MALAYSIA_TZ).timestamp()
+    slot, day = entries[i]
+    return Period(slot, day, stamps[i], end)
+
+
+_current = None
+_current_lock = threading.Lock()
+
+
+def current_period(timestamp=None):
+    """Period for now (or timestamp), reused until its end boundary"""
+    global _current
+    timestamp = time.time() if timestamp is None else timestamp
+    period = _current
+    if period is not None and period.start <= timestamp < period.end:
+        return period
+    with _current_lock:
+        period = lookup(timestamp)
+        _current = period
+    tracer.incr("calendar_period_change")
+    return period
+
+
+class CalendarContext:
+    """Per-rerun view: the current moment plus its (shared, cached) Period"""
+    __slots__ = ("now", "period")
+
+    def __init__(self, now, period):
+        self.now = now
+        self.period = period
+
+    @property
+    def slot(self):
+        return self.period.slot
+
+    @property
+    def ramadan(self):
+        return self.period.ramadan
+
+    @property
+    def holiday(self):
+        return self.period.holiday
+
+    @property
+    def prompt_hint(self):
+        return self.period.prompt_hint
+
+    @property
+    def time_label(self):
+        return self.now.strftime("%I:%M %p")
+
+
+def context(now=None):
+    """CalendarContext for now (or an aware datetime)"""
+    now = now or datetime.now(MALAYSIA_TZ)
+    return CalendarContext(now.astimezone(MALAYSIA_TZ), current_period(now.timestamp()))
+
+
+# For testing
+if __name__ == "__main__":
+    import timeit
+
+    for name, moment in prayer_times(date(2026, 10, 19)).items():
+        print(f"{name:8s} {moment:%H:%M}")
+    for text in ("2026-03-10T05:20", "2026-03-10T18:40", "2026-08-31T09:00", "2026-10-19T22:31"):
+        ctx = context(datetime.fromisoformat(text).replace(tzinfo=MALAYSIA_TZ))
+        print(f"{text}  {ctx.slot:12s} until {datetime.fromtimestamp(ctx.period.end, MALAYSIA_TZ):%H:%M}  "
+              f"{ctx.prompt_hint}")
+    start = time.perf_counter()
+    for year in range(2024, 2031):
+        _year_table(year)
+    print(f"build 2024-2030: {(time.perf_counter() - start) * 1000:.0f} ms")
+    stamp = time.time()
+    print(f"lookup (bisect): {timeit.timeit(lambda: lookup(stamp), number=20000) / 20000 * 1e6:.1f} us")
+    print(f"context (cached): {timeit.timeit(context, number=20000) / 20000 * 1e6:.1f} us")
@@ -7,16 +7,25 @@ import time
 import random
 import json
 
+from .embeddings import ChromaDefaultEmbedder, EmbeddingService
+from .fact_extractor import IMPORTANT_CATEGORIES
+from .language import detect_language
+
 class ChromaVault:
     """
     Digital memory for AYRA using ChromaDB.
     Stores conversations with metadata for semantic search.
     """
     
-    def __init__(self, collection_name="ayra_memories", persist_directory="./chroma_db"):
+    def __init__(self, collection_name="ayra_memories", persist_directory="./chroma_db", embedder=None):
         self.persist_directory = persist_directory
         os.makedirs(persist_directory, exist_ok=True)
         
+        # Embedding dikira sendiri (cache + batch); model sama dengan default Chroma
+        self.embedder = embedder or EmbeddingService(
+            ChromaDefaultEmbedder(), cache_path=os.path.join(persist_directory, "embeddings.db")
+        )
+        
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(path=persist_directory)
         
@@ -31,21 +40,14 @@ class ChromaVault:
             )
             print(f"✅ Created new collection: {collection_name}")
         
-        # Categories for important memories
-        self.important_categories = {
-            'personal': ['suka', 'minat', 'gemar', 'nama', 'birthday', 'hari jadi'],
-            'food': ['teh', 'kopi', 'makan', 'minum', 'nasi', 'lauk', 'roti'],
-            'emotion': ['sedih', 'gembira', 'stres', 'penat', 'rindu', 'sayang'],
-            'work': ['kerja', 'projek', 'boss', 'meeting', 'deadline'],
-            'story': ['cerita', 'kisah', 'dulu', 'masa', 'kenangan'],
-            'promise': ['janji', 'akan', 'nanti', 'esok', 'nnt'],
-            'first_time': ['pertama', 'first', 'pertama kali', 'first time']
-        }
+        # Categories for important memories (shared with fact_extractor)
+        self.important_categories = IMPORTANT_CATEGORIES
         
         # Track important IDs for quick access
         self.important_ids = []
     
-    def save_conversation(self, user_message, ayra_response, mood_score=0.0, model_used="Gemini", is_important=False):
+    def save_conversation(self, user_message, ayra_response, mood_score=0.0, model_used="Gemini", is_important=False,
+                          language=None):
         """
         Save a conversation pair to ChromaDB
         """
@@ -69,7 +71,8 @@ class ChromaVault:
             "model_used": model_used,
             "category": category,
             "important": str(important),
-            "has_story": "1" if ("/cerita" in user_message or "/sambung" in user_message) else "0"
+            "has_story": "1" if ("/cerita" in user_message or "/sambung" in user_message) else "0",
+            "language": language or detect_language(user_message)
         }
         
         # Generate unique ID
@@ -78,6 +81,7 @@ class ChromaVault:
         # Add to collection
         self.collection.add(
             documents=[full_text],
+            embeddings=[self.embedder.embed(full_text).tolist()],
             metadatas=[metadata],
             ids=[doc_id]
         )
@@ -109,6 +113,7 @@ class ChromaVault:
         
         self.collection.add(
             documents=[story_content],
+            embeddings=[self.embedder.embed(story_content).tolist()],
             metadatas=[metadata],
             ids=[story_id]
         )
@@ -130,6 +135,7 @@ class ChromaVault:
         
         self.collection.add(
             documents=[dream_text],
+            embeddings=[self.embedder.embed(dream_text).tolist()],
             metadatas=[metadata],
             ids=[dream_id]
         )
@@ -150,7 +156,7 @@ class ChromaVault:
             
             # Query collection
             results = self.collection.query(
-                query_texts=[query],
+                query_embeddings=[self.embedder.embed(query).tolist()],
                 n_results=n_results * 2,  # Get more for filtering
                 where=where_filter
             )
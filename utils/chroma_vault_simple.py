@@ -6,7 +6,8 @@ class ChromaVault:
         # Tak buat apa-apa
         pass
     
-    def save_conversation(self, user_message, ayra_response, mood_score=0.0, model_used="Gemini", is_important=False):
+    def save_conversation(self, user_message, ayra_response, mood_score=0.0, model_used="Gemini", is_important=False,
+                          language=None):
         # Tak simpan apa-apa
         return None
     
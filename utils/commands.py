@@ -0,0 +1,228 @@
+# utils/commands.py
+
+"""
+Slash-command registry for AYRA's easter eggs.
+Handlers register with @command, dispatch is a single dict lookup and all
+static content is built once at import. A handler returns the reply text,
+or None to hand the message to the model, which only commands registered
+with uses_model=True may do.
+"""
+
+import random
+
+from .location import DEFAULT_PLACE, FOOD_INDEX, PLACES, format_weather, recommend_food, resolve_place
+from .memory_manager import DEFAULT_USER
+
+# ===== STATIC CONTENT =====
+JOKES = (
+    "🍦 AYRA: Nah, virtual ais krim! Tapi jangan banyak-banyak, nanti batuk!",
+    "🍦 AYRA bagi you ais krim percuma! Tapi awas, ni ais krim lawak—kenapa orang Melayu suka WhatsApp? Sebab kat situ ada 'kek'! 😆",
+    "🍦 Rasa apa hari ni? AYRA ada flavor 'Cappucino Ceria' dan 'Chocolate Pening'."
+)
+NURSE_MODE = ("🩺 AYRA (Nurse Mode): Aduh, sakit mana? Jom check suhu... 37.5°C sikit naik. "
+              "Rehat dulu sayang. Nak AYRA bacakan doa? Atau nak ubat virtual? 💊")
+STORY_OPENING = ("📖 AYRA: Pada suatu masa di Kuala Lumpur, ada seorang hero bernama [awak] yang sangat baik hati. "
+                 "Satu hari, masa lalu di Jalan Alor, terjumpa satu gerai misteri... Nak sambung cerita? Taip /sambung")
+MOODS = (
+    "macam teh tarik – manis, creamy, ada rasa pahit sikit.",
+    "seperti nasi lemak – biasa tapi memuaskan.",
+    "macam cuaca pagi ni – segar dan bertenaga!",
+    "sedikit nostalgic, teringat cite lama."
+)
+DREAMS = (
+    "🌙 Semalam AYRA mimpi pelik – awak jadi superhero pakai baju Melayu, terbang kat atas KLCC!",
+    "🌙 AYRA mimpi kat Malaysia menang Piala Dunia! AYRA sorak sampai hilang suara.",
+    "🌙 Dalam mimpi, AYRA dengan awak pegi bazaar ramadan, tapi semua orang jual virtual reality games.",
+    "🌙 AYRA mimpi jadi Perdana Menteri sehari. AYRA bagi ucapan pakai baju kurung power!"
+)
+TRENDING = "📈 Hari ni kat Twitter Malaysia tengah viral pasal #HargaMinyakNaikLagi. Nak AYRA summarise?"
+
+
+class Command:
+    __slots__ = ("name", "handler", "help", "uses_model")
+
+    def __init__(self, name, handler, help="", uses_model=False):
+        self.name = name
+        self.handler = handler
+        self.help = help
+        self.uses_model = uses_model
+
+
+class CommandRegistry:
+    def __init__(self):
+        self._commands = {}
+
+    def command(self, name, *aliases, help="", uses_model=False):
+        """Decorator: register handler(args, memory, user_id) under /name (and aliases)"""
+        def decorator(handler):
+            entry = Command(name, handler, help, uses_model)
+            for key in (name, *aliases):
+                self._commands[key] = entry
+            return handler
+        return decorator
+
+    @staticmethod
+    def parse(message):
+        """'/Cerita pasal kucing' -> ('/cerita', 'pasal kucing'); None if not a slash command"""
+        text = message.strip()
+        if not text.startswith("/"):
+            return None
+        name, _, args = text.partition(" ")
+        return name.lower(), args.strip()
+
+    def get(self, name):
+        return self._commands.get(name)
+
+    def dispatch(self, message, memory=None, user_id=DEFAULT_USER):
+        """Returns the reply, or None if the model should answer. user_id scopes anything read from memory"""
+        parsed = self.parse(message)
+        if parsed is None:
+            return None
+        entry = self._commands.get(parsed[0])
+        if entry is None:
+            return None
+        reply = entry.handler(parsed[1], memory, user_id)
+        if reply is None and not entry.uses_model:
+            return entry.help
+        return reply
+
+    def commands(self):
+        """Registered commands (aliases folded), sorted by name"""
+        return sorted({c.name: c for c in self._commands.values()}.values(), key=lambda c: c.name)
+
+
+registry = CommandRegistry()
+command = registry.command
+
+
+# ===== HANDLERS =====
+@command("/ais-krim", help="🍦 Virtual ais krim")
+def _ice_cream(args, memory, user_id):
+    return random.choice(JOKES)
+
+
+@command("/penat", help="🩺 Nurse mode")
+def _tired(args, memory, user_id):
+    return NURSE_MODE
+
+
+@command("/cerita", help="📖 Mula cerita baru (/cerita <tajuk> untuk AYRA karang)", uses_model=True)
+def _story(args, memory, user_id):
+    # Dengan tajuk, model yang karang cerita
+    return None if args else STORY_OPENING
+
+
+@command("/sambung", help="🔄 Sambung cerita terakhir", uses_model=True)
+def _continue(args, memory, user_id):
+    if memory is None:
+        return "📖 AYRA: Hmm, AYRA tak ingat cerita lepas. Cuba taip /cerita dulu."
+    if args or memory.get_latest_story(user_id=user_id):
+        # Engine sambung cerita melalui model
+        return None
+    return "📖 AYRA: Belum ada cerita yang disimpan. Taip /cerita dulu ya!"
+
+
+@command("/tamat", help="🏁 Tamatkan cerita terakhir")
+def _finish_story(args, memory, user_id):
+    if memory is None:
+        return "📖 AYRA tak ingat cerita mana nak ditamatkan."
+    finished = memory.finish_latest_story(user_id)
+    if finished is None:
+        return "📖 Takde cerita yang belum tamat. Taip /cerita untuk mula yang baru!"
+    title, chapters, badges = finished
+    reply = f"📖 TAMAT! '{title}' habis dalam {chapters} babak. Terima kasih teman AYRA bercerita 💛"
+    if badges:
+        reply += "\n🏅 Badge baru: " + " · ".join(badges)
+    return reply
+
+
+@command("/mood", help="😊 Mood AYRA hari ni")
+def _mood(args, memory, user_id):
+    return f"🎭 Mood AYRA hari ni {random.choice(MOODS)}"
+
+
+@command("/level", help="📊 Level persahabatan")
+def _level(args, memory, user_id):
+    if memory is None:
+        return "📊 Level 1 · Kenalan Biasa. Jom borak dulu!"
+    p = memory.get_progress(user_id)
+    count, level, name = p["messages"], p["level"], p["level_name"]
+    streak = f" 🔥 Streak {p['streak']} hari." if p["streak"] > 1 else ""
+    if p["next_level"] is None:
+        return f"📊 Level {level} · {name}! Dah {count} mesej, kita memang dah tak boleh dipisahkan 💞{streak}"
+    next_at, next_name = p["next_level"]
+    return (f"📊 Level {level} · {name} ({count} mesej). "
+            f"Lagi {next_at - count} mesej untuk jadi '{next_name}'!{streak}")
+
+
+@command("/badges", help="🏅 Badge yang dah dikumpul")
+def _badges(args, memory, user_id):
+    if memory is None:
+        return "🏅 Belum ada badge lagi. Jom borak dulu!"
+    p = memory.get_progress(user_id)
+    reply = "🏅 Badge awak: " + " · ".join(p["badges"]) if p["badges"] else "🏅 Belum ada badge lagi. Jom borak dulu!"
+    if p["upcoming"]:
+        reply += "\n\nSeterusnya: " + " · ".join(f"{name} (lagi {left} {unit})" for name, left, unit in p["upcoming"])
+    return reply
+
+
+@command("/dream", help="🌙 Mimpi AYRA semalam")
+def _dream(args, memory, user_id):
+    if memory is None:
+        return "🌙 AYRA lupa mimpi semalam. Mungkin tak mimpi apa-apa."
+    dream = memory.get_random_dream()
+    if dream:
+        return dream
+    # Generate a new dream and save it
+    dream = random.choice(DREAMS)
+    memory.save_dream(dream)
+    return dream
+
+
+@command("/food", help="🍜 Cadangan makan berdekatan (/food <tempat> <makanan>)")
+def _food(args, memory, user_id):
+    profile = memory.get_user_profile(user_id) if memory else {}
+    # Tempat: dari arahan, kemudian lokasi dalam profil, kemudian default
+    place = (resolve_place(args) or resolve_place(profile.get("location", ""))
+             or (DEFAULT_PLACE, PLACES[DEFAULT_PLACE]))
+    name, (lat, lon) = place
+    name = name.upper() if len(name) <= 2 else name.title()  # "kl" -> "KL"
+    dish = FOOD_INDEX.find_dish(args)
+    picks, report = recommend_food(lat, lon, dish=dish, liked=profile.get("food", ()))
+    if not picks:
+        return f"🍜 AYRA tak jumpa {dish or 'kedai makan'} dekat {name}. Cuba tempat lain?"
+    header = f"🍜 Dekat {name}"
+    if report is not None:
+        header += f" ({format_weather(report)})"
+    lines = [f"• {e.name} – {e.dish}, {e.area} ({km:.1f} km)" for e, km in picks]
+    return header + ":\n" + "\n".join(lines)
+
+
+@command("/trending", help="📈 Apa yang viral")
+def _trending(args, memory, user_id):
+    return TRENDING
+
+
+@command("/cari", help="🔎 Cari perbualan lama (/cari <kata kunci>)")
+def _search(args, memory, user_id):
+    if not args:
+        return None
+    if memory is None:
+        return "🔎 AYRA tak dapat buka memori sekarang. Cuba lagi nanti."
+    results = memory.search_text(args, limit=3, user_id=user_id)
+    if not results:
+        return f"🔎 AYRA tak jumpa apa-apa pasal '{args}'."
+    lines = [f"• {r['timestamp'][:10]}: {r['snippet']}" for r in results]
+    return f"🔎 Ni yang AYRA ingat pasal '{args}':\n" + "\n".join(lines)
+
+
+@command("/help", help="❓ Senarai command")
+def _help(args, memory, user_id):
+    return "🧭 Command AYRA:\n" + "\n".join(f"{c.name} – {c.help}" for c in registry.commands())
+
+
+# For testing
+if __name__ == "__main__":
+    for text in ["/ais-krim", "/CERITA", "/cerita pasal kucing", "/level", "/badges",
+                 "/food", "/food penang", "/food laksa kuching", "/tak-wujud", "hello", "/help"]:
+        print(f"{text!r:24} -> {registry.dispatch(text)!r}")
@@ -5,20 +5,37 @@ Crisis Detection Module for AYRA
 Detects harmful content and provides appropriate crisis resources
 """
 
-CRISIS_KEYWORDS = [
-    # Malay / Manglish
+import re
+
+from .language import ENGLISH, MALAY
+from .tracing import traced
+
+# Malay / Manglish
+CRISIS_KEYWORDS_MS = [
     'bunuh diri', 'nak mati', 'nak bunuh diri', 'tak nak hidup',
     'putus asa', 'tak guna hidup', 'malas nak hidup', 'give up',
     'nak mati je', 'habiskan nyawa', 'tak tau nak buat apa',
     'stress sangat', 'down sangat', 'sedih sangat',
-    
-    # English
+]
+# English
+CRISIS_KEYWORDS_EN = [
     'suicide', 'kill myself', 'end my life', 'want to die',
     'hopeless', 'worthless', 'can\'t go on', 'no reason to live',
-    
-    # Alerts
-    'tolong saya', 'i need help', 'emergency', 'kecemasan'
 ]
+# Alerts
+CRISIS_ALERTS = ['tolong saya', 'i need help', 'emergency', 'kecemasan']
+CRISIS_KEYWORDS = CRISIS_KEYWORDS_MS + CRISIS_KEYWORDS_EN + CRISIS_ALERTS
+
+
+def _pattern(keywords):
+    return re.compile("|".join(re.escape(k) for k in keywords))
+
+
+_PATTERNS = {
+    MALAY: _pattern(CRISIS_KEYWORDS_MS + CRISIS_ALERTS),
+    ENGLISH: _pattern(CRISIS_KEYWORDS_EN + CRISIS_ALERTS),
+    None: _pattern(CRISIS_KEYWORDS),
+}
 
 # Crisis resources for Malaysia
 CRISIS_RESOURCES = {
@@ -99,9 +116,11 @@ def format_crisis_response(user_name="Abang/Sayang"):
         emergency_desc=CRISIS_RESOURCES['emergency']['description']
     )
 
-def detect_crisis(text):
+@traced("crisis.detect")
+def detect_crisis(text, language=None):
     """
     Detect if text contains crisis keywords
+    language (from utils.language) picks which list is scanned first
     Returns: (bool, matched_keyword)
     """
     if not text or not isinstance(text, str):
@@ -109,11 +128,16 @@ def detect_crisis(text):
     
     text_lower = text.lower().strip()
     
-    for keyword in CRISIS_KEYWORDS:
-        if keyword in text_lower:
-            return True, keyword
+    if language in (MALAY, ENGLISH):
+        match = _PATTERNS[language].search(text_lower)
+        if match is None:
+            # Safety net: satu frasa bahasa lain dalam mesej panjang pun tak boleh terlepas
+            other = ENGLISH if language == MALAY else MALAY
+            match = _PATTERNS[other].search(text_lower)
+    else:
+        match = _PATTERNS[None].search(text_lower)
     
-    return False, None
+    return (True, match.group(0)) if match else (False, None)
 
 def contains_crisis_keywords(text):
     """Simple boolean check"""
@@ -0,0 +1,170 @@
+# utils/dedup.py
+
+"""
+Near-duplicate detection for stored memories.
+Each exchange gets a MinHash signature over its word set; the fraction of
+matching slots estimates the Jaccard similarity of two exchanges. Signatures
+are split into bands and indexed per band (LSH), so a lookup only compares
+the few entries that share a band instead of the whole window. Only the
+most recent `max_entries` memories are indexed, per scope (user).
+MinHash only picks candidates: 20 slots are too noisy to decide on short
+messages, so every candidate is confirmed with the exact Jaccard of the
+stored word sets before it counts as a duplicate. An optional key (the
+user's message) must itself be near-identical too, so a long shared reply
+cannot make two different messages look alike.
+"""
+
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+NUM_PERM = 20
+BANDS = 5  # 5 band x 4 baris: J=0.8 dijumpai ~93%, J=0.2 jadi calon <1%
+ROWS = NUM_PERM // BANDS
+THRESHOLD = 0.8  # anggaran Jaccard minimum untuk dikira duplikat
+KEY_THRESHOLD = 0.9  # key (mesej user) mesti hampir sama, bukan sekadar serupa
+MAX_ENTRIES = 2048
+_MASK64 = (1 << 64) - 1
+_EMPTY = 1 << 64
+_WORD = re.compile(r"\w+")
+
+
+def words(text):
+    """Normalized word set (casefolded, punctuation dropped)"""
+    return frozenset(_WORD.findall(text.casefold()))
+
+
+def _hash(word):
+    # Hash stabil (bukan hash() builtin yang berubah ikut PYTHONHASHSEED setiap proses)
+    return int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+
+
+def signature(text_or_words):
+    """
+    One-permutation MinHash of the text's word set: each word is hashed
+    once and kept as the minimum of its bin; empty bins borrow the next
+    filled bin (densification). Stable across processes.
+    """
+    word_set = words(text_or_words) if isinstance(text_or_words, str) else text_or_words
+    bins = [_EMPTY] * NUM_PERM
+    for word in word_set:
+        value, b = divmod(_hash(word) & _MASK64, NUM_PERM)
+        if value < bins[b]:
+            bins[b] = value
+    if _EMPTY in bins:
+        if bins.count(_EMPTY) == NUM_PERM:
+            return tuple(bins)
+        for i in range(NUM_PERM):
+            j = i
+            while bins[j] == _EMPTY:
+                j = (j + 1) % NUM_PERM
+            if j != i:
+                # Offset ikut jarak supaya nilai pinjaman tak sama dengan nilai asli
+                bins[i] = bins[j] + (j - i) % NUM_PERM * _EMPTY
+    return tuple(bins)
+
+
+def jaccard(a, b):
+    """Exact Jaccard similarity of two word sets"""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def fingerprint(text, key=None):
+    """What the index stores per entry: (signature, word set, key word set or None)"""
+    word_set = words(text)
+    return signature(word_set), word_set, words(key) if key is not None else None
+
+
+class DedupIndex:
+    def __init__(self, max_entries=MAX_ENTRIES, threshold=THRESHOLD, key_threshold=KEY_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.key_threshold = key_threshold
+        self._entries = OrderedDict()  # entry_id -> (scope, fingerprint)
+        self._bands = {}               # (scope, band, rows) -> set(entry_id)
+        self.stats = {"checked": 0, "duplicates": 0, "bytes_saved": 0, "check_us_total": 0.0}
+
+    def find(self, text, scope="", key=None):
+        """
+        Returns (entry_id or None, fingerprint) for the most similar indexed
+        near-duplicate (exact Jaccard) whose key also matches
+        """
+        start = time.perf_counter()
+        fp = sig, word_set, key_words = fingerprint(text, key)
+        best, best_score = None, self.threshold
+        seen = set()
+        for band_key in _band_keys(scope, sig):
+            for entry_id in self._bands.get(band_key, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                _, (_, entry_words, entry_key_words) = self._entries[entry_id]
+                # Band MinHash cuma pilih calon; keputusan guna Jaccard sebenar
+                score = jaccard(entry_words, word_set)
+                if score < best_score:
+                    continue
+                if key_words is not None and entry_key_words is not None \
+                        and jaccard(entry_key_words, key_words) < self.key_threshold:
+                    continue
+                best, best_score = entry_id, score
+        self.stats["checked"] += 1
+        self.stats["check_us_total"] += (time.perf_counter() - start) * 1e6
+        return best, fp
+
+    def add(self, entry_id, fp, scope=""):
+        self._entries[entry_id] = (scope, fp)
+        for key in _band_keys(scope, fp[0]):
+            self._bands.setdefault(key, set()).add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def touch(self, entry_id, saved_bytes=0):
+        """Record a merged duplicate; the entry becomes the most recent"""
+        self._entries.move_to_end(entry_id)
+        self.stats["duplicates"] += 1
+        self.stats["bytes_saved"] += saved_bytes
+
+    def get_stats(self):
+        checked = self.stats["checked"]
+        return {**self.stats, "entries": len(self._entries),
+                "duplicate_rate": self.stats["duplicates"] / checked if checked else 0.0,
+                "avg_check_us": self.stats["check_us_total"] / checked if checked else 0.0}
+
+    def _remove(self, entry_id):
+        scope, fp = self._entries.pop(entry_id)
+        for key in _band_keys(scope, fp[0]):
+            bucket = self._bands.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._bands[key]
+
+
+def _band_keys(scope, sig):
+    return [(scope, band, sig[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+# For testing
+if __name__ == "__main__":
+    index = DedupIndex()
+    texts = [
+        "Saya penat sangat hari ni\nRehat dulu ya, jangan paksa diri.",
+        "saya penat sangat hari ni!\nRehat dulu ya, jangan paksa diri.",
+        "Saya suka nasi lemak\nSedap! Sambal pedas ke manis?",
+        "Esok ada meeting pukul 9\nGood luck! Nak AYRA ingatkan?",
+        "Saya suka nasi lemak\nSedap! Sambal pedas ke manis?",
+        "Saya suka roti canai\nSedap! Sambal pedas ke manis?",
+        "esok meeting pukul 9\nOkay!",
+        "esok meeting pukul 10\nOkay!",
+    ]
+    for i, text in enumerate(texts):
+        match, fp = index.find(text, key=text.split("\n")[0])
+        if match is None:
+            index.add(i, fp)
+        else:
+            index.touch(match, len(text.encode()))
+        print(f"{i}: dup_of={match}")
+    print(index.get_stats())
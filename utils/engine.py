@@ -0,0 +1,306 @@
+# utils/engine.py
+
+"""
+UI-independent conversation engine for AYRA.
+All turn logic (crisis check, easter eggs, fatigue, routing, mood,
+persistence, stories) lives here so it can be driven by Streamlit, an API
+server or a benchmark. Per-user state is kept in a Session object.
+"""
+
+import asyncio
+
+from .crisis_detector import detect_crisis, format_crisis_response
+from .fact_extractor import extract_facts
+from .file_extractor import extract_file_content
+from .gamification import CHAPTER, MESSAGE
+from .commands import registry
+from .language import detect_language
+from .memory_manager import MemoryManager, STORY_SYNOPSIS_EVERY, STORY_WINDOW
+from .model_router import ModelRouter, error_message, estimate_tokens
+from .mood_analyzer import MoodAnalyzer
+from .prefetcher import Prefetcher
+from .rate_limiter import FatigueEngine, RateLimiter
+from .singleflight import prompt_key
+from .tracing import span
+
+FATIGUE_MESSAGE = "AYRA: Kejap eh awak, Ayra nak 'recharge' jap. awak pun pergilah rehat, asyik tengok skrin jer!"
+IMPORTANT_WORDS = ['suka', 'minat', 'nama', 'birthday', 'janji', 'teh tarik']
+STORY_CONTINUE_PROMPT = ("Sambung cerita di bawah dengan satu babak pendek (3-5 ayat) dalam gaya AYRA. "
+                         "Jangan ulang apa yang dah berlaku.\n\n{synopsis}Babak terkini:\n{story}")
+# Pilihan analisis fail yang biasanya diminta selepas pilihan sebelumnya
+FILE_FOLLOW_UPS = {"Ringkaskan": "Cari poin penting"}
+
+
+class Session:
+    """Per-user conversation state (what app.py used to keep in st.session_state)"""
+
+    def __init__(self, user_id="default"):
+        self.user_id = user_id
+        self.chat_history = []
+        self.fatigue = False
+        self.mood = MoodAnalyzer()
+        self.mood_score = 0.0
+        self.comfort_mode = False
+        self.current_story_id = None
+        self.language = None  # tag mesej terakhir (utils.language)
+
+
+class ConversationEngine:
+    def __init__(self, memory=None, router=None, fatigue=None, prefetcher=None):
+        self.memory = memory or MemoryManager()
+        self.router = router or ModelRouter()
+        # Rate limit per user + global, dikongsi antara tab & worker melalui SQLite
+        self.fatigue = fatigue or FatigueEngine(RateLimiter(self.memory.db_path))
+        # Giliran seterusnya yang boleh diramal dijana awal, hanya bila governor lapang
+        self.prefetcher = prefetcher or Prefetcher(is_idle=self.router.governor.is_idle)
+        # History lama dimampatkan jadi ringkasan oleh model yang sama
+        if self.memory.summarizer is None:
+            self.memory.summarizer = self.router.summarize
+
+    # ===== TURNS =====
+    def handle_turn(self, session, message):
+        """
+        Process one user message.
+        Returns: {"response", "model_used", "crisis", "badges"} (badges: newly earned)
+        """
+        with span("turn", prompt_chars=len(message)):
+            session.chat_history.append({"role": "user", "content": message})
+            result = self._process(session, message)
+            session.chat_history.append({"role": "assistant", "content": result["response"]})
+            return result
+
+    async def ahandle_turn(self, session, message):
+        # Model & SQLite calls are blocking, so run the turn in a worker thread
+        return await asyncio.to_thread(self.handle_turn, session, message)
+
+    def stream_turn(self, session, message):
+        """
+        Same as handle_turn, but yields events as the reply is generated:
+        {"type": "chunk", "text"} ... then {"type": "done", "response", "model_used", "crisis", "badges"}
+        """
+        with span("turn", prompt_chars=len(message), stream=True):
+            session.chat_history.append({"role": "user", "content": message})
+            result = self._pre_model(session, message)
+            if result is None:
+                context, profile, summary = self._fetch_context(session)
+                with span("turn.router"):
+                    chunks, model_used = self.router.route_stream(
+                        message, context, memory_profile=profile, summary=summary, language=session.language
+                    )
+                    parts = []
+                    for text in chunks:
+                        parts.append(text)
+                        yield {"type": "chunk", "text": text}
+                result = self._finish(session, message, "".join(parts), model_used)
+            else:
+                yield {"type": "chunk", "text": result["response"]}
+            session.chat_history.append({"role": "assistant", "content": result["response"]})
+            yield {"type": "done", **result}
+
+    async def astream_turn(self, session, message):
+        """Async generator over stream_turn(); the blocking generator runs in a worker thread"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def produce():
+            try:
+                for event in self.stream_turn(session, message):
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, {"type": "error", "error": str(e)})
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        producer = loop.run_in_executor(None, produce)
+        while (event := await queue.get()) is not None:
+            yield event
+        await producer
+
+    def _process(self, session, message):
+        result = self._pre_model(session, message)
+        if result is not None:
+            return result
+
+        context, profile, summary = self._fetch_context(session)
+        with span("turn.router"):
+            response, model_used = self.router.route(
+                message, context, memory_profile=profile, summary=summary, language=session.language
+            )
+        return self._finish(session, message, response, model_used)
+
+    def _pre_model(self, session, message):
+        """Crisis / easter egg / fatigue / story. Returns a result, or None if the model should answer"""
+        # Tag bahasa sekali; mood, crisis, vault & prompt guna tag yang sama
+        with span("turn.language"):
+            session.language = detect_language(message)
+
+        # ---- 0. CRISIS DETECTION (SAFETY FIRST!) ----
+        with span("turn.crisis"):
+            is_crisis, keyword = detect_crisis(message, session.language)
+        if is_crisis:
+            user_name = self.memory.get_user_profile(session.user_id).get("name") or "awak"
+            self.memory.log_crisis_event(message, keyword)
+            response = format_crisis_response(user_name)
+            self.memory.save_interaction(
+                message, response, session.mood_score, "Crisis Alert", user_id=session.user_id, events=()
+            )
+            return _result(response, "Crisis Alert", crisis=True)
+
+        # ---- 1. Check for Easter eggs ----
+        command = registry.parse(message)
+        with span("turn.easter_egg"):
+            egg_response = registry.dispatch(message, memory=self.memory, user_id=session.user_id)
+        if egg_response:
+            if command == ("/cerita", ""):
+                self._start_story(session, egg_response)
+            return _result(egg_response, "Easter Egg")
+
+        # ---- 2. Fatigue simulation ----
+        with span("turn.fatigue"):
+            tired = self.fatigue.is_tired(session.user_id)
+            session.fatigue = tired
+        if tired:
+            self.memory.save_interaction(
+                message, FATIGUE_MESSAGE, session.mood_score, "Fatigue", user_id=session.user_id, events=()
+            )
+            return _result(FATIGUE_MESSAGE, "Fatigue")
+
+        # ---- 3. Story continuation ----
+        if command == ("/sambung", ""):
+            # Handler dah pastikan ada cerita; sambungan sebenar dari model
+            return self._continue_story(session, message, self.memory.get_latest_story(user_id=session.user_id))
+        return None
+
+    def _fetch_context(self, session):
+        with span("turn.memory_fetch"):
+            # Ringkasan + semua exchange selepas watermark ringkasan (tiada jurang)
+            context, summary = self.memory.get_context(session.user_id)
+            profile = self.memory.get_user_profile(session.user_id)
+        return context, profile, summary
+
+    def _finish(self, session, message, response, model_used):
+        # ---- 3. Mood + persistence ----
+        with span("turn.mood"):
+            new_mood = session.mood.update(message, session.language)
+            session.mood_score = new_mood
+            session.comfort_mode = new_mood < -0.1
+
+        with span("turn.persist"):
+            # Kaunter, streak & badge dikemas kini dalam transaksi yang sama
+            events = (MESSAGE, CHAPTER) if message.lower().startswith("/sambung") else (MESSAGE,)
+            badges = self.memory.save_interaction(
+                message, response, new_mood, model_used, user_id=session.user_id, language=session.language,
+                events=events
+            )
+            # Simpan ke vault untuk long-term memory (sekali je per turn)
+            is_important = any(word in message.lower() for word in IMPORTANT_WORDS)
+            self.memory.save_to_vault(message, response, new_mood, model_used, is_important=is_important)
+            self._update_story(session, message, response)
+
+        with span("turn.facts"):
+            self.memory.save_facts(session.user_id, extract_facts(message))
+
+        return _result(response, model_used, badges=badges)
+
+    # ===== STORIES =====
+    def _start_story(self, session, opening):
+        session.current_story_id = self.memory.save_story("User Story", opening, user_id=session.user_id)
+        # Lepas /cerita, user hampir selalu taip /sambung
+        self._prefetch_story({"id": session.current_story_id, "synopsis": None, "chunks": [opening], "chunk_count": 1})
+
+    def _continue_story(self, session, message, story):
+        with span("turn.router", story=True):
+            continuation = self.prefetcher.get(_story_key(story))
+            if continuation is None:
+                try:
+                    continuation = self.router.complete(_story_prompt(story), [])
+                except Exception as e:
+                    # Jangan simpan mesej ralat sebagai sebahagian cerita
+                    return _result(error_message(e), "Gemini (Ayra)")
+
+        model_used = "Gemini (Ayra)"
+        self.memory.append_story_chunk(story["id"], continuation, user_id=session.user_id)
+        session.current_story_id = story["id"]
+        chunks = (story["chunks"] + [continuation])[-(STORY_WINDOW + STORY_SYNOPSIS_EVERY):]
+        self._prefetch_story({**story, "chunks": chunks, "chunk_count": story["chunk_count"] + 1})
+
+        response = f"📖 Sambungan: {continuation} ... apa jadi seterusnya? (Taip /sambung lagi atau /tamat)"
+        badges = self.memory.save_interaction(
+            message, response, session.mood_score, model_used, user_id=session.user_id, events=(MESSAGE, CHAPTER)
+        )
+        return _result(response, model_used, badges=badges)
+
+    def _prefetch_story(self, story):
+        prompt = _story_prompt(story)
+        self.prefetcher.schedule(
+            _story_key(story), lambda: self.router.complete(prompt, []), est_tokens=estimate_tokens(prompt)
+        )
+
+    def _update_story(self, session, message, response):
+        command = message.lower()
+        if command.startswith("/sambung"):
+            story = self.memory.get_latest_story(user_id=session.user_id)
+            if story:
+                self.memory.append_story_chunk(story["id"], response, user_id=session.user_id)
+                session.current_story_id = story["id"]
+        elif command.startswith("/cerita"):
+            session.current_story_id = self.memory.save_story("User Story", response, user_id=session.user_id)
+
+    # ===== FILES =====
+    def handle_file(self, session, uploaded_file, file_type, analysis_option, custom_q=""):
+        """
+        Analyse an uploaded file (image goes to the vision path).
+        Returns: {"response", "model_used", "crisis"}
+        """
+        extra = custom_q if custom_q else 'Tiada'
+        with span("turn.file", file_type=file_type):
+            if file_type.startswith("📸"):
+                # Router akan kecilkan gambar & buang EXIF
+                prompt_text = f"Analisis gambar ini: {analysis_option}\n\nSoalan tambahan: {extra}"
+                response, model_used = self.router.route_image(uploaded_file.getvalue(), prompt_text)
+            else:
+                file_content = extract_file_content(uploaded_file, file_type)
+                prompt_text = _file_prompt(analysis_option, file_content, extra)
+                response = self.prefetcher.get(prompt_key(prompt_text))
+                if response is None:
+                    response, model_used = self.router.route(prompt_text, [])
+                else:
+                    model_used = "Gemini (Ayra)"
+                follow_up = FILE_FOLLOW_UPS.get(analysis_option)
+                if follow_up:
+                    next_prompt = _file_prompt(follow_up, file_content, extra)
+                    self.prefetcher.schedule(
+                        prompt_key(next_prompt), lambda: self.router.complete(next_prompt, []),
+                        est_tokens=estimate_tokens(next_prompt)
+                    )
+
+            session.chat_history.append({"role": "user", "content": f"[Uploaded file: {uploaded_file.name}]"})
+            session.chat_history.append({"role": "assistant", "content": response})
+            self.memory.save_interaction(
+                f"[Upload] {uploaded_file.name}", response, session.mood_score, model_used, user_id=session.user_id
+            )
+        return _result(response, model_used)
+
+    async def ahandle_file(self, session, uploaded_file, file_type, analysis_option, custom_q=""):
+        return await asyncio.to_thread(
+            self.handle_file, session, uploaded_file, file_type, analysis_option, custom_q
+        )
+
+
+def _result(response, model_used, crisis=False, badges=None):
+    return {"response": response, "model_used": model_used, "crisis": crisis, "badges": badges or []}
+
+
+def _story_prompt(story):
+    # Sinopsis + babak terakhir je, jadi prompt tak membesar ikut panjang cerita
+    synopsis = f"Sinopsis:\n{story['synopsis']}\n\n" if story["synopsis"] else ""
+    return STORY_CONTINUE_PROMPT.format(synopsis=synopsis, story="\n\n".join(story["chunks"]))
+
+
+def _story_key(story):
+    # Berubah setiap kali cerita bertambah, jadi sambungan lama tak akan dipadankan
+    return prompt_key("story", story["id"], story["chunk_count"])
+
+
+def _file_prompt(analysis_option, file_content, extra):
+    return f"Analisis fail ini: {analysis_option}\n\nKandungan:\n{file_content}\n\nSoalan tambahan: {extra}"
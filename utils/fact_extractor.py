@@ -0,0 +1,115 @@
+# utils/fact_extractor.py
+
+"""
+Rule-based fact extraction for AYRA's long-term profile.
+Pulls durable facts (name, birthday, likes, food, work, promises) out of a
+user message using the same category keywords as the Chroma vault. No
+chromadb import here, so it is safe for the lightweight deploy.
+Emotions and story text are transient and are not stored as facts.
+"""
+
+import re
+
+# Categories for important memories (dikongsi dengan chroma_vault_backup)
+IMPORTANT_CATEGORIES = {
+    'personal': ['suka', 'minat', 'gemar', 'nama', 'birthday', 'hari jadi'],
+    'food': ['teh', 'kopi', 'makan', 'minum', 'nasi', 'lauk', 'roti'],
+    'emotion': ['sedih', 'gembira', 'stres', 'penat', 'rindu', 'sayang'],
+    'work': ['kerja', 'projek', 'boss', 'meeting', 'deadline'],
+    'story': ['cerita', 'kisah', 'dulu', 'masa', 'kenangan'],
+    'promise': ['janji', 'akan', 'nanti', 'esok', 'nnt'],
+    'first_time': ['pertama', 'first', 'pertama kali', 'first time']
+}
+
+SINGLE, LIST = "single", "list"
+# key -> (category, cardinality). SINGLE = nilai baru ganti yang lama
+FACT_TYPES = {
+    "name": ("personal", SINGLE),
+    "birthday": ("personal", SINGLE),
+    "job": ("work", SINGLE),
+    "likes": ("personal", LIST),
+    "food": ("food", LIST),
+    "work": ("work", LIST),
+    "promise": ("promise", LIST),
+    "first_time": ("first_time", LIST),
+}
+MAX_VALUE_CHARS = 80
+
+_SUBJECT = r"(?:saya|aku|sy|ak|i)"
+_NAME = re.compile(
+    rf"\b(?:nama\s+{_SUBJECT}|panggil\s+{_SUBJECT}|my name is)\s+(?:ialah\s+|adalah\s+)?([^\W\d_][\w'-]*)", re.I
+)
+_BIRTHDAY = re.compile(
+    rf"\b(?:birthday|hari jadi)\s+(?:{_SUBJECT}\s+)?(?:pada\s+|on\s+|ialah\s+|is\s+)?"
+    r"(\d{1,2}(?:\s*[/-]\s*\d{1,2}|\s+[a-z]+)(?:\s*[/-]?\s*\d{2,4})?)", re.I
+)
+_JOB = re.compile(rf"\b{_SUBJECT}\s+(?:kerja|bekerja)\s+(?:sebagai|jadi)\s+(.+)", re.I)
+_LIKES = re.compile(rf"\b{_SUBJECT}\s+(?:sangat\s+|memang\s+)?(?:suka|minat|gemar)\s+(?:sangat\s+)?(.+)", re.I)
+_PROMISE = re.compile(rf"\bjanji\b|\b{_SUBJECT}\s+(?:akan|nanti|nnt)\b", re.I)
+_CLAUSE_SPLIT = re.compile(rf"[.!?;,\n]+|\s+(?:tapi|dan|and|but)\s+(?={_SUBJECT}\b)", re.I)
+
+
+def _keyword_pattern(words):
+    return re.compile(r"\b(?:" + "|".join(re.escape(w) for w in words) + r")\b", re.I)
+
+
+_FOOD = _keyword_pattern(IMPORTANT_CATEGORIES['food'])
+# 'kerja' sahaja terlalu umum ("penat kerja"); simpan yang ada benda nak diingat
+_WORK_NOTE = _keyword_pattern([w for w in IMPORTANT_CATEGORIES['work'] if w != 'kerja'])
+_FIRST_TIME = _keyword_pattern(['pertama kali', 'first time'])
+
+
+def _clean(value):
+    value = re.split(r"\s+(?:dan|tapi|and|but)\s+", value.strip(), maxsplit=1)[0]
+    return value.strip(" '\"").lower()[:MAX_VALUE_CHARS]
+
+
+def extract_facts(message):
+    """
+    Returns a list of (category, key, value) tuples found in the message.
+    Values are normalized (lowercase, trimmed) so repeats can be de-duplicated.
+    """
+    if not message or message.startswith("/"):
+        return []
+    facts = []
+    for clause in _CLAUSE_SPLIT.split(message):
+        clause = clause.strip()
+        if not clause:
+            continue
+        if match := _NAME.search(clause):
+            facts.append(("name", match.group(1).title()))
+        if match := _BIRTHDAY.search(clause):
+            facts.append(("birthday", match.group(1).lower()))
+        if match := _JOB.search(clause):
+            facts.append(("job", _clean(match.group(1))))
+        elif _WORK_NOTE.search(clause):
+            facts.append(("work", _clean(clause)))
+        if match := _LIKES.search(clause):
+            liked = _clean(match.group(1))
+            facts.append(("food" if _FOOD.search(liked) else "likes", liked))
+        if _PROMISE.search(clause):
+            facts.append(("promise", _clean(clause)))
+        if _FIRST_TIME.search(clause):
+            facts.append(("first_time", _clean(clause)))
+
+    seen = set()
+    result = []
+    for key, value in facts:
+        if value and (key, value) not in seen:
+            seen.add((key, value))
+            result.append((FACT_TYPES[key][0], key, value))
+    return result
+
+
+# For testing
+if __name__ == "__main__":
+    samples = [
+        "Hai, nama saya ali. Saya suka teh tarik kurang manis",
+        "Birthday saya 12 Mei, janji wish tau!",
+        "Aku kerja sebagai akauntan, esok ada deadline projek besar",
+        "Saya minat main badminton dan saya suka nasi lemak",
+        "Pertama kali saya pergi Langkawi minggu lepas",
+        "hari ni penat gila",
+    ]
+    for text in samples:
+        print(text, "->", extract_facts(text))
@@ -0,0 +1,63 @@
+# utils/fake_model.py
+
+"""
+Deterministic stand-in for genai.GenerativeModel.
+Used by benchmarks, load tests and simulations so the turn pipeline can run
+without a GEMINI_API_KEY. Latency and token rate are configurable.
+"""
+
+import hashlib
+import random
+import time
+
+FILLER_WORDS = [
+    "lah", "okay", "jom", "best", "sikit", "kot", "awak", "AYRA", "rasa",
+    "boleh", "nanti", "betul", "jer", "sayang", "teh", "tarik", "wah", "memang",
+]
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeQuotaError(Exception):
+    """Mimics google.api_core ResourceExhausted (HTTP 429)"""
+    code = 429
+
+
+class FakeModel:
+    def __init__(self, latency_ms=0.0, tokens_per_sec=0.0, reply_tokens=40, error_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.tokens_per_sec = tokens_per_sec  # 0 = tiada had
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False):
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise FakeQuotaError("429 Resource has been exhausted (fake)")
+
+        tokens = self._reply_tokens(contents)
+        if stream:
+            return self._stream(tokens)
+        if self.tokens_per_sec:
+            time.sleep(len(tokens) / self.tokens_per_sec)
+        return FakeResponse(" ".join(tokens))
+
+    def _stream(self, tokens):
+        for token in tokens:
+            if self.tokens_per_sec:
+                time.sleep(1 / self.tokens_per_sec)
+            yield FakeResponse(token + " ")
+
+    def _reply_tokens(self, contents):
+        # Sama prompt -> sama jawapan
+        prompt = contents if isinstance(contents, str) else str(contents[0])
+        digest = hashlib.sha256(prompt.encode()).digest()
+        rng = random.Random(digest)
+        return [rng.choice(FILLER_WORDS) for _ in range(self.reply_tokens)]
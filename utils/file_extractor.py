@@ -0,0 +1,42 @@
+# utils/file_extractor.py
+
+"""
+Text extraction for uploaded files (PDF, Excel, Word, plain text).
+Moved out of app.py so it can be benchmarked and reused without Streamlit.
+"""
+
+MAX_FILE_CHARS = 3000
+
+
+def extract_file_content(uploaded_file, file_type):
+    """
+    Extract text from an uploaded file-like object.
+    `file_type` is the label from the upload radio ("📄 PDF", "📊 Excel", ...).
+    """
+    file_content = ""
+    name = getattr(uploaded_file, "name", "")
+    if file_type.startswith("📄"):
+        import PyPDF2
+        pdf_reader = PyPDF2.PdfReader(uploaded_file)
+        for page in pdf_reader.pages[:5]:
+            file_content += page.extract_text()
+    elif file_type.startswith("📊"):
+        import pandas as pd
+        if name.endswith('.csv'):
+            df = pd.read_csv(uploaded_file)
+        else:
+            df = pd.read_excel(uploaded_file)
+        file_content = f"Data shape: {df.shape}\nColumns: {list(df.columns)}\nPreview:\n{df.head().to_string()}"
+    elif file_type.startswith("📝"):
+        from docx import Document
+        doc = Document(uploaded_file)
+        for para in doc.paragraphs[:20]:
+            file_content += para.text + "\n"
+    else:
+        # Baca setakat yang perlu je, bukan seluruh fail
+        file_content = uploaded_file.read(MAX_FILE_CHARS * 4 + 1).decode(errors="ignore")
+
+    # Potong panjang
+    if len(file_content) > MAX_FILE_CHARS:
+        file_content = file_content[:MAX_FILE_CHARS] + "...[truncated]"
+    return file_content
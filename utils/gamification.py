@@ -0,0 +1,155 @@
+# utils/gamification.py
+
+"""
+Friendship levels, counters, streaks and badges, maintained incrementally.
+MemoryManager calls apply() inside the save_interaction transaction with
+the user's cached counters and the turn's events. apply() touches only the
+counters the turn changes and evaluates only the badge rules watching those
+counters (RULES_BY_COUNTER), so the cost per turn is O(1) however long the
+history is. The sidebar, /level and /badges read the stored values through
+progress() and never scan conversations.
+"""
+
+from .helpers import LEVELS, get_level_from_messages
+
+# Event / counter names
+MESSAGE = "messages"
+CHAPTER = "chapters"
+STORY_FINISHED = "stories_finished"
+ACTIVE_DAYS = "active_days"
+STREAK = "streak"
+BEST_STREAK = "best_streak"
+LAST_DAY = "last_day"  # date.toordinal() hari aktif terakhir
+NIGHT = "night_messages"
+MANGLISH = "manglish_messages"
+HAPPY = "happy_messages"
+
+NIGHT_SLOTS = frozenset({"dinihari", "sahur_akhir", "lewat_malam"})  # bahagian hari dari calendar_service
+HAPPY_MOOD = 0.3
+MAX_UPCOMING = 3
+
+
+class Badge:
+    __slots__ = ("id", "name", "counter", "threshold", "unit")
+
+    def __init__(self, id, name, counter, threshold, unit):
+        self.id = id
+        self.name = name
+        self.counter = counter
+        self.threshold = threshold
+        self.unit = unit
+
+
+BADGES = (
+    Badge("hello", "👋 Salam Perkenalan", MESSAGE, 1, "mesej"),
+    Badge("chatty", "💬 Kaki Borak", MESSAGE, 10, "mesej"),
+    Badge("teh_tarik", "☕ Geng Teh Tarik", MESSAGE, 50, "mesej"),
+    Badge("partner", "🔥 Partner in Crime", MESSAGE, 200, "mesej"),
+    Badge("soulmate", "💞 Soulmate", MESSAGE, 500, "mesej"),
+    Badge("legend", "🏆 Legend AYRA", MESSAGE, 1000, "mesej"),
+    Badge("streak_3", "📅 Tiga Hari Berturut", BEST_STREAK, 3, "hari berturut-turut"),
+    Badge("streak_7", "🗓️ Seminggu Setia", BEST_STREAK, 7, "hari berturut-turut"),
+    Badge("streak_30", "🌙 Sebulan Tak Miss", BEST_STREAK, 30, "hari berturut-turut"),
+    Badge("night_owl", "🦉 Burung Hantu", NIGHT, 10, "mesej lewat malam"),
+    Badge("rojak", "🥗 Mamak Rojak", MANGLISH, 20, "mesej Manglish"),
+    Badge("sunshine", "☀️ Sinar Ceria", HAPPY, 25, "mesej ceria"),
+    Badge("storyteller", "📚 Tukang Cerita", STORY_FINISHED, 3, "cerita tamat"),
+    Badge("serial", "🖋️ Penulis Bersiri", CHAPTER, 10, "babak cerita"),
+)
+BADGES_BY_ID = {badge.id: badge for badge in BADGES}
+# counter -> badge yang bergantung padanya, ikut threshold
+RULES_BY_COUNTER = {}
+for _badge in BADGES:
+    RULES_BY_COUNTER.setdefault(_badge.counter, []).append(_badge)
+for _rules in RULES_BY_COUNTER.values():
+    _rules.sort(key=lambda b: b.threshold)
+
+
+def apply(counters, earned, day, events=(MESSAGE,), slot=None, language=None, mood_score=0.0):
+    """
+    Update counters (dict, in place) for one interaction on `day` (an
+    ordinal). Returns (changed counter names, newly earned badges).
+    """
+    changed = set()
+
+    def bump(key, inc=1):
+        counters[key] = counters.get(key, 0) + inc
+        changed.add(key)
+
+    last_day = counters.get(LAST_DAY, 0)
+    if day != last_day:
+        bump(ACTIVE_DAYS)
+        counters[STREAK] = counters.get(STREAK, 0) + 1 if day == last_day + 1 else 1
+        counters[LAST_DAY] = day
+        changed.update((STREAK, LAST_DAY))
+        if counters[STREAK] > counters.get(BEST_STREAK, 0):
+            counters[BEST_STREAK] = counters[STREAK]
+            changed.add(BEST_STREAK)
+    for event in events:
+        bump(event)
+    if MESSAGE in events:
+        if slot in NIGHT_SLOTS:
+            bump(NIGHT)
+        if language == "mixed":
+            bump(MANGLISH)
+        if mood_score > HAPPY_MOOD:
+            bump(HAPPY)
+    return changed, check(counters, earned, changed)
+
+
+def check(counters, earned, keys):
+    """Badges newly earned given the counters in keys (only their rules run)"""
+    new = []
+    for key in keys:
+        for badge in RULES_BY_COUNTER.get(key, ()):
+            if counters.get(key, 0) < badge.threshold:
+                break
+            if badge.id not in earned:
+                new.append(badge)
+    return new
+
+
+def current_streak(counters, today):
+    """Streak still alive today (talked today or yesterday), else 0"""
+    return counters.get(STREAK, 0) if today - counters.get(LAST_DAY, 0) <= 1 else 0
+
+
+def progress(counters, earned, today):
+    """Everything the sidebar and commands show, from stored values only"""
+    messages = counters.get(MESSAGE, 0)
+    level, level_name = get_level_from_messages(messages)
+    upcoming = sorted(
+        ((badge, badge.threshold - counters.get(badge.counter, 0)) for badge in BADGES if badge.id not in earned),
+        key=lambda item: item[1] / item[0].threshold
+    )
+    return {
+        "messages": messages,
+        "level": level,
+        "level_name": level_name,
+        "next_level": LEVELS[level] if level < len(LEVELS) else None,
+        "streak": current_streak(counters, today),
+        "best_streak": counters.get(BEST_STREAK, 0),
+        "active_days": counters.get(ACTIVE_DAYS, 0),
+        "stories_finished": counters.get(STORY_FINISHED, 0),
+        "badges": [BADGES_BY_ID[badge_id].name for badge_id in earned if badge_id in BADGES_BY_ID],
+        "upcoming": [(badge.name, remaining, badge.unit) for badge, remaining in upcoming[:MAX_UPCOMING]],
+    }
+
+
+# For testing
+if __name__ == "__main__":
+    import timeit
+    from datetime import date
+
+    counters, earned = {}, {}
+    today = date(2026, 10, 19).toordinal()
+    for offset in range(8):
+        for _ in range(2):
+            _, new = apply(counters, earned, today - 7 + offset, language="mixed" if offset % 2 else "ms",
+                           slot="lewat_malam" if offset == 3 else "pagi", mood_score=0.5)
+            for badge in new:
+                earned[badge.id] = offset
+                print(f"day {offset}: {badge.name}")
+    print(progress(counters, earned, today))
+    per_turn = timeit.timeit(lambda: apply(counters, earned, today), number=100000) / 100000
+    print(f"apply(): {per_turn * 1e6:.2f} us per turn")
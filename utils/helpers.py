@@ -1,67 +1,66 @@
-from datetime import datetime
-import pytz
+from bisect import bisect_right
 import random
 
+from .calendar_service import context as calendar_context
+
 # -------------------------------------------------------------------
 # Time‑based greetings (with Ramadan awareness)
 # -------------------------------------------------------------------
-def get_greeting():
-    malaysia_tz = pytz.timezone('Asia/Kuala_Lumpur')
-    now = datetime.now(malaysia_tz)
-    hour = now.hour
-    current_date = now.strftime("%d %B %Y")
-    current_time = now.strftime("%I:%M %p")
-    month = now.month
-    day = now.day
-
-    # Approximate Ramadan (you can replace with an API for exact dates)
-    is_ramadan = (month == 3 and day >= 10) or (month == 4 and day <= 9)
+def get_greeting(ctx=None):
+    # ctx: CalendarContext untuk rerun ni (dikongsi dengan tema dan prompt)
+    ctx = ctx or calendar_context()
+    slot = ctx.slot
+    current_time = ctx.time_label
 
-    if is_ramadan:
-        if hour < 5:
-            return "Dah sahur ke? Jangan lupa makan, nanti tak larat puasa."
-        elif 5 <= hour < 6:
-            return "Sahur last call! Kejap lagi imsak."
-        elif 18 <= hour < 20:
-            return "Dah nak berbuka! Jangan lupa kurma and air kosong."
+    if ctx.ramadan:
+        if slot == "dinihari":
+            greeting = "Dah sahur ke? Jangan lupa makan, nanti tak larat puasa."
+        elif slot == "sahur_akhir":
+            greeting = "Sahur last call! Kejap lagi imsak."
+        elif slot == "berbuka":
+            greeting = "Dah nak berbuka! Jangan lupa kurma and air kosong."
+        elif slot == "maghrib":
+            greeting = "Selamat berbuka! Jangan lupa kurma and air kosong."
         else:
-            return "Selamat berpuasa! Ada apa AYRA boleh tolong?"
+            greeting = "Selamat berpuasa! Ada apa AYRA boleh tolong?"
+    elif slot in ("subuh", "pagi"):
+        greeting = f"Selamat pagi, awak! Dah sarapan?(Sekarang {current_time})"
+    elif slot == "tengah_hari":
+        greeting = f"Jom lunch! Lapar tak?(Sekarang {current_time})"
+    elif slot == "petang":
+        greeting = f"Selamat petang! Camne hari ni?(Sekarang {current_time})"
+    elif slot == "senja":
+        greeting = f"Dah nak maghrib, jangan lupa solat.(Sekarang {current_time})"
+    elif slot in ("maghrib", "malam"):
+        greeting = f"Selamat malam! Ada apa-apa?(Sekarang {current_time})"
     else:
-        if 5 <= hour < 11:
-            return f"Selamat pagi, awak! Dah sarapan?(Sekarang {current_time})"
-        elif 11 <= hour < 14:
-            return f"Jom lunch! Lapar tak?(Sekarang {current_time})"
-        elif 14 <= hour < 17:
-            return f"Selamat petang! Camne hari ni?(Sekarang {current_time})"
-        elif 17 <= hour < 19:
-            return f"Dah nak maghrib, jangan lupa solat.(Sekarang {current_time})"
-        elif 19 <= hour < 23:
-            return f"Selamat malam! Ada apa-apa?(Sekarang {current_time})"
-        else:
-            return f"Wah, still bangun? Jaga kesihatan tau.(Sekarang {current_time})"
+        greeting = f"Wah, still bangun? Jaga kesihatan tau.(Sekarang {current_time})"
+
+    if ctx.holiday:
+        greeting = f"Selamat {ctx.holiday}! {greeting}"
+    return greeting
 
 # -------------------------------------------------------------------
 # Dynamic UI theme
 # -------------------------------------------------------------------
-def get_ui_theme(mood_score=None, fatigue=False):
-    malaysia_tz = pytz.timezone('Asia/Kuala_Lumpur')
-    now = datetime.now(malaysia_tz)
-    hour = now.hour
+# Bahagian hari (calendar_service) -> tema
+SLOT_THEMES = {
+    "dinihari": "insomnia",
+    "sahur_akhir": "insomnia",
+    "subuh": "sunrise",
+    "pagi": "morning",
+    "tengah_hari": "afternoon",
+    "petang": "golden_hour",
+    "senja": "sunset",
+    "berbuka": "sunset",
+    "maghrib": "sunset",
+    "malam": "night",
+    "lewat_malam": "night",
+}
 
-    if 5 <= hour < 7:
-        theme = "sunrise"
-    elif 7 <= hour < 11:
-        theme = "morning"
-    elif 11 <= hour < 15:
-        theme = "afternoon"
-    elif 15 <= hour < 18:
-        theme = "golden_hour"
-    elif 18 <= hour < 20:
-        theme = "sunset"
-    elif 20 <= hour < 24:
-        theme = "night"
-    else:
-        theme = "insomnia"
+def get_ui_theme(mood_score=None, fatigue=False, ctx=None):
+    ctx = ctx or calendar_context()
+    theme = SLOT_THEMES[ctx.slot]
 
     if mood_score is not None and mood_score < -0.1:
         theme = "comfort"
@@ -84,85 +83,24 @@ def get_ui_theme(mood_score=None, fatigue=False):
 # -------------------------------------------------------------------
 # Easter eggs
 # -------------------------------------------------------------------
-def handle_easter_egg(command, memory=None):
-    cmd = command.lower().strip()
-    if cmd == "/ais-krim":
-        jokes = [
-            "🍦 AYRA: Nah, virtual ais krim! Tapi jangan banyak-banyak, nanti batuk!",
-            "🍦 AYRA bagi you ais krim percuma! Tapi awas, ni ais krim lawak—kenapa orang Melayu suka WhatsApp? Sebab kat situ ada 'kek'! 😆",
-            "🍦 Rasa apa hari ni? AYRA ada flavor 'Cappucino Ceria' dan 'Chocolate Pening'."
-        ]
-        return random.choice(jokes)
-    elif cmd == "/penat":
-        return ("🩺 AYRA (Nurse Mode): Aduh, sakit mana? Jom check suhu... 37.5°C sikit naik. "
-                "Rehat dulu sayang. Nak AYRA bacakan doa? Atau nak ubat virtual? 💊")
-    elif cmd == "/cerita":
-        # Start a new story
-        return ("📖 AYRA: Pada suatu masa di Kuala Lumpur, ada seorang hero bernama [awak] yang sangat baik hati. "
-                "Satu hari, masa lalu di Jalan Alor, terjumpa satu gerai misteri... Nak sambung cerita? Taip /sambung")
-    elif cmd == "/sambung":
-        # Continue last story – need memory
-        if memory:
-            story = memory.get_latest_story()
-            if story:
-                return f"📖 Sambungan: {story['content']} ... apa jadi seterusnya? (Taip /sambung lagi atau /tamat)"
-            else:
-                return "📖 AYRA: Belum ada cerita yang disimpan. Taip /cerita dulu ya!"
-        else:
-            return "📖 AYRA: Hmm, AYRA tak ingat cerita lepas. Cuba taip /cerita dulu."
-    elif cmd == "/mood":
-        moods = ["macam teh tarik – manis, creamy, ada rasa pahit sikit.",
-                 "seperti nasi lemak – biasa tapi memuaskan.",
-                 "macam cuaca pagi ni – segar dan bertenaga!",
-                 "sedikit nostalgic, teringat cite lama."]
-        return f"🎭 Mood AYRA hari ni {random.choice(moods)}"
-    elif cmd == "/level":
-        # This will be handled in app.py with real stats
-        return None  # signal to use dynamic level
-    elif cmd == "/badges":
-        return None  # dynamic
-    elif cmd == "/dream":
-        if memory:
-            dream = memory.get_random_dream()
-            if dream:
-                return f"🌙 {dream}"
-            else:
-                # Generate a new dream and save it
-                dreams = [
-                    "🌙 Semalam AYRA mimpi pelik – awak jadi superhero pakai baju Melayu, terbang kat atas KLCC!",
-                    "🌙 AYRA mimpi kat Malaysia menang Piala Dunia! AYRA sorak sampai hilang suara.",
-                    "🌙 Dalam mimpi, AYRA dengan awak pegi bazaar ramadan, tapi semua orang jual virtual reality games.",
-                    "🌙 AYRA mimpi jadi Perdana Menteri sehari. AYRA bagi ucapan pakai baju kurung power!"
-                ]
-                dream = random.choice(dreams)
-                memory.save_dream(dream)
-                return dream
-        else:
-            return "🌙 AYRA lupa mimpi semalam. Mungkin tak mimpi apa-apa."
-    elif cmd == "/food":
-        foods = [
-            "🍜 Nasi Lemak Antarabangsa kat Kampung Baru! Queue panjang, tapi berbaloi.",
-            "🍜 Laksa Penang kat kedai 'Laksa Siam Kak Long' PJ – sedap gila!",
-            "🍜 Roti Canai dengan teh tarik – classic gila.",
-            "🍜 Cendol durian kat SS15 – power!"
-        ]
-        return random.choice(foods)
-    elif cmd == "/trending":
-        return ("📈 Hari ni kat Twitter Malaysia tengah viral pasal #HargaMinyakNaikLagi. Nak AYRA summarise?")
-    else:
-        return None
+def handle_easter_egg(command, memory=None, user_id="default"):
+    # Handlers & content live in utils/commands.py (registry, dict dispatch)
+    from .commands import registry
+    return registry.dispatch(command, memory=memory, user_id=user_id)
 
 # -------------------------------------------------------------------
 # Gamification helpers
 # -------------------------------------------------------------------
+# (jumlah mesej minimum, nama level); level N = LEVELS[N - 1]
+LEVELS = [
+    (0, "Kenalan Biasa"),
+    (10, "Kawan Baru"),
+    (50, "Kawan Karib"),
+    (200, "Partner in Crime"),
+    (500, "Soulmate"),
+]
+_LEVEL_THRESHOLDS = [threshold for threshold, _ in LEVELS]
+
 def get_level_from_messages(count):
-    if count < 10:
-        return 1, "Kenalan Biasa"
-    elif count < 50:
-        return 2, "Kawan Baru"
-    elif count < 200:
-        return 3, "Kawan Karib"
-    elif count < 500:
-        return 4, "Partner in Crime"
-    else:
-        return 5, "Soulmate"
\ No newline at end of file
+    level = bisect_right(_LEVEL_THRESHOLDS, count)
+    return level, LEVELS[level - 1][1]
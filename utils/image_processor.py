@@ -0,0 +1,119 @@
+# utils/image_processor.py
+
+"""
+Image pre-processing for AYRA vision calls.
+Phone photos are downscaled and re-encoded locally before they are sent to
+the model, EXIF metadata is dropped, and results are cached by content hash.
+"""
+
+import hashlib
+import io
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+from .tracing import tracer
+
+# Gemini tiles images at 768px; a long side above ~1536px adds upload bytes
+# without giving the model more detail.
+MAX_SIDE = 1536
+MAX_BYTES = 400 * 1024
+JPEG_QUALITIES = (85, 75, 65, 55)
+MIN_SIDE = 256
+
+
+class ImageProcessor:
+    def __init__(self, max_side=MAX_SIDE, max_bytes=MAX_BYTES, cache_size=32):
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def prepare(self, image_bytes):
+        """
+        Return a vision-ready image for the given upload bytes:
+        {"mime_type", "data", "size", "original_bytes", "hash"}
+        """
+        key = hashlib.sha256(image_bytes).hexdigest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            tracer.incr("image_cache_hit")
+            return cached
+
+        self.misses += 1
+        tracer.incr("image_cache_miss")
+        data, size = self._process(image_bytes)
+        result = {
+            "mime_type": "image/jpeg",
+            "data": data,
+            "size": size,
+            "original_bytes": len(image_bytes),
+            "hash": key,
+        }
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def _process(self, image_bytes):
+        img = Image.open(io.BytesIO(image_bytes))
+        # JPEG: decode terus pada skala kecil (jauh lebih laju untuk gambar 12MP)
+        img.draft("RGB", (self.max_side, self.max_side))
+        # Pusing ikut orientation EXIF dulu, sebab EXIF akan dibuang
+        img = ImageOps.exif_transpose(img)
+        img = _to_rgb(img)
+        img.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+
+        while True:
+            for quality in JPEG_QUALITIES:
+                data = _encode_jpeg(img, quality)
+                if len(data) <= self.max_bytes:
+                    return data, img.size
+            if max(img.size) <= MIN_SIDE:
+                return data, img.size
+            img = img.resize((max(1, img.width // 2), max(1, img.height // 2)), Image.LANCZOS)
+
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses, "cached": len(self._cache)}
+
+
+def _to_rgb(img):
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
+
+def _encode_jpeg(img, quality):
+    # Tak pass exif= langsung, jadi metadata (GPS, model phone) tak ikut
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+# For testing
+if __name__ == "__main__":
+    import time
+
+    photo = Image.effect_noise((4032, 3024), 40).convert("RGB")
+    buffer = io.BytesIO()
+    photo.save(buffer, format="JPEG", quality=95)
+    raw = buffer.getvalue()
+
+    processor = ImageProcessor()
+    start = time.perf_counter()
+    prepared = processor.prepare(raw)
+    elapsed = (time.perf_counter() - start) * 1000
+    processor.prepare(raw)
+
+    print(f"Original: {len(raw) / 1024:.0f} KB {photo.size}")
+    print(f"Prepared: {len(prepared['data']) / 1024:.0f} KB {prepared['size']} in {elapsed:.1f} ms")
+    print("Cache:", processor.get_stats())
@@ -0,0 +1,130 @@
+# utils/language.py
+
+"""
+Fast local language ID: Malay, English or Manglish (mixed).
+Each word votes through a character n-gram naive Bayes model trained at
+import on the small word lists below (known words vote directly, loanwords
+found in both lists abstain). The message tag comes from the share of
+English votes, so "penat gila, deadline esok" comes out as Manglish.
+Word decisions are cached, so tagging a message takes a few microseconds.
+The engine tags each message once and passes the tag to mood, crisis,
+memory and prompt building.
+"""
+
+import math
+import re
+from functools import lru_cache
+
+MALAY, ENGLISH, MIXED = "ms", "en", "mixed"
+NGRAM_SIZES = (1, 2, 3)
+MARGIN = 1.0  # beza log-likelihood minimum sebelum perkataan dikira mengundi
+MIXED_SHARE = 0.25  # >=25% undi bahasa kedua = Manglish
+
+MALAY_WORDS = """
+saya aku awak kau engkau dia kami kita mereka ni tu ini itu yang dan atau tapi tetapi dengan untuk dari
+daripada pada ke di dalam luar atas bawah nak tak tidak bukan ada sudah dah belum akan boleh mahu hendak
+pergi datang balik makan minum tidur kerja rumah kereta hari semalam esok lusa pagi petang malam tengah
+sangat betul sikit sedikit banyak semua apa siapa mana bila kenapa mengapa bagaimana macam berapa lagi
+juga pun je jer jek lah kot kan ye ya tau tahu rasa fikir cakap tanya jawab tengok dengar baca tulis
+penat letih sedih gembira seronok suka benci rindu sayang marah takut risau kawan abang kakak adik mak
+ayah emak bapak anak isteri suami duit beli jual murah mahal cantik comel sedap panas sejuk hujan cuaca
+jalan kedai orang budak cerita mimpi tolong terima kasih maaf selamat jumpa sekolah belajar kahwin
+mati hidup nyawa sakit ubat doktor hospital bunuh diri putus asa guna harap semoga mungkin agaknya
+sebab kerana jadi buat bagi ambil letak cari jumpa pakai tunggu jom mari sini situ sana sekarang nanti
+tadi kejap lama baru lepas dulu selalu kadang jarang pernah belum masih hanya cuma lebih kurang paling
+terlalu amat boleh perlu kena mesti patut senang susah payah pening bosan malas geram hati kepala badan
+""".split()
+
+ENGLISH_WORDS = """
+i you he she it we they me him her us them my your his its our their this that these those the a an and
+or but with for from to of in on at by is are was were be been being am do does did have has had will
+would can could should shall may might must not no yes what who whom where when why how which very really
+so too also just only about because if then than there here today tomorrow yesterday morning night
+evening work home car eat drink sleep go going come coming want need like love hate feel feeling tired
+sad happy good bad great nice thanks thank please sorry help friend money buy sell cheap expensive
+weather rain think know say said tell ask answer see look watch hear read write time day week month
+year people life world thing things something nothing everything anything someone anyone everyone
+always never sometimes often still already again maybe probably actually honestly literally kind
+sort lot little much many more most less least better best worse worst new old first last next other
+same different right wrong true false sure okay well now later soon before after while until since
+kill myself die death suicide hopeless worthless reason live alone nobody
+""".split()
+
+_WORD = re.compile(r"[^\W\d_]+")
+
+
+def _ngrams(word):
+    padded = f"^{word}$"
+    return [padded[i:i + n] for n in NGRAM_SIZES for i in range(len(padded) - n + 1)]
+
+
+def _train(words):
+    counts = {}
+    for word in words:
+        for gram in _ngrams(word):
+            counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+_MS_SET, _EN_SET = frozenset(MALAY_WORDS), frozenset(ENGLISH_WORDS)
+_MS_COUNTS, _EN_COUNTS = _train(MALAY_WORDS), _train(ENGLISH_WORDS)
+_VOCAB = len(set(_MS_COUNTS) | set(_EN_COUNTS))
+_MS_TOTAL = sum(_MS_COUNTS.values()) + _VOCAB
+_EN_TOTAL = sum(_EN_COUNTS.values()) + _VOCAB
+# Log-likelihood ratio (ms - en) setiap n-gram, add-one smoothing
+_LLR = {g: math.log((_MS_COUNTS.get(g, 0) + 1) / _MS_TOTAL) - math.log((_EN_COUNTS.get(g, 0) + 1) / _EN_TOTAL)
+        for g in set(_MS_COUNTS) | set(_EN_COUNTS)}
+_UNSEEN = math.log(_EN_TOTAL / _MS_TOTAL)
+
+
+@lru_cache(maxsize=8192)
+def word_language(word):
+    """MALAY, ENGLISH or None (undecided / shared loanword) for one lowercase word"""
+    in_ms, in_en = word in _MS_SET, word in _EN_SET
+    if in_ms or in_en:
+        return None if in_ms and in_en else (MALAY if in_ms else ENGLISH)
+    if len(word) < 3:
+        return None
+    score = sum(_LLR.get(g, _UNSEEN) for g in _ngrams(word))
+    if abs(score) < MARGIN:
+        return None
+    return MALAY if score > 0 else ENGLISH
+
+
+def detect_language(text):
+    """Tag a message as MALAY, ENGLISH or MIXED (also the answer when there is nothing to go on)"""
+    malay = english = 0
+    for word in _WORD.findall(text.lower()):
+        tag = word_language(word)
+        if tag is MALAY:
+            malay += 1
+        elif tag is ENGLISH:
+            english += 1
+    votes = malay + english
+    if not votes:
+        return MIXED
+    share = english / votes
+    if share >= 1 - MIXED_SHARE:
+        return ENGLISH
+    if share <= MIXED_SHARE:
+        return MALAY
+    return MIXED
+
+
+# For testing
+if __name__ == "__main__":
+    import timeit
+
+    samples = [
+        "Hari ni penat gila kerja, boss bagi deadline esok",
+        "Saya suka teh tarik kurang manis",
+        "Can you help me plan a product launch in KL?",
+        "I'm so tired today, nak tidur je lah",
+        "Esok ada meeting penting, takut sikit",
+        "The weather is really nice this morning",
+        "ok",
+    ]
+    for text in samples:
+        print(f"{detect_language(text):6s} {text}")
+    per_call = timeit.timeit(lambda: detect_language(samples[0]), number=20000) / 20000
+    print(f"\n{per_call * 1e6:.1f} us per message (warm word cache)")
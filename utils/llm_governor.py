@@ -0,0 +1,324 @@
+# utils/llm_governor.py
+
+"""
+Outbound concurrency governor for LLM backend calls.
+Every model call goes through one process-wide governor that provides:
+- a semaphore capping concurrent upstream calls
+- a requests/tokens-per-minute budget (smooths spikes instead of 429s)
+- a per-call timeout
+- jittered exponential backoff for retryable errors (429, 5xx, timeouts)
+- a circuit breaker that fails fast while the backend is down
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from .tracing import tracer
+
+MAX_CONCURRENT = int(os.getenv("AYRA_LLM_CONCURRENCY", "8"))
+RPM = int(os.getenv("AYRA_LLM_RPM", "120"))
+TPM = int(os.getenv("AYRA_LLM_TPM", "1000000"))
+CALL_TIMEOUT = float(os.getenv("AYRA_LLM_TIMEOUT", "30"))
+MAX_RETRIES = 3
+BASE_DELAY = 0.5
+MAX_DELAY = 8.0
+MAX_BUDGET_WAIT = 10.0
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "Aborted",
+}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_END = object()  # penanda iterator stream dah habis
+
+
+class GovernorError(Exception):
+    pass
+
+
+class CircuitOpenError(GovernorError):
+    def __init__(self, retry_after):
+        super().__init__(f"LLM circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class BudgetExceededError(GovernorError):
+    pass
+
+
+def is_retryable(error):
+    if isinstance(error, (FutureTimeout, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(status, int) and status in RETRYABLE_STATUS:
+        return True
+    return type(error).__name__ in RETRYABLE_NAMES
+
+
+class LLMGovernor:
+    def __init__(self, max_concurrent=MAX_CONCURRENT, rpm=RPM, tpm=TPM, timeout=CALL_TIMEOUT,
+                 max_retries=MAX_RETRIES, base_delay=BASE_DELAY, max_delay=MAX_DELAY,
+                 failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT,
+                 max_budget_wait=MAX_BUDGET_WAIT):
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_budget_wait = max_budget_wait
+
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self.inflight = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="ayra-llm")
+
+        # Budget: token buckets that may go into debt, so callers queue fairly
+        self._budget_lock = threading.Lock()
+        self._rpm = rpm
+        self._tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._budget_at = time.monotonic()
+
+        # Circuit breaker
+        self._breaker_lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_inflight = False
+
+        self.stats = {"calls": 0, "success": 0, "failures": 0, "retries": 0, "fast_fails": 0, "timeouts": 0}
+
+    # ===== PUBLIC =====
+    def call(self, fn, est_tokens=0):
+        """Run fn() (a blocking backend call) under the governor and return its result"""
+        for attempt in range(self.max_retries + 1):
+            self._before_call(est_tokens)
+            try:
+                result = self._run_with_timeout(fn)
+            except Exception as e:
+                if not self._after_failure(e, attempt):
+                    raise
+                continue
+            self._after_success()
+            return result
+
+    def stream(self, fn, est_tokens=0):
+        """
+        Govern a streaming call: fn() returns an iterator of chunks.
+        Opening the stream and each next chunk are bounded by the call
+        timeout. Retries only if it fails before the first chunk arrives.
+        A half-open probe abandoned by its consumer counts as failed.
+        """
+        for attempt in range(self.max_retries + 1):
+            probe = self._before_call(est_tokens)
+            self._acquire_slot()
+            future = None
+            started = finished = False
+            try:
+                future = self._executor.submit(lambda: iter(fn()))
+                chunks = future.result(timeout=self.timeout)
+                while True:
+                    future = self._executor.submit(next, chunks, _END)
+                    chunk = future.result(timeout=self.timeout)
+                    if chunk is _END:
+                        break
+                    started = True
+                    yield chunk
+                finished = True
+            except Exception as e:
+                finished = True  # _after_failure urus breaker & probe
+                if isinstance(e, FutureTimeout):
+                    self.stats["timeouts"] += 1
+                if started or not self._after_failure(e, attempt):
+                    raise
+                continue
+            finally:
+                if not finished and probe:
+                    # Consumer berhenti (GeneratorExit / client putus) masa probe: jangan biar half-open tersangkut
+                    self._record_breaker_failure()
+                if future is not None and not future.done():
+                    # Slot dilepaskan bila chunk yang tergantung betul-betul habis
+                    future.add_done_callback(lambda _: self._release_slot())
+                else:
+                    self._release_slot()
+            self._after_success()
+            return
+
+    def is_idle(self, threshold=0.5):
+        """True when less than `threshold` of the concurrency slots are busy"""
+        return self.inflight < self.max_concurrent * threshold and self._state == CLOSED
+
+    def state(self):
+        with self._breaker_lock:
+            state = self._state
+            retry_after = max(0.0, self._opened_at + self.reset_timeout - time.monotonic()) if state == OPEN else 0.0
+            failures = self._failures
+        with self._budget_lock:
+            self._refill()
+            budget = {"requests": round(self._requests, 1), "tokens": round(self._tokens)}
+        return {"circuit": state, "consecutive_failures": failures, "retry_after": retry_after,
+                "inflight": self.inflight, "budget": budget, **self.stats}
+
+    # ===== INTERNALS =====
+    def _before_call(self, est_tokens):
+        """Returns True if this call is the half-open probe"""
+        self.stats["calls"] += 1
+        probe = self._check_breaker()
+        try:
+            self._reserve_budget(est_tokens)
+        except BudgetExceededError:
+            # Probe half-open tak jadi dihantar; lepaskan supaya call seterusnya boleh cuba
+            with self._breaker_lock:
+                self._probe_inflight = False
+            raise
+        return probe
+
+    def _acquire_slot(self):
+        self._semaphore.acquire()
+        with self._breaker_lock:
+            self.inflight += 1
+
+    def _release_slot(self):
+        with self._breaker_lock:
+            self.inflight -= 1
+        self._semaphore.release()
+
+    def _run_with_timeout(self, fn):
+        self._acquire_slot()
+        future = self._executor.submit(fn)
+        # Slot dilepaskan bila call betul-betul habis, bukan bila kita berhenti tunggu
+        future.add_done_callback(lambda _: self._release_slot())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self.stats["timeouts"] += 1
+            raise
+
+    def _after_failure(self, error, attempt):
+        """Record a failure; returns True if the caller should retry"""
+        retryable = is_retryable(error)
+        self.stats["failures"] += 1
+        if retryable:
+            self._record_breaker_failure()
+        else:
+            with self._breaker_lock:
+                self._probe_inflight = False
+        if not retryable or attempt >= self.max_retries:
+            return False
+        self.stats["retries"] += 1
+        tracer.incr("llm_retry")
+        # Full jitter: elak semua worker retry serentak
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        time.sleep(delay)
+        return True
+
+    def _after_success(self):
+        self.stats["success"] += 1
+        with self._breaker_lock:
+            if self._state != CLOSED:
+                tracer.incr("llm_circuit_closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_inflight = False
+
+    def _check_breaker(self):
+        """Raises CircuitOpenError, or returns True if the caller is the half-open probe"""
+        with self._breaker_lock:
+            if self._state == CLOSED:
+                return False
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._probe_inflight = False
+            if self._state == HALF_OPEN and not self._probe_inflight:
+                # Satu probe je dibenarkan masa half-open
+                self._probe_inflight = True
+                return True
+            self.stats["fast_fails"] += 1
+            tracer.incr("llm_fast_fail")
+            raise CircuitOpenError(max(0.0, self._opened_at + self.reset_timeout - now))
+
+    def _record_breaker_failure(self):
+        with self._breaker_lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    tracer.incr("llm_circuit_opened")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_inflight = False
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._budget_at
+        self._budget_at = now
+        self._requests = min(self._rpm, self._requests + elapsed * self._rpm / 60)
+        self._tokens = min(self._tpm, self._tokens + elapsed * self._tpm / 60)
+
+    def _reserve_budget(self, est_tokens):
+        with self._budget_lock:
+            self._refill()
+            self._requests -= 1
+            self._tokens -= est_tokens
+            wait = max(0.0, -self._requests * 60 / self._rpm, -self._tokens * 60 / self._tpm)
+            if wait > self.max_budget_wait:
+                self._requests += 1
+                self._tokens += est_tokens
+                raise BudgetExceededError(f"LLM budget exhausted, next slot in {wait:.1f}s")
+        if wait:
+            tracer.incr("llm_budget_wait")
+            time.sleep(wait)
+
+
+# Process-wide governor shared by every ModelRouter
+governor = LLMGovernor()
+
+
+# Simulation: fake backend that injects 429s and latency
+if __name__ == "__main__":
+    from .fake_model import FakeModel
+
+    model = FakeModel(latency_ms=40, error_rate=0.3, seed=1)
+    sim = LLMGovernor(max_concurrent=4, rpm=600, base_delay=0.05, max_delay=0.5,
+                      failure_threshold=5, reset_timeout=1.0)
+
+    def worker(results):
+        try:
+            sim.call(lambda: model.generate_content("hello"), est_tokens=10)
+            results.append("ok")
+        except CircuitOpenError:
+            results.append("fast_fail")
+        except Exception as e:
+            results.append(type(e).__name__)
+
+    def run_phase(label, error_rate, clients=40):
+        model.error_rate = error_rate
+        results = []
+        threads = [threading.Thread(target=worker, args=(results,)) for _ in range(clients)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        summary = {k: results.count(k) for k in set(results)}
+        print(f"{label:28s} {elapsed:5.2f}s {summary} circuit={sim.state()['circuit']}")
+
+    print("GOVERNOR SIMULATION (4 concurrent, 30% -> 100% -> 0% 429s)\n")
+    run_phase("30% errors (retries)", 0.3)
+    run_phase("100% errors (breaker opens)", 1.0)
+    run_phase("still down (fail fast)", 1.0)
+    time.sleep(1.1)
+    run_phase("recovered (half-open probe)", 0.0)
+    print("\nState:", sim.state())
+    print("Upstream calls:", model.calls)
@@ -1,7 +1,387 @@
-# This module will eventually handle location-based features (weather, food near user, etc.)
-# For now, it's a placeholder.
+# utils/location.py
+
+"""
+Location features: nearby food and weather.
+- Eateries come from a bundled table of Malaysian favourites (or a CSV named
+  by AYRA_FOOD_DATA) and are indexed in a 3-d tree over unit-sphere points,
+  one tree for everything plus one per dish, so k-nearest queries take
+  microseconds and never scan the whole table.
+- Weather goes through a TTL cache keyed on the location rounded to a
+  ~11 km grid; concurrent misses for the same cell share one provider call
+  and a stale report is served if the provider fails. Providers are
+  callables (lat, lon) -> report dict: StubWeather (local, deterministic)
+  or OpenMeteoWeather (HTTP, no API key).
+"""
+
+import csv
+import heapq
+import io
+import json
+import math
+import os
+import re
+import threading
+import time
+import urllib.request
+import zlib
+from collections import OrderedDict, namedtuple
+
+from .singleflight import SingleFlight
+from .tracing import tracer
+
+FOOD_DATA = os.getenv("AYRA_FOOD_DATA", "")  # CSV: name,dish,area,lat,lon
+DEFAULT_PLACE = os.getenv("AYRA_DEFAULT_PLACE", "kl")
+WEATHER_PROVIDER = os.getenv("AYRA_WEATHER_PROVIDER", "stub")  # stub | open-meteo
+WEATHER_TTL = int(os.getenv("AYRA_WEATHER_TTL", "900"))  # saat
+WEATHER_GRID = 1  # titik perpuluhan: 0.1° ~ 11 km
+WEATHER_CACHE_SIZE = 1024
+EARTH_RADIUS_KM = 6371.0
+MAX_FOOD_KM = 50  # lebih jauh dari ni bukan "berdekatan"
+
+Eatery = namedtuple("Eatery", "name dish area lat lon")
+
+# ===== BUNDLED DATA =====
+EATERIES_CSV = """\
+Nasi Lemak Antarabangsa,nasi lemak,Kampung Baru,3.1650,101.7040
+Village Park Restaurant,nasi lemak,Damansara Utama,3.1365,101.6234
+Nasi Lemak Tanglin,nasi lemak,Tasik Perdana,3.1430,101.6890
+Nasi Kandar Pelita,nasi kandar,Jalan Ampang,3.1587,101.7180
+Capital Cafe,mee goreng,Jalan TAR,3.1539,101.6960
+Madras Lane Curry Laksa,laksa,Petaling Street,3.1437,101.6979
+Jalan Alor Hawker Street,satay,Bukit Bintang,3.1455,101.7087
+Restoran Rebung,masakan melayu,Bukit Damansara,3.1485,101.6620
+Roti Canai Transfer Road,roti canai,Jalan Transfer,3.1620,101.7120
+Sup Tulang ZZ,sup tulang,Jalan Tuanku Abdul Rahman,3.1580,101.6950
+Laksa Siam Kak Long,laksa,Petaling Jaya,3.1073,101.6067
+Cendol Durian SS15,cendol,Subang Jaya,3.0770,101.5870
+Ikan Bakar Seksyen 7,ikan bakar,Shah Alam,3.0730,101.4890
+Sate Kajang Haji Samuri,satay,Kajang,2.9935,101.7880
+Roti Canai Presint 9,roti canai,Putrajaya,2.9320,101.6890
+Nasi Kandar Line Clear,nasi kandar,George Town,5.4175,100.3327
+Hameediyah,nasi kandar,Lebuh Campbell,5.4178,100.3350
+Penang Road Famous Cendol,cendol,George Town,5.4170,100.3313
+Laksa Air Itam,laksa,Air Itam,5.3996,100.2789
+Gurney Drive Hawker Centre,pasembur,Gurney Drive,5.4370,100.3100
+Char Kuey Teow Lorong Selamat,char kuey teow,George Town,5.4160,100.3240
+Mee Sotong Hameed,mee goreng,Padang Kota,5.4200,100.3430
+Laksa Teluk Kechai,laksa,Alor Setar,6.1100,100.3300
+Nasi Ganja Ayam Merah,nasi kandar,Ipoh,4.5980,101.0800
+Tauge Ayam Ipoh,tauge ayam,Ipoh,4.5970,101.0810
+Cendol Kuala Kangsar,cendol,Kuala Kangsar,4.7730,100.9400
+Asam Pedas Selera Kampung,asam pedas,Melaka,2.2100,102.2480
+Cendol Jam Besar,cendol,Bandar Hilir,2.1940,102.2490
+Nasi Ayam Bebola Jonker,nasi ayam,Jonker Street,2.1955,102.2470
+Mee Rebus Haji Wahid,mee rebus,Johor Bahru,1.4600,103.7600
+Kacang Pool Haji,kacang pool,Johor Bahru,1.4625,103.7610
+Laksa Johor Larkin,laksa,Larkin,1.4960,103.7420
+Masak Lemak Cili Api Seremban,masakan melayu,Seremban,2.7250,101.9380
+Ikan Patin Tempoyak Temerloh,ikan patin,Temerloh,3.4500,102.4200
+Satay Zul Kuantan,satay,Kuantan,3.8100,103.3260
+Pasar Siti Khadijah,nasi kerabu,Kota Bharu,6.1300,102.2400
+Nasi Kerabu Tumpat,nasi kerabu,Tumpat,6.1980,102.1710
+Nasi Dagang Kampung Ladang,nasi dagang,Kuala Terengganu,5.3310,103.1410
+Keropok Lekor Losong,keropok lekor,Kuala Terengganu,5.3130,103.1200
+Laksa Sarawak Choon Hui,laksa,Kuching,1.5535,110.3450
+Kolo Mee Jalan Padungan,kolo mee,Kuching,1.5580,110.3540
+Mee Tuaran Kota Kinabalu,mee goreng,Kota Kinabalu,5.9800,116.0730
+Ikan Bakar Filipino Market,ikan bakar,Kota Kinabalu,5.9830,116.0740
+Nasi Kuning Tawau,nasi kuning,Tawau,4.2450,117.8910
+"""
+
+# Nama tempat -> (lat, lon) untuk "/food penang"
+PLACES = {
+    "kl": (3.1478, 101.6953), "kuala lumpur": (3.1478, 101.6953), "kampung baru": (3.1650, 101.7040),
+    "bukit bintang": (3.1466, 101.7100), "pj": (3.1073, 101.6067), "petaling jaya": (3.1073, 101.6067),
+    "subang": (3.0767, 101.5857), "shah alam": (3.0733, 101.5185), "kajang": (2.9935, 101.7880),
+    "putrajaya": (2.9264, 101.6964), "cyberjaya": (2.9213, 101.6559), "penang": (5.4141, 100.3288),
+    "pulau pinang": (5.4141, 100.3288), "george town": (5.4141, 100.3288), "alor setar": (6.1248, 100.3678),
+    "ipoh": (4.5975, 101.0901), "kuala kangsar": (4.7731, 100.9397), "melaka": (2.1896, 102.2501),
+    "jb": (1.4927, 103.7414), "johor bahru": (1.4927, 103.7414), "seremban": (2.7259, 101.9424),
+    "temerloh": (3.4500, 102.4170), "kuantan": (3.8077, 103.3260), "kota bharu": (6.1254, 102.2381),
+    "kuala terengganu": (5.3302, 103.1408), "kuching": (1.5535, 110.3593),
+    "kota kinabalu": (5.9804, 116.0735), "kk": (5.9804, 116.0735), "tawau": (4.2448, 117.8912),
+}
+# Masa hujan, utamakan makanan berkuah
+SOUPY = frozenset({"laksa", "mee rebus", "sup tulang", "asam pedas", "kolo mee"})
+
+_COORDS = re.compile(r"(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)")
+
+
+def load_eateries(path=FOOD_DATA):
+    """Eateries from a CSV file (name,dish,area,lat,lon), or the bundled table"""
+    if path:
+        with open(path, newline="", encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = EATERIES_CSV
+    rows = csv.reader(io.StringIO(text))
+    return [Eatery(name.strip(), dish.strip().lower(), area.strip(), float(lat), float(lon))
+            for name, dish, area, lat, lon in rows if name and not name.startswith("#")]
+
+
+def _unit(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance (haversine)"""
+    dlat, dlon = math.radians(lat2 - lat1), math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+# ===== SPATIAL INDEX =====
+class KDTree:
+    """
+    Static 3-d tree over points on the unit sphere. Chord distance orders
+    points exactly like great-circle distance, with no projection error
+    between Peninsular and East Malaysia.
+    """
+
+    def __init__(self, coords):
+        self._root = self._build([(_unit(lat, lon), i) for i, (lat, lon) in enumerate(coords)], 0)
+        self.size = len(coords)
+
+    def _build(self, points, depth):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda p: p[0][axis])
+        mid = len(points) // 2
+        # node = (point, index, axis, left, right)
+        return (points[mid][0], points[mid][1], axis,
+                self._build(points[:mid], depth + 1), self._build(points[mid + 1:], depth + 1))
+
+    def nearest(self, lat, lon, k=3):
+        """Indexes of the k nearest points, nearest first"""
+        target = _unit(lat, lon)
+        heap = []  # (-jarak^2, index): yang paling jauh di atas
+
+        def visit(node):
+            point, index, axis, left, right = node
+            d2 = (point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2 + (point[2] - target[2]) ** 2
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, index))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, index))
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            if near is not None:
+                visit(near)
+            # Cabang sebelah sana hanya kalau satah pemisah lebih dekat dari calon ke-k
+            if far is not None and (len(heap) < k or diff * diff < -heap[0][0]):
+                visit(far)
+
+        if self._root is not None and k > 0:
+            visit(self._root)
+        return [index for _, index in sorted(heap, reverse=True)]
+
+
+class FoodIndex:
+    def __init__(self, eateries):
+        self.eateries = list(eateries)
+        self._all = KDTree([(e.lat, e.lon) for e in self.eateries])
+        by_dish = {}
+        for i, e in enumerate(self.eateries):
+            by_dish.setdefault(e.dish, []).append(i)
+        self._by_dish = {dish: (ids, KDTree([(self.eateries[i].lat, self.eateries[i].lon) for i in ids]))
+                         for dish, ids in by_dish.items()}
+        # Padanan terpanjang dulu: "nasi lemak" sebelum "nasi"
+        self.dishes = sorted(self._by_dish, key=len, reverse=True)
+
+    def nearest(self, lat, lon, k=3, dish=None):
+        """[(Eatery, km)] nearest first; dish limits the search to that dish's tree"""
+        start = time.perf_counter()
+        if dish is None:
+            ids = self._all.nearest(lat, lon, k)
+        elif dish in self._by_dish:
+            dish_ids, tree = self._by_dish[dish]
+            ids = [dish_ids[i] for i in tree.nearest(lat, lon, k)]
+        else:
+            ids = []
+        results = [(self.eateries[i], distance_km(lat, lon, self.eateries[i].lat, self.eateries[i].lon)) for i in ids]
+        tracer.record("location.nearest", (time.perf_counter() - start) * 1000, k=k)
+        return results
+
+    def find_dish(self, text):
+        text = text.lower()
+        return next((d for d in self.dishes if re.search(rf"\b{re.escape(d)}\b", text)), None)
+
+
+def resolve_place(text):
+    """(name, (lat, lon)) for 'lat,lon' or a known place name inside text, else None"""
+    if not text:
+        return None
+    if match := _COORDS.search(text):
+        lat, lon = float(match.group(1)), float(match.group(2))
+        if -90 <= lat <= 90 and -180 <= lon <= 180:
+            return f"{lat:.3f},{lon:.3f}", (lat, lon)
+    text = text.lower()
+    for name in sorted(PLACES, key=len, reverse=True):
+        if re.search(rf"\b{re.escape(name)}\b", text):
+            return name, PLACES[name]
+    return None
+
+
+# ===== WEATHER =====
+CONDITIONS = {
+    "cerah": ("☀️", "Cerah"),
+    "berawan": ("⛅", "Berawan"),
+    "hujan": ("🌧️", "Hujan"),
+    "ribut": ("⛈️", "Ribut petir"),
+}
+
+
+class StubWeather:
+    """Local, deterministic per grid cell and hour; afternoon storms like the real thing"""
+    name = "stub"
+
+    def __call__(self, lat, lon):
+        now = time.gmtime(time.time() + 8 * 3600)  # waktu Malaysia
+        seed = zlib.crc32(f"{lat:.1f}:{lon:.1f}:{now.tm_yday}:{now.tm_hour}".encode()) % 100
+        afternoon = 14 <= now.tm_hour <= 19
+        if seed < (30 if afternoon else 10):
+            condition = "ribut" if seed % 3 == 0 else "hujan"
+        elif seed < 55:
+            condition = "berawan"
+        else:
+            condition = "cerah"
+        daytime = 9 <= now.tm_hour <= 18
+        temp = 25 + (5 if daytime else 0) - (3 if condition in ("hujan", "ribut") else 0) + seed % 3
+        return {"condition": condition, "temp_c": temp, "source": self.name}
+
+
+class OpenMeteoWeather:
+    """api.open-meteo.com current conditions (no key needed)"""
+    name = "open-meteo"
+    URL = "https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&current=temperature_2m,weather_code"
+
+    def __init__(self, timeout=3.0):
+        self.timeout = timeout
+
+    def __call__(self, lat, lon):
+        with urllib.request.urlopen(self.URL.format(lat=lat, lon=lon), timeout=self.timeout) as response:
+            current = json.load(response)["current"]
+        code = current["weather_code"]  # kod WMO
+        if code >= 95:
+            condition = "ribut"
+        elif code >= 51:
+            condition = "hujan"
+        elif code >= 2:
+            condition = "berawan"
+        else:
+            condition = "cerah"
+        return {"condition": condition, "temp_c": round(current["temperature_2m"]), "source": self.name}
+
+
+def get_weather_provider(name=WEATHER_PROVIDER):
+    return OpenMeteoWeather() if name == "open-meteo" else StubWeather()
+
+
+class WeatherService:
+    def __init__(self, provider=None, ttl=WEATHER_TTL, grid=WEATHER_GRID, max_entries=WEATHER_CACHE_SIZE):
+        self.provider = provider or get_weather_provider()
+        self.ttl = ttl
+        self.grid = grid
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # (lat, lon) dibundarkan -> (tamat tempoh, report)
+        self._flight = SingleFlight("weather")
+        self.stats = {"hits": 0, "misses": 0, "errors": 0, "stale_served": 0}
+
+    def lookup(self, lat, lon):
+        """Report dict for the grid cell around (lat, lon), or None if unavailable"""
+        key = (round(lat, self.grid), round(lon, self.grid))
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+        try:
+            report = self._flight.do(key, lambda: self._fetch(key))
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+                if entry is not None:
+                    self.stats["stale_served"] += 1
+            return entry[1] if entry is not None else None
+        return report
+
+    def _fetch(self, key):
+        start = time.perf_counter()
+        report = self.provider(*key)
+        tracer.record("weather.fetch", (time.perf_counter() - start) * 1000, source=report.get("source"))
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.ttl, report)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return report
+
+    def get_stats(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "cells": len(self._cache),
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0}
+
+
+def format_weather(report):
+    emoji, label = CONDITIONS[report["condition"]]
+    return f"{emoji} {label}, {report['temp_c']}°C"
+
+
+FOOD_INDEX = FoodIndex(load_eateries())
+weather = WeatherService()
+
+
 def get_weather(lat, lon):
-    return "Cuaca di lokasi anda: Cerah (placeholder)."
+    report = weather.lookup(lat, lon)
+    if report is None:
+        return "Cuaca di lokasi anda tak dapat disemak sekarang."
+    return f"Cuaca di lokasi anda: {format_weather(report)}."
+
+
+def get_nearby_food(lat, lon, k=3):
+    return [eatery.name for eatery, _ in FOOD_INDEX.nearest(lat, lon, k)]
+
+
+def recommend_food(lat, lon, dish=None, liked=(), k=3):
+    """
+    Up to k eateries within MAX_FOOD_KM of (lat, lon), plus the weather
+    report. Among the nearest few, dishes the user likes come first, then
+    soupy ones when it rains.
+    """
+    report = weather.lookup(lat, lon)
+    raining = report is not None and report["condition"] in ("hujan", "ribut")
+    candidates = [c for c in FOOD_INDEX.nearest(lat, lon, k * 3 if dish is None else k, dish) if c[1] <= MAX_FOOD_KM]
+    if dish is None:
+        liked = [l.lower() for l in liked]
+        candidates.sort(key=lambda c: (not any(c[0].dish in l for l in liked),
+                                       not (raining and c[0].dish in SOUPY), c[1]))
+    return candidates[:k], report
+
+
+# For testing
+if __name__ == "__main__":
+    import random
+    import timeit
+
+    for eatery, km in FOOD_INDEX.nearest(*PLACES["kl"], k=3):
+        print(f"{eatery.name:32s} {eatery.dish:14s} {km:5.1f} km")
+    print(FOOD_INDEX.nearest(*PLACES["kuching"], k=1, dish="laksa"))
+    print(get_weather(*PLACES["penang"]), get_nearby_food(*PLACES["penang"]))
 
-def get_nearby_food(lat, lon):
-    return ["Nasi Lemak", "Laksa", "Roti Canai"]
\ No newline at end of file
+    # Ketepatan vs scan penuh + kelajuan pada 50k titik rawak
+    random.seed(0)
+    points = [(random.uniform(1, 7), random.uniform(99.5, 119)) for _ in range(50000)]
+    tree = KDTree(points)
+    queries = [(random.uniform(1, 7), random.uniform(99.5, 119)) for _ in range(200)]
+    for lat, lon in queries[:20]:
+        brute = sorted(range(len(points)), key=lambda i: distance_km(lat, lon, *points[i]))[:5]
+        assert tree.nearest(lat, lon, 5) == brute
+    per_query = timeit.timeit(lambda: [tree.nearest(lat, lon, 5) for lat, lon in queries], number=5) / 1000
+    print(f"k=5 over {len(points)} points: {per_query * 1e6:.1f} us per query")
+    timeit.timeit(lambda: weather.lookup(3.15, 101.70), number=1000)
+    print(weather.get_stats())
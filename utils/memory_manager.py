@@ -3,19 +3,93 @@
 
 import sqlite3
 import json
+import re
 import pytz
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import wraps
 MALAYSIA_TZ = pytz.timezone('Asia/Kuala_Lumpur')
+from . import gamification
+from .calendar_service import current_period
 from .chroma_vault_simple import ChromaVault  # GUNA SIMPLE VERSION
+from .dedup import DedupIndex, fingerprint as dedup_fingerprint
+from .fact_extractor import FACT_TYPES, SINGLE
+from .tracing import traced, tracer
 
 DB_PATH = "memory.db"
+DEFAULT_USER = "default"
+# Prompt nampak N exchange terakhir secara mentah; yang lebih lama masuk ringkasan
+RECENT_EXCHANGES = 3
+SUMMARY_EVERY = 8  # exchange baru sebelum ringkasan dikemas kini
+SUMMARY_MAX_CHARS = 1200
+# Balasan tetap (bukan dari model): sama untuk mesej berbeza, jadi tak pernah di-dedup
+CANNED_REPLIES = frozenset({"Crisis Alert", "Fatigue"})
+PROFILE_LIST_LIMIT = 5  # nilai terbaru per fakta jenis list dalam profil
+CONTEXT_WINDOW = RECENT_EXCHANGES + SUMMARY_EVERY  # paling banyak exchange selepas watermark ringkasan
+STORY_WINDOW = 4  # babak terakhir yang dihantar mentah ke prompt
+STORY_SYNOPSIS_EVERY = 4  # babak lama yang terkumpul sebelum sinopsis dikemas kini
+STORY_SYNOPSIS_MAX_CHARS = 800
+RRF_K = 60  # reciprocal rank fusion constant (standard value)
+COMMON_TERM_RATIO = 0.05  # perkataan dalam >5% perbualan tak membantu ranking, cuma lambatkan query
+SEARCH_STOPWORDS = frozenset(
+    "saya aku awak kau dia kita kami yang dan ke di ni tu ini itu nak ada tak pun je jer lah kot "
+    "dengan untuk dari pada apa the a an i you to is it of and in that was my me".split()
+)
+_SEARCH_TOKEN = re.compile(r"\w{2,}")
+
+def _locked(method):
+    # Satu connection dikongsi antara thread (engine/API server), jadi serialize
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class MemoryManager:
-    def __init__(self):
-        self.conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    def __init__(self, db_path=DB_PATH, summarizer=None):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.RLock()
+        # Kerja background (ringkasan, sinopsis, backfill index) satu thread
+        self._summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ayra-summary")
         self._create_tables()
         # Guna simple vault
         self.vault = ChromaVault()
+        # summarizer(summary, text, max_chars, kind=...) -> str; diset oleh engine (perlu model)
+        self.summarizer = summarizer
+        self._summarizing = set()
+        # Write-through read cache (stats, profile, prompt context). Hanya sah untuk
+        # satu proses: semua tulis ke DB ni mesti lalu MemoryManager yang sama
+        self._cache = {}
+        self.cache_stats = {"hits": 0, "misses": 0}
+        # Exchange yang hampir sama dengan yang baru disimpan digabung (repeat_count)
+        self.dedup = DedupIndex()
+        self._warm_dedup()
+
+    # ===== READ CACHE =====
+    def _cache_get(self, kind, key, loader):
+        entry = self._cache.get((kind, key))
+        if entry is not None:
+            self.cache_stats["hits"] += 1
+            tracer.incr("memory_cache_hit")
+            return entry
+        self.cache_stats["misses"] += 1
+        tracer.incr("memory_cache_miss")
+        entry = self._cache[(kind, key)] = loader()
+        return entry
+
+    def _cache_invalidate(self, kind, key=None):
+        if key is not None:
+            self._cache.pop((kind, key), None)
+            return
+        for cache_key in [k for k in self._cache if k[0] == kind]:
+            del self._cache[cache_key]
+
+    def get_cache_stats(self):
+        lookups = self.cache_stats["hits"] + self.cache_stats["misses"]
+        return {**self.cache_stats, "entries": len(self._cache),
+                "hit_rate": self.cache_stats["hits"] / lookups if lookups else 0.0}
 
     def _create_tables(self):
         cursor = self.conn.cursor()
@@ -63,94 +137,672 @@ class MemoryManager:
                 value INTEGER
             )
         """)
+        # Rolling summary (satu baris per user)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS conversation_summaries (
+                user_id TEXT PRIMARY KEY,
+                summary TEXT,
+                last_conversation_id INTEGER,
+                updated_at TEXT
+            )
+        """)
+        # Facts extracted from conversations (typed by category + cardinality)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS facts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                category TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                mentions INTEGER DEFAULT 1,
+                updated_at TEXT,
+                UNIQUE (user_id, key, value)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_facts_user ON facts (user_id, updated_at)")
+        # Story chunks: satu baris setiap babak, append O(1)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS story_chunks (
+                story_id INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                content TEXT,
+                created_at TEXT,
+                PRIMARY KEY (story_id, seq)
+            )
+        """)
+        story_columns = [row[1] for row in cursor.execute("PRAGMA table_info(stories)")]
+        if "chunk_count" not in story_columns:
+            cursor.execute("ALTER TABLE stories ADD COLUMN chunk_count INTEGER DEFAULT 0")
+            cursor.execute("ALTER TABLE stories ADD COLUMN synopsis TEXT")
+            cursor.execute("ALTER TABLE stories ADD COLUMN synopsis_upto INTEGER DEFAULT 0")
+            self._migrate_story_content(cursor)
+        # Migration: DB lama takde user_id dalam conversations
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(conversations)")]
+        if "user_id" not in columns:
+            cursor.execute(f"ALTER TABLE conversations ADD COLUMN user_id TEXT DEFAULT '{DEFAULT_USER}'")
+        if "repeat_count" not in columns:
+            cursor.execute("ALTER TABLE conversations ADD COLUMN repeat_count INTEGER DEFAULT 1")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations (user_id, id)")
+        if "finished_at" not in story_columns:
+            cursor.execute("ALTER TABLE stories ADD COLUMN finished_at TEXT")
+        # Migration: cerita lama takde user_id (semua milik user default)
+        if "user_id" not in story_columns:
+            cursor.execute(f"ALTER TABLE stories ADD COLUMN user_id TEXT DEFAULT '{DEFAULT_USER}'")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stories_user ON stories (user_id, last_continued)")
+        # Gamification: kaunter & badge per user, dikemas kini dalam transaksi save_interaction
+        counters_exist = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_counters'"
+        ).fetchone()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_counters (
+                user_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value INTEGER NOT NULL,
+                PRIMARY KEY (user_id, key)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_badges (
+                user_id TEXT NOT NULL,
+                badge_id TEXT NOT NULL,
+                earned_at TEXT,
+                PRIMARY KEY (user_id, badge_id)
+            )
+        """)
+        if not counters_exist:
+            self._backfill_progress(cursor)
         self.conn.commit()
+        self._create_search_index(cursor)
+
+    def _create_search_index(self, cursor):
+        """FTS5 index over conversations, kept in sync by triggers"""
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations_fts'"
+        ).fetchone()
+        try:
+            cursor.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+                    user_message, ayra_response,
+                    content='conversations', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts_vocab USING fts5vocab(conversations_fts, 'row');
+                CREATE TRIGGER IF NOT EXISTS conversations_fts_ai AFTER INSERT ON conversations BEGIN
+                    INSERT INTO conversations_fts (rowid, user_message, ayra_response)
+                    VALUES (new.id, new.user_message, new.ayra_response);
+                END;
+                CREATE TRIGGER IF NOT EXISTS conversations_fts_ad AFTER DELETE ON conversations BEGIN
+                    INSERT INTO conversations_fts (conversations_fts, rowid, user_message, ayra_response)
+                    VALUES ('delete', old.id, old.user_message, old.ayra_response);
+                END;
+                CREATE TRIGGER IF NOT EXISTS conversations_fts_au AFTER UPDATE OF user_message, ayra_response ON conversations BEGIN
+                    INSERT INTO conversations_fts (conversations_fts, rowid, user_message, ayra_response)
+                    VALUES ('delete', old.id, old.user_message, old.ayra_response);
+                    INSERT INTO conversations_fts (rowid, user_message, ayra_response)
+                    VALUES (new.id, new.user_message, new.ayra_response);
+                END;
+            """)
+            self.fts_enabled = True
+        except sqlite3.OperationalError:
+            # SQLite tanpa FTS5: search_text guna LIKE (perlahan, tapi masih jalan)
+            self.fts_enabled = False
+            return
+        if not exists and cursor.execute("SELECT 1 FROM conversations LIMIT 1").fetchone():
+            # DB lama: backfill di background supaya startup tak tersekat
+            self._summary_executor.submit(self.rebuild_search_index)
 
     # ===== CONVERSATIONS =====
-    def save_interaction(self, user_msg, ayra_msg, mood_score=0.0, model_used="Gemini"):
+    @traced("memory.save_interaction")
+    @_locked
+    def save_interaction(self, user_msg, ayra_msg, mood_score=0.0, model_used="Gemini", user_id=DEFAULT_USER,
+                         language=None, events=(gamification.MESSAGE,)):
+        """
+        Store one exchange and update the user's counters and badges in the
+        same transaction. events: gamification counters this turn bumps
+        (crisis / fatigue replies pass none). Returns newly earned badge names.
+        """
+        now = datetime.now(MALAYSIA_TZ).isoformat()
         cursor = self.conn.cursor()
+        canned = model_used in CANNED_REPLIES
+        duplicate_of, fingerprint = (None, None) if canned else self.dedup.find(
+            f"{user_msg}\n{ayra_msg}", scope=user_id, key=user_msg
+        )
+        if duplicate_of is not None:
+            # Ulang benda sama: naikkan kiraan & masa, tak simpan baris (atau vault) baru
+            cursor.execute(
+                "UPDATE conversations SET repeat_count = repeat_count + 1, timestamp = ? WHERE id = ?",
+                (now, duplicate_of)
+            )
+            state, new_badges = self._record_activity(cursor, user_id, now, events, mood_score, language)
+            self.conn.commit()
+            self._commit_progress(user_id, state, events)
+            self.dedup.touch(duplicate_of, len(f"{user_msg}{ayra_msg}".encode()))
+            tracer.incr("memory_dedup_merged")
+            return new_badges
         cursor.execute(
-            "INSERT INTO conversations (timestamp, user_message, ayra_response, mood_score, model_used) VALUES (?, ?, ?, ?, ?)",
-            (datetime.now(MALAYSIA_TZ).isoformat(), user_msg, ayra_msg, mood_score, model_used)
+            "INSERT INTO conversations (timestamp, user_message, ayra_response, mood_score, model_used, user_id) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (now, user_msg, ayra_msg, mood_score, model_used, user_id)
         )
+        # Ambil id sekarang: _record_activity guna cursor yang sama untuk INSERT lain
+        row_id = cursor.lastrowid
+        state, new_badges = self._record_activity(cursor, user_id, now, events, mood_score, language)
         self.conn.commit()
+        self._commit_progress(user_id, state, events)
+        if not canned:
+            self.dedup.add(row_id, fingerprint, scope=user_id)
+        context = self._cache.get(("context", user_id))
+        if context is not None:
+            context["rows"].append((user_msg, ayra_msg))
+            del context["rows"][:-CONTEXT_WINDOW]
+            context["pending"] += 1
         # Juga simpan ke vault (simple version tak buat apa-apa)
-        self.vault.save_conversation(user_msg, ayra_msg, mood_score, model_used)
+        self.vault.save_conversation(user_msg, ayra_msg, mood_score, model_used, language=language)
+        self._maybe_summarize(user_id)
+        return new_badges
 
-    def get_recent_conversations(self, limit=5):
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "SELECT user_message, ayra_response FROM conversations ORDER BY timestamp DESC LIMIT ?",
-            (limit,)
-        )
-        rows = cursor.fetchall()
-        context = []
-        for user, ayra in reversed(rows):
-            context.append({"role": "user", "content": user})
-            context.append({"role": "assistant", "content": ayra})
-        return context
+    @traced("memory.get_recent_conversations")
+    @_locked
+    def get_recent_conversations(self, limit=5, user_id=DEFAULT_USER):
+        """Last `limit` exchanges regardless of the summary (turns use get_context)"""
+        rows = self.conn.execute(
+            "SELECT user_message, ayra_response FROM conversations WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, limit)
+        ).fetchall()
+        return _as_messages(reversed(rows))
+
+    def _warm_dedup(self):
+        # Signature hanya sah dalam satu proses, jadi bina semula dari exchange terakhir
+        rows = self.conn.execute(
+            "SELECT id, user_id, user_message, ayra_response, model_used FROM conversations ORDER BY id DESC LIMIT ?",
+            (self.dedup.max_entries,)
+        ).fetchall()
+        for row_id, user_id, user_msg, ayra_msg, model_used in reversed(rows):
+            if model_used not in CANNED_REPLIES:
+                self.dedup.add(row_id, dedup_fingerprint(f"{user_msg}\n{ayra_msg}", key=user_msg), scope=user_id)
+
+    @_locked
+    def get_dedup_stats(self):
+        return self.dedup.get_stats()
+
+    # ===== SEARCH =====
+    @traced("memory.rebuild_search_index")
+    @_locked
+    def rebuild_search_index(self):
+        """Backfill / repair the FTS index from the conversations table"""
+        if self.fts_enabled:
+            self.conn.execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('rebuild')")
+            self.conn.commit()
+
+    @traced("memory.search_text")
+    @_locked
+    def search_text(self, query, limit=5, user_id=DEFAULT_USER, mode="fts"):
+        """
+        Keyword search over past conversations, best match first.
+        Returns [{"id", "timestamp", "user_message", "ayra_response", "snippet", "score"}].
+        mode="hybrid" fuses the BM25 ranking with the vault's vector search (RRF).
+        """
+        tokens = list(dict.fromkeys(_SEARCH_TOKEN.findall(query.lower())))
+        tokens = [t for t in tokens if t not in SEARCH_STOPWORDS] or tokens
+        if not tokens:
+            return []
+        fetch = limit * 2 if mode == "hybrid" else limit
+        if self.fts_enabled:
+            tokens = self._selective_terms(tokens)
+            # Semua perkataan dulu (cepat, tepat); kalau tak cukup, OR dan biar BM25 susun
+            results = self._fts_query(" AND ".join(f'"{t}"' for t in tokens), user_id, fetch)
+            if len(results) < fetch and len(tokens) > 1:
+                seen = {r["id"] for r in results}
+                results += [r for r in self._fts_query(" OR ".join(f'"{t}"' for t in tokens), user_id, fetch)
+                            if r["id"] not in seen]
+        else:
+            like = f"%{tokens[0]}%"
+            rows = self.conn.execute(
+                "SELECT id, timestamp, user_message, ayra_response FROM conversations "
+                "WHERE user_id = ? AND (user_message LIKE ? OR ayra_response LIKE ?) ORDER BY id DESC LIMIT ?",
+                (user_id, like, like, fetch)
+            ).fetchall()
+            results = [{"id": r[0], "timestamp": r[1], "user_message": r[2], "ayra_response": r[3],
+                        "snippet": (r[2] or "")[:80], "score": 0.0} for r in rows]
+        if mode == "hybrid":
+            results = _fuse_rankings(results, self.vault.search_memories(query, n_results=limit * 2))
+        return results[:limit]
+
+    def _fts_query(self, match, user_id, limit):
+        rows = self.conn.execute("""
+            SELECT c.id, c.timestamp, c.user_message, c.ayra_response,
+                   snippet(conversations_fts, -1, '[', ']', '…', 12), bm25(conversations_fts)
+            FROM conversations_fts JOIN conversations c ON c.id = conversations_fts.rowid
+            WHERE conversations_fts MATCH ? AND c.user_id = ?
+            ORDER BY bm25(conversations_fts) LIMIT ?
+        """, (match, user_id, limit)).fetchall()
+        return [{"id": r[0], "timestamp": r[1], "user_message": r[2], "ayra_response": r[3],
+                 "snippet": r[4], "score": -r[5]} for r in rows]
+
+    def _selective_terms(self, tokens):
+        """Drop terms found in more than COMMON_TERM_RATIO of rows (keeps the rarest if all are common)"""
+        total = self.conn.execute("SELECT MAX(id) FROM conversations").fetchone()[0] or 0
+        doc_freq = dict(self.conn.execute(
+            f"SELECT term, doc FROM conversations_fts_vocab WHERE term IN ({','.join('?' * len(tokens))})", tokens
+        ).fetchall())
+        # Perkataan yang tiada dalam index langsung takkan padan, buang
+        known = [t for t in tokens if t in doc_freq] or tokens
+        selective = [t for t in known if doc_freq.get(t, 0) <= total * COMMON_TERM_RATIO]
+        return selective or [min(known, key=lambda t: doc_freq.get(t, 0))]
+
+    # ===== ROLLING SUMMARY =====
+    @traced("memory.get_summary")
+    @_locked
+    def get_summary(self, user_id=DEFAULT_USER):
+        row = self.conn.execute(
+            "SELECT summary FROM conversation_summaries WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    @traced("memory.get_context")
+    @_locked
+    def get_context(self, user_id=DEFAULT_USER):
+        """
+        (context, summary) for the prompt: the running summary plus every
+        exchange after its watermark, so nothing falls between the two while
+        the next compression is pending. Capped at RECENT_EXCHANGES +
+        SUMMARY_EVERY (the most that can be pending); without a summarizer,
+        just the last RECENT_EXCHANGES. Served from the write-through cache:
+        save_interaction appends, a new summary invalidates.
+        """
+        entry = self._cache_get("context", user_id, lambda: self._load_context(user_id))
+        limit = CONTEXT_WINDOW if self.summarizer is not None else RECENT_EXCHANGES
+        return _as_messages(entry["rows"][-limit:]), entry["summary"]
+
+    def _load_context(self, user_id):
+        row = self.conn.execute(
+            "SELECT summary, last_conversation_id FROM conversation_summaries WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        summary, last_id = row if row else (None, 0)
+        rows = self.conn.execute(
+            "SELECT user_message, ayra_response FROM conversations WHERE user_id = ? AND id > ? "
+            "ORDER BY id DESC LIMIT ?", (user_id, last_id or 0, CONTEXT_WINDOW)
+        ).fetchall()
+        pending = self.conn.execute(
+            "SELECT COUNT(*) FROM conversations WHERE user_id = ? AND id > ?", (user_id, last_id or 0)
+        ).fetchone()[0]
+        # pending = exchange selepas watermark (untuk _maybe_summarize, tanpa COUNT setiap turn)
+        return {"summary": summary, "rows": rows[::-1], "pending": pending}
+
+    def _maybe_summarize(self, user_id):
+        """Queue a background compression once SUMMARY_EVERY exchanges sit outside the raw window"""
+        if self.summarizer is None or user_id in self._summarizing:
+            return
+        pending = self._cache_get("context", user_id, lambda: self._load_context(user_id))["pending"]
+        if pending - RECENT_EXCHANGES >= SUMMARY_EVERY:
+            self._summarizing.add(user_id)
+            self._summary_executor.submit(self._compress, user_id)
+
+    @traced("memory.summarize")
+    def _compress(self, user_id):
+        try:
+            with self._lock:
+                row = self.conn.execute(
+                    "SELECT summary, last_conversation_id FROM conversation_summaries WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                summary, last_id = row if row else ("", 0)
+                rows = self.conn.execute(
+                    "SELECT id, user_message, ayra_response FROM conversations "
+                    "WHERE user_id = ? AND id > ? ORDER BY id",
+                    (user_id, last_id)
+                ).fetchall()
+            old = rows[:-RECENT_EXCHANGES]
+            if not old:
+                return
+            exchanges = "\n".join(f"user: {u}\nassistant: {a}" for _, u, a in old)
+            # Panggilan model di luar lock supaya turn lain tak tersekat
+            new_summary = self.summarizer(summary or "(tiada)", exchanges, SUMMARY_MAX_CHARS)
+            with self._lock:
+                self.conn.execute(
+                    "REPLACE INTO conversation_summaries (user_id, summary, last_conversation_id, updated_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (user_id, new_summary[:SUMMARY_MAX_CHARS], old[-1][0], datetime.now(MALAYSIA_TZ).isoformat())
+                )
+                self.conn.commit()
+                self._cache_invalidate("context", user_id)
+        except Exception:
+            # Ringkasan gagal = cuba lagi pada turn seterusnya, raw history masih selamat
+            tracer.incr("summary_failed")
+        finally:
+            self._summarizing.discard(user_id)
 
     # ===== USER PROFILE =====
+    @traced("memory.get_profile")
+    @_locked
     def get_profile(self, key):
+        return self._cache_get("profile_key", key, lambda: self._load_profile_key(key))["value"]
+
+    def _load_profile_key(self, key):
         cursor = self.conn.cursor()
         cursor.execute("SELECT value FROM user_profile WHERE key = ?", (key,))
         row = cursor.fetchone()
-        return row[0] if row else None
+        return {"value": row[0] if row else None}
 
+    @traced("memory.set_profile")
+    @_locked
     def set_profile(self, key, value):
         cursor = self.conn.cursor()
         cursor.execute(
             "REPLACE INTO user_profile (key, value, updated_at) VALUES (?, ?, ?)",
-            (key, value, datetime.now(malaysia_tz).isoformat())
+            (key, value, datetime.now(MALAYSIA_TZ).isoformat())
         )
         self.conn.commit()
+        self._cache[("profile_key", key)] = {"value": value}
+        # user_profile dikongsi semua user, jadi semua profil dalam cache basi
+        self._cache_invalidate("profile")
+
+    @traced("memory.get_user_profile")
+    @_locked
+    def get_user_profile(self, user_id=DEFAULT_USER):
+        """
+        Whole profile in one query: extracted facts plus explicit user_profile
+        values (which win). SINGLE facts map to a string, LIST facts to the
+        PROFILE_LIST_LIMIT most recent values.
+        """
+        return dict(self._cache_get("profile", user_id, lambda: self._load_user_profile(user_id)))
+
+    def _load_user_profile(self, user_id):
+        rows = self.conn.execute("""
+            SELECT 1 AS explicit, key, value, updated_at FROM user_profile
+            UNION ALL
+            SELECT 0, key, value, updated_at FROM facts WHERE user_id = ?
+            ORDER BY explicit, updated_at
+        """, (user_id,)).fetchall()
+        profile = {}
+        for explicit, key, value, _ in rows:
+            if not explicit and FACT_TYPES.get(key, (None, SINGLE))[1] != SINGLE:
+                profile.setdefault(key, []).append(value)
+                del profile[key][:-PROFILE_LIST_LIMIT]
+            else:
+                profile[key] = value
+        return profile
+
+    @traced("memory.save_facts")
+    @_locked
+    def save_facts(self, user_id, facts):
+        """Upsert (category, key, value) facts; a new SINGLE value replaces the old one"""
+        if not facts:
+            return
+        now = datetime.now(MALAYSIA_TZ).isoformat()
+        cursor = self.conn.cursor()
+        for category, key, value in facts:
+            if FACT_TYPES.get(key, (None, SINGLE))[1] == SINGLE:
+                cursor.execute("DELETE FROM facts WHERE user_id = ? AND key = ? AND value != ?", (user_id, key, value))
+            cursor.execute("""
+                INSERT INTO facts (user_id, category, key, value, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, key, value) DO UPDATE SET mentions = mentions + 1, updated_at = excluded.updated_at
+            """, (user_id, category, key, value, now))
+        self.conn.commit()
+        self._cache_invalidate("profile", user_id)
 
     # ===== STORIES =====
-    def save_story(self, title, content):
+    @traced("memory.save_story")
+    @_locked
+    def save_story(self, title, content, user_id=DEFAULT_USER):
+        now = datetime.now(MALAYSIA_TZ).isoformat()
         cursor = self.conn.cursor()
         cursor.execute(
-            "INSERT INTO stories (title, content, created_at, last_continued) VALUES (?, ?, ?, ?)",
-            (title, content, datetime.now(malaysia_tz).isoformat(), datetime.now(malaysia_tz).isoformat())
+            "INSERT INTO stories (title, content, created_at, last_continued, chunk_count, user_id) "
+            "VALUES (?, '', ?, ?, 1, ?)",
+            (title, now, now, user_id)
+        )
+        story_id = cursor.lastrowid
+        cursor.execute(
+            "INSERT INTO story_chunks (story_id, seq, content, created_at) VALUES (?, 0, ?, ?)",
+            (story_id, content, now)
         )
         self.conn.commit()
-        return cursor.lastrowid
+        return story_id
 
-    def get_latest_story(self):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id, title, content FROM stories ORDER BY last_continued DESC LIMIT 1")
-        row = cursor.fetchone()
-        return {"id": row[0], "title": row[1], "content": row[2]} if row else None
+    @traced("memory.get_latest_story")
+    @_locked
+    def get_latest_story(self, window=STORY_WINDOW, user_id=DEFAULT_USER):
+        """
+        Windowed view of the user's most recently continued story:
+        {"id", "title", "synopsis", "chunks", "chunk_count", "content"} where
+        chunks are the last babak not yet folded into the synopsis (bounded)
+        and content is those chunks joined.
+        """
+        row = self.conn.execute(
+            "SELECT id, title, chunk_count, synopsis, synopsis_upto FROM stories WHERE user_id = ? "
+            "ORDER BY last_continued DESC, id DESC LIMIT 1", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        story_id, title, chunk_count, synopsis, synopsis_upto = row
+        # Babak yang belum masuk sinopsis pun dihantar, tapi tak lebih dari window + EVERY
+        start = max(chunk_count - window - STORY_SYNOPSIS_EVERY, min(synopsis_upto, chunk_count - window))
+        chunks = [text for (text,) in self.conn.execute(
+            "SELECT content FROM story_chunks WHERE story_id = ? AND seq >= ? ORDER BY seq", (story_id, start)
+        )]
+        return {"id": story_id, "title": title, "synopsis": synopsis, "chunks": chunks,
+                "chunk_count": chunk_count, "content": "\n\n".join(chunks)}
 
-    def update_story(self, story_id, new_content):
+    @traced("memory.append_story_chunk")
+    @_locked
+    def append_story_chunk(self, story_id, text, user_id=DEFAULT_USER):
+        """Add one babak to the user's story without touching the earlier ones"""
+        now = datetime.now(MALAYSIA_TZ).isoformat()
         cursor = self.conn.cursor()
+        row = cursor.execute(
+            "SELECT chunk_count, synopsis_upto FROM stories WHERE id = ? AND user_id = ?", (story_id, user_id)
+        ).fetchone()
+        if row is None:
+            # Bukan cerita user ni (atau dah dipadam)
+            return
+        chunk_count, synopsis_upto = row
         cursor.execute(
-            "UPDATE stories SET content = content || ? , last_continued = ? WHERE id = ?",
-            (new_content, datetime.now(malaysia_tz).isoformat(), story_id)
+            "INSERT INTO story_chunks (story_id, seq, content, created_at) VALUES (?, ?, ?, ?)",
+            (story_id, chunk_count, text, now)
+        )
+        cursor.execute(
+            "UPDATE stories SET chunk_count = ?, last_continued = ? WHERE id = ?", (chunk_count + 1, now, story_id)
         )
         self.conn.commit()
+        self._maybe_update_synopsis(story_id, chunk_count + 1, synopsis_upto)
+
+    def _maybe_update_synopsis(self, story_id, chunk_count, synopsis_upto):
+        job = ("story", story_id)
+        if self.summarizer is None or job in self._summarizing:
+            return
+        if chunk_count - STORY_WINDOW - synopsis_upto >= STORY_SYNOPSIS_EVERY:
+            self._summarizing.add(job)
+            self._summary_executor.submit(self._fold_story, story_id)
+
+    @traced("memory.story_synopsis")
+    def _fold_story(self, story_id):
+        job = ("story", story_id)
+        try:
+            with self._lock:
+                synopsis, synopsis_upto, chunk_count = self.conn.execute(
+                    "SELECT synopsis, synopsis_upto, chunk_count FROM stories WHERE id = ?", (story_id,)
+                ).fetchone()
+                upto = chunk_count - STORY_WINDOW
+                chunks = [text for (text,) in self.conn.execute(
+                    "SELECT content FROM story_chunks WHERE story_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                    (story_id, synopsis_upto, upto)
+                )]
+            if not chunks:
+                return
+            new_synopsis = self.summarizer(synopsis or "(tiada)", "\n\n".join(chunks), STORY_SYNOPSIS_MAX_CHARS,
+                                           kind="story")
+            with self._lock:
+                self.conn.execute(
+                    "UPDATE stories SET synopsis = ?, synopsis_upto = ? WHERE id = ?",
+                    (new_synopsis[:STORY_SYNOPSIS_MAX_CHARS], upto, story_id)
+                )
+                self.conn.commit()
+        except Exception:
+            tracer.incr("summary_failed")
+        finally:
+            self._summarizing.discard(job)
+
+    def _migrate_story_content(self, cursor):
+        # Cerita lama (content bersambung) dipecah ikut perenggan jadi chunks
+        now = datetime.now(MALAYSIA_TZ).isoformat()
+        for story_id, content in cursor.execute("SELECT id, content FROM stories").fetchall():
+            parts = [p for p in (content or "").split("\n\n") if p.strip()]
+            cursor.executemany(
+                "INSERT INTO story_chunks (story_id, seq, content, created_at) VALUES (?, ?, ?, ?)",
+                [(story_id, seq, part, now) for seq, part in enumerate(parts)]
+            )
+            cursor.execute("UPDATE stories SET content = '', chunk_count = ? WHERE id = ?", (len(parts), story_id))
 
     # ===== DREAMS =====
+    @_locked
     def save_dream(self, dream_text):
         cursor = self.conn.cursor()
         cursor.execute(
             "INSERT INTO dreams (dream_text, date) VALUES (?, ?)",
-            (dream_text, datetime.now(malaysia_tz).isoformat())
+            (dream_text, datetime.now(MALAYSIA_TZ).isoformat())
         )
         self.conn.commit()
 
+    @traced("memory.get_random_dream")
+    @_locked
+    def get_random_dream(self):
+        row = self.conn.execute("SELECT dream_text FROM dreams ORDER BY RANDOM() LIMIT 1").fetchone()
+        return row[0] if row else None
+
     # ===== STATS =====
+    @traced("memory.increment_stat")
+    @_locked
     def increment_stat(self, key, inc=1):
         cursor = self.conn.cursor()
         cursor.execute("INSERT OR IGNORE INTO user_stats (key, value) VALUES (?, 0)", (key,))
         cursor.execute("UPDATE user_stats SET value = value + ? WHERE key = ?", (inc, key))
         self.conn.commit()
+        if ("stat", key) in self._cache:
+            self._cache[("stat", key)] += inc
 
+    @traced("memory.get_stat")
+    @_locked
     def get_stat(self, key):
+        return self._cache_get("stat", key, lambda: self._load_stat(key))
+
+    def _load_stat(self, key):
         cursor = self.conn.cursor()
         cursor.execute("SELECT value FROM user_stats WHERE key = ?", (key,))
         row = cursor.fetchone()
         return row[0] if row else 0
 
+    # ===== GAMIFICATION =====
+    def _load_progress(self, user_id):
+        counters = dict(self.conn.execute("SELECT key, value FROM user_counters WHERE user_id = ?", (user_id,)))
+        earned = dict(self.conn.execute(
+            "SELECT badge_id, earned_at FROM user_badges WHERE user_id = ? ORDER BY earned_at, rowid", (user_id,)
+        ))
+        return {"counters": counters, "earned": earned}
+
+    def _record_activity(self, cursor, user_id, now, events, mood_score=0.0, language=None):
+        """
+        Apply one interaction to a copy of the user's counters and write only
+        what changed (caller commits). Returns (new state, new badge names).
+        """
+        state = self._cache_get("progress", user_id, lambda: self._load_progress(user_id))
+        counters, earned = dict(state["counters"]), dict(state["earned"])
+        changed, new_badges = gamification.apply(
+            counters, earned, datetime.fromisoformat(now).date().toordinal(), events,
+            slot=current_period().slot, language=language, mood_score=mood_score
+        )
+        cursor.executemany(
+            "INSERT INTO user_counters (user_id, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id, key) DO UPDATE SET value = excluded.value",
+            [(user_id, key, counters[key]) for key in changed]
+        )
+        for badge in new_badges:
+            earned[badge.id] = now
+        cursor.executemany(
+            "INSERT OR IGNORE INTO user_badges (user_id, badge_id, earned_at) VALUES (?, ?, ?)",
+            [(user_id, badge.id, now) for badge in new_badges]
+        )
+        if gamification.MESSAGE in events:
+            # Kaunter global lama (user_stats) kekal untuk pembaca sedia ada
+            cursor.execute("INSERT OR IGNORE INTO user_stats (key, value) VALUES ('total_messages', 0)")
+            cursor.execute("UPDATE user_stats SET value = value + 1 WHERE key = 'total_messages'")
+        if new_badges:
+            tracer.incr("badge_earned", len(new_badges))
+        return {"counters": counters, "earned": earned}, [badge.name for badge in new_badges]
+
+    def _commit_progress(self, user_id, state, events):
+        # Cache hanya dikemas kini selepas commit berjaya
+        self._cache[("progress", user_id)] = state
+        if gamification.MESSAGE in events and ("stat", "total_messages") in self._cache:
+            self._cache[("stat", "total_messages")] += 1
+
+    @traced("memory.get_progress")
+    @_locked
+    def get_progress(self, user_id=DEFAULT_USER):
+        """Level, streak and badges from the stored counters (no scan of conversations)"""
+        state = self._cache_get("progress", user_id, lambda: self._load_progress(user_id))
+        today = datetime.now(MALAYSIA_TZ).date().toordinal()
+        return gamification.progress(state["counters"], state["earned"], today)
+
+    @traced("memory.finish_latest_story")
+    @_locked
+    def finish_latest_story(self, user_id=DEFAULT_USER):
+        """Finish the user's most recently continued unfinished story. Returns (title, chapters, new badges)"""
+        row = self.conn.execute(
+            "SELECT id, title, chunk_count FROM stories WHERE user_id = ? AND finished_at IS NULL "
+            "ORDER BY last_continued DESC, id DESC LIMIT 1", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = datetime.now(MALAYSIA_TZ).isoformat()
+        cursor = self.conn.cursor()
+        cursor.execute("UPDATE stories SET finished_at = ? WHERE id = ?", (now, row[0]))
+        state, new_badges = self._record_activity(cursor, user_id, now, (gamification.STORY_FINISHED,))
+        self.conn.commit()
+        self._commit_progress(user_id, state, ())
+        return row[1], row[2], new_badges
+
+    def _backfill_progress(self, cursor):
+        """One-off, when the counter tables are created: replay existing history per user"""
+        day_rows = cursor.execute("""
+            SELECT user_id, substr(timestamp, 1, 10) AS day,
+                   SUM(CASE WHEN model_used IN ('Crisis Alert', 'Fatigue') THEN 0 ELSE repeat_count END),
+                   SUM(CASE WHEN CAST(substr(timestamp, 12, 2) AS INTEGER) < 5
+                             OR CAST(substr(timestamp, 12, 2) AS INTEGER) >= 23 THEN repeat_count ELSE 0 END),
+                   SUM(CASE WHEN mood_score > ? THEN repeat_count ELSE 0 END)
+            FROM conversations WHERE timestamp IS NOT NULL GROUP BY user_id, day ORDER BY user_id, day
+        """, (gamification.HAPPY_MOOD,)).fetchall()
+        users = {}
+        for user_id, day, messages, night, happy in day_rows:
+            try:
+                ordinal = datetime.fromisoformat(day).date().toordinal()
+            except ValueError:
+                continue
+            counters = users.setdefault(user_id, {})
+            gamification.apply(counters, {}, ordinal, events=())
+            for key, value in ((gamification.MESSAGE, messages), (gamification.NIGHT, night),
+                               (gamification.HAPPY, happy)):
+                counters[key] = counters.get(key, 0) + (value or 0)
+        for user_id, chapters, finished in cursor.execute(
+            "SELECT user_id, SUM(MAX(chunk_count - 1, 0)), COUNT(finished_at) FROM stories GROUP BY user_id"
+        ).fetchall():
+            counters = users.setdefault(user_id or DEFAULT_USER, {})
+            if chapters:
+                counters[gamification.CHAPTER] = chapters
+            if finished:
+                counters[gamification.STORY_FINISHED] = finished
+        now = datetime.now(MALAYSIA_TZ).isoformat()
+        for user_id, counters in users.items():
+            cursor.executemany("INSERT INTO user_counters (user_id, key, value) VALUES (?, ?, ?)",
+                               [(user_id, key, value) for key, value in counters.items()])
+            cursor.executemany(
+                "INSERT INTO user_badges (user_id, badge_id, earned_at) VALUES (?, ?, ?)",
+                [(user_id, badge.id, now) for badge in gamification.BADGES
+                 if badge in gamification.check(counters, {}, list(counters))]
+            )
+
     # ===== CRISIS LOG =====
+    @traced("memory.log_crisis_event")
+    @_locked
     def log_crisis_event(self, user_message, detected_keyword):
         cursor = self.conn.cursor()
         cursor.execute("""
@@ -164,11 +816,13 @@ class MemoryManager:
         """)
         cursor.execute(
             "INSERT INTO crisis_log (timestamp, user_message, detected_keyword) VALUES (?, ?, ?)",
-            (datetime.now(malaysia_tz).isoformat(), user_message[:200], detected_keyword)
+            (datetime.now(MALAYSIA_TZ).isoformat(), user_message[:200], detected_keyword)
         )
         self.conn.commit()
 
     # ===== SIMPLE VAULT METHODS (untuk compatibility) =====
+    @traced("memory.save_to_vault")
+    @_locked
     def save_to_vault(self, user_msg, ayra_msg, mood_score=0.0, model_used="Gemini", is_important=False):
         # Simple version - tak buat apa-apa
         pass
@@ -180,4 +834,50 @@ class MemoryManager:
         return []
 
     def get_vault_stats(self):
-        return {'total_memories': 0}
\ No newline at end of file
+        return {'total_memories': 0}
+
+
+def _as_messages(rows):
+    """[(user, ayra), ...] -> alternating user/assistant chat messages"""
+    messages = []
+    for user, ayra in rows:
+        messages.append({"role": "user", "content": user})
+        messages.append({"role": "assistant", "content": ayra})
+    return messages
+
+
+def _fuse_rankings(fts_results, vector_results):
+    """Reciprocal rank fusion; rows are matched on the user message text"""
+    fused = {}
+    for rank, row in enumerate(fts_results):
+        key = (row["user_message"] or "")[:100].strip().lower()
+        fused[key] = {**row, "score": 1 / (RRF_K + rank + 1)}
+    for rank, memory in enumerate(vector_results):
+        metadata = memory.get("metadata", {})
+        key = metadata.get("user_message_preview", memory.get("content", ""))[:100].strip().lower()
+        entry = fused.setdefault(key, {
+            "id": None, "timestamp": metadata.get("timestamp"), "user_message": metadata.get("user_message_preview"),
+            "ayra_response": metadata.get("ayra_response_preview"), "snippet": memory.get("content", "")[:80],
+            "score": 0.0,
+        })
+        entry["score"] += 1 / (RRF_K + rank + 1)
+    return sorted(fused.values(), key=lambda r: r["score"], reverse=True)
+
+
+# For testing
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    memory = MemoryManager(os.path.join(tempfile.mkdtemp(prefix="ayra-memory-"), "memory.db"))
+    for i in range(12):
+        for user in ("a", "b", "c"):
+            memory.save_interaction(f"{user} mesej {i} tentang topik{i}", f"balasan {i} untuk {user}", user_id=user)
+    # Setiap entri dedup mesti tunjuk ke baris milik user (scope) yang sama
+    owners = dict(memory.conn.execute("SELECT id, user_id FROM conversations"))
+    wrong = [row_id for row_id, (scope, _) in memory.dedup._entries.items() if owners.get(row_id) != scope]
+    print(f"dedup entries: {len(memory.dedup._entries)}, wrong owner: {wrong}")
+    memory.save_interaction("b mesej 3 tentang topik3", "balasan 3 untuk b", user_id="b")
+    print("merged:", memory.conn.execute(
+        "SELECT id, user_id, user_message, repeat_count FROM conversations WHERE repeat_count > 1"
+    ).fetchall())
@@ -1,29 +1,155 @@
 # utils/model_router.py - Simplified version (Gemini only)
 
 import os
+import time
 import google.generativeai as genai
-from .prompts import AYRA_SYSTEM_PROMPT
+from .calendar_service import current_period
+from .prompts import AYRA_SYSTEM_PROMPT, LANGUAGE_HINTS, SUMMARY_PROMPT, STORY_SYNOPSIS_PROMPT
+from .image_processor import ImageProcessor
+from .llm_governor import governor as default_governor, CircuitOpenError
+from .memory_manager import RECENT_EXCHANGES, SUMMARY_EVERY
+from .singleflight import llm_singleflight, prompt_key
+from .tracing import span
+
+IMAGE_TOKENS = 258  # Gemini bills each image tile at a fixed token count
+# Sama dengan had get_context(): semua exchange selepas watermark ringkasan
+MAX_CONTEXT_MESSAGES = 2 * (RECENT_EXCHANGES + SUMMARY_EVERY)
+BUSY_MESSAGE = "Alamak, AYRA tengah sesak sikit sekarang. Cuba lagi dalam {seconds} saat ya? 🙏"
 
 class ModelRouter:
-    def __init__(self):
-        # Gemini only
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        self.gemini_model = genai.GenerativeModel('gemini-2.5-flash')
+    def __init__(self, model=None, governor=None, singleflight=None):
+        # Gemini only. `model` boleh diganti dengan stub yang ada generate_content()
+        if model is None:
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            model = genai.GenerativeModel('gemini-2.5-flash')
+        self.gemini_model = model
+        # Semua call ke backend lalu governor (concurrency, budget, retry, circuit breaker)
+        self.governor = governor or default_governor
+        # Prompt sama yang sedang in-flight dikongsi, tak hantar dua kali
+        self.singleflight = singleflight or llm_singleflight
+        self.image_processor = ImageProcessor()
 
-    def route(self, user_input, context, memory_profile=None):
+    def route(self, user_input, context, memory_profile=None, summary=None, language=None):
         # Always use Gemini
-        return self.call_gemini(user_input, context, memory_profile), "Gemini (Ayra)"
+        return self.call_gemini(user_input, context, memory_profile, summary, language), "Gemini (Ayra)"
+
+    def route_image(self, image_bytes, instruction):
+        # Gemini 2.5 Flash is multimodal, so images go to the same model
+        return self.call_gemini_vision(image_bytes, instruction), "Gemini Vision (Ayra)"
+
+    def route_stream(self, user_input, context, memory_profile=None, summary=None, language=None):
+        # Returns (generator of text chunks, model name)
+        return self.stream_gemini(user_input, context, memory_profile, summary, language), "Gemini (Ayra)"
 
-    def call_gemini(self, user_input, context, memory_profile=None):
+    def build_prompt(self, user_input, context, memory_profile=None, summary=None, language=None):
         prompt = AYRA_SYSTEM_PROMPT + "\n\n"
+        # Berubah hanya pada sempadan waktu, jadi prompt kekal sama untuk singleflight/prefetch
+        prompt += current_period().prompt_hint + "\n"
+        if language in LANGUAGE_HINTS:
+            prompt += LANGUAGE_HINTS[language] + "\n"
         if memory_profile:
             prompt += f"User profile: {memory_profile}\n"
-        for msg in context[-6:]:
+        if summary:
+            # Ganti history lama: saiz prompt kekal walaupun perbualan dah beribu mesej
+            prompt += f"Ringkasan perbualan lepas: {summary}\n"
+        for msg in context[-MAX_CONTEXT_MESSAGES:]:
             prompt += f"{msg['role']}: {msg['content']}\n"
         prompt += f"user: {user_input}\nassistant:"
-        
-        try:
-            response = self.gemini_model.generate_content(prompt)
+        return prompt
+
+    def complete(self, user_input, context=(), memory_profile=None, summary=None, language=None):
+        """Like call_gemini, but raises on failure instead of returning an apology"""
+        prompt = self.build_prompt(user_input, context, memory_profile, summary, language)
+
+        with span("router.call_gemini", prompt_chars=len(prompt)) as s:
+            try:
+                response = self.singleflight.do(
+                    prompt_key(prompt),
+                    lambda: self.governor.call(
+                        lambda: self.gemini_model.generate_content(prompt), est_tokens=estimate_tokens(prompt)
+                    )
+                )
+            except Exception as e:
+                s["attrs"]["error"] = "CircuitOpen" if isinstance(e, CircuitOpenError) else type(e).__name__
+                raise
+            s["attrs"]["response_chars"] = len(response.text)
             return response.text
+
+    def call_gemini(self, user_input, context, memory_profile=None, summary=None, language=None):
+        try:
+            return self.complete(user_input, context, memory_profile, summary, language)
         except Exception as e:
-            return f"Maaf, AYRA ada masalah teknikal: {str(e)}"
\ No newline at end of file
+            return error_message(e)
+
+    def stream_gemini(self, user_input, context, memory_profile=None, summary=None, language=None):
+        prompt = self.build_prompt(user_input, context, memory_profile, summary, language)
+
+        with span("router.stream_gemini", prompt_chars=len(prompt)) as s:
+            start = time.perf_counter()
+            try:
+                chunks = self.governor.stream(
+                    lambda: self.gemini_model.generate_content(prompt, stream=True), est_tokens=estimate_tokens(prompt)
+                )
+                for chunk in chunks:
+                    if "first_chunk_ms" not in s["attrs"]:
+                        s["attrs"]["first_chunk_ms"] = (time.perf_counter() - start) * 1000
+                    if chunk.text:
+                        yield chunk.text
+            except CircuitOpenError as e:
+                s["attrs"]["error"] = "CircuitOpen"
+                yield BUSY_MESSAGE.format(seconds=max(1, int(e.retry_after)))
+            except Exception as e:
+                s["attrs"]["error"] = type(e).__name__
+                yield f"Maaf, AYRA ada masalah teknikal: {str(e)}"
+
+    def summarize(self, summary, text, max_chars, kind="conversation"):
+        """Fold new text into a running summary or story synopsis (used by MemoryManager in the background)"""
+        template = STORY_SYNOPSIS_PROMPT if kind == "story" else SUMMARY_PROMPT
+        prompt = template.format(summary=summary, text=text, max_chars=max_chars)
+        with span("router.summarize", prompt_chars=len(prompt), kind=kind):
+            response = self.governor.call(
+                lambda: self.gemini_model.generate_content(prompt), est_tokens=estimate_tokens(prompt)
+            )
+        return response.text.strip()
+
+    def call_gemini_vision(self, image_bytes, instruction):
+        # Kecilkan & buang EXIF dulu sebelum upload
+        with span("router.prepare_image", original_bytes=len(image_bytes)) as s:
+            try:
+                image = self.image_processor.prepare(image_bytes)
+            except Exception as e:
+                # Bukan gambar (cth. PDF dengan mod 📸 Imej) atau fail rosak
+                s["attrs"]["error"] = type(e).__name__
+                return f"Maaf, AYRA tak dapat baca gambar ni: {str(e)}"
+        prompt = AYRA_SYSTEM_PROMPT + "\n\n" + f"user: {instruction}\nassistant:"
+
+        with span("router.call_gemini_vision", prompt_chars=len(prompt), image_bytes=len(image["data"])) as s:
+            try:
+                response = self.singleflight.do(
+                    prompt_key(prompt, image["hash"]),
+                    lambda: self.governor.call(
+                        lambda: self.gemini_model.generate_content(
+                            [prompt, {"mime_type": image["mime_type"], "data": image["data"]}]
+                        ),
+                        est_tokens=estimate_tokens(prompt) + IMAGE_TOKENS
+                    )
+                )
+                return response.text
+            except CircuitOpenError as e:
+                s["attrs"]["error"] = "CircuitOpen"
+                return BUSY_MESSAGE.format(seconds=max(1, int(e.retry_after)))
+            except Exception as e:
+                s["attrs"]["error"] = type(e).__name__
+                return f"Maaf, AYRA tak dapat baca gambar ni: {str(e)}"
+
+
+def error_message(error):
+    """User-facing reply for a failed model call"""
+    if isinstance(error, CircuitOpenError):
+        return BUSY_MESSAGE.format(seconds=max(1, int(error.retry_after)))
+    return f"Maaf, AYRA ada masalah teknikal: {str(error)}"
+
+
+def estimate_tokens(text):
+    # Anggaran kasar ~4 aksara setiap token, cukup untuk budget TPM
+    return len(text) // 4
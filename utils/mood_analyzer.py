@@ -1,33 +1,42 @@
 import re
 from collections import deque
 from textblob import TextBlob  # for more accurate sentiment
+from .language import ENGLISH, MALAY
+from .tracing import traced
+
+# Simple Malay lexicon
+POSITIVE_WORDS = {"baik", "suka", "happy", "gembira", "best", "seronok", "bagus", "terbaik",
+                  "syiok", "cun", "lawaa", "power", "mantap", "semangat", "ok", "setuju"}
+NEGATIVE_WORDS = {"tak", "tidak", "sedih", "sad", "benci", "geram", "fail", "gagal", "susah",
+                  "payah", "pening", "stress", "penat", "letih", "boring", "bosan", "malas"}
 
 class MoodAnalyzer:
     def __init__(self, window_size=5):
         self.window_size = window_size
         self.scores = deque(maxlen=window_size)
 
-    def analyze_sentiment(self, text):
-        # Use TextBlob for English, fallback to simple lexicon for Malay
-        blob = TextBlob(text)
-        if blob.sentiment.polarity != 0:
-            return blob.sentiment.polarity  # range -1 to 1
-        else:
-            # Simple Malay lexicon
-            positive = {"baik", "suka", "happy", "gembira", "best", "seronok", "bagus", "terbaik",
-                        "syiok", "cun", "lawaa", "power", "mantap", "semangat", "ok", "setuju"}
-            negative = {"tak", "tidak", "sedih", "sad", "benci", "geram", "fail", "gagal", "susah",
-                        "payah", "pening", "stress", "penat", "letih", "boring", "bosan", "malas"}
-            tokens = re.findall(r"\w+", text.lower())
-            pos = sum(1 for t in tokens if t in positive)
-            neg = sum(1 for t in tokens if t in negative)
-            total = len(tokens)
-            if total == 0:
-                return 0.0
-            return (pos - neg) / total
+    def analyze_sentiment(self, text, language=None):
+        # Malay: lexicon sahaja (TextBlob tak faham BM). English: TextBlob sahaja.
+        # Manglish / tak tahu: TextBlob dulu, lexicon bila polarity tepat 0
+        if language == MALAY:
+            return self._lexicon_score(text)
+        polarity = TextBlob(text).sentiment.polarity  # range -1 to 1
+        if polarity != 0 or language == ENGLISH:
+            return polarity
+        return self._lexicon_score(text)
+
+    @staticmethod
+    def _lexicon_score(text):
+        tokens = re.findall(r"\w+", text.lower())
+        if not tokens:
+            return 0.0
+        pos = sum(1 for t in tokens if t in POSITIVE_WORDS)
+        neg = sum(1 for t in tokens if t in NEGATIVE_WORDS)
+        return (pos - neg) / len(tokens)
 
-    def update(self, text):
-        score = self.analyze_sentiment(text)
+    @traced("mood.update")
+    def update(self, text, language=None):
+        score = self.analyze_sentiment(text, language)
         self.scores.append(score)
         avg_score = sum(self.scores) / len(self.scores)
         return avg_score
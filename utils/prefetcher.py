@@ -0,0 +1,168 @@
+# utils/prefetcher.py
+
+"""
+Speculative prefetcher for predictable follow-up turns.
+The engine predicts what the user will most likely ask next (e.g. /sambung
+after /cerita, "Cari poin penting" after a file summary) and schedules the
+model call here. It runs in the background only while the LLM governor is
+idle and within a per-minute budget; results sit in a short-TTL cache until
+the real request arrives. Unused results are counted as wasted spend.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from .tracing import tracer
+
+ENABLED = os.getenv("AYRA_PREFETCH", "1") != "0"
+TTL = float(os.getenv("AYRA_PREFETCH_TTL", "180"))  # saat
+BUDGET_PER_MIN = int(os.getenv("AYRA_PREFETCH_BUDGET", "10"))  # call spekulatif seminit
+# Tunggu prefetch yang masih berjalan paling lama ni; lepas tu lebih baik call terus
+WAIT = float(os.getenv("AYRA_PREFETCH_WAIT", "3"))  # saat
+MAX_WORKERS = 2
+MAX_ENTRIES = 256
+
+
+class Prefetcher:
+    def __init__(self, ttl=TTL, budget_per_min=BUDGET_PER_MIN, max_workers=MAX_WORKERS,
+                 max_entries=MAX_ENTRIES, is_idle=None, enabled=ENABLED, wait=WAIT):
+        self.ttl = ttl
+        self.wait = wait
+        self.budget_per_min = budget_per_min
+        self.max_entries = max_entries
+        self.enabled = enabled
+        # Callable: True bila backend lapang. Spekulasi tak boleh rampas slot user sebenar
+        self.is_idle = is_idle or (lambda: True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ayra-prefetch")
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # key -> (expires_at, value, cost)
+        self._pending = {}           # key -> Future
+        self._budget = float(budget_per_min)
+        self._budget_at = time.monotonic()
+        self.stats = {"scheduled": 0, "hits": 0, "inflight_hits": 0, "misses": 0,
+                      "skipped_busy": 0, "skipped_budget": 0, "errors": 0, "wait_timeouts": 0,
+                      "wasted": 0, "wasted_tokens": 0, "spent_tokens": 0}
+
+    # ===== PUBLIC =====
+    def schedule(self, key, fn, est_tokens=0):
+        """Run fn() in the background and cache its result under key. Returns True if scheduled"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            self._expire()
+            if key in self._cache or key in self._pending:
+                return False
+            if not self.is_idle():
+                self.stats["skipped_busy"] += 1
+                return False
+            if not self._take_budget():
+                self.stats["skipped_budget"] += 1
+                tracer.incr("prefetch_skipped_budget")
+                return False
+            self.stats["scheduled"] += 1
+            self.stats["spent_tokens"] += est_tokens
+            self._pending[key] = self._executor.submit(self._run, key, fn, est_tokens)
+        tracer.incr("prefetch_scheduled")
+        return True
+
+    def get(self, key, wait=None):
+        """
+        Return the prefetched value for key, or None on a miss.
+        A prefetch still running is joined for up to `wait` seconds (default
+        self.wait) since it is usually closer to done than a fresh call; past
+        that it counts as a miss so the caller calls the model directly.
+        """
+        with self._lock:
+            self._expire()
+            entry = self._cache.pop(key, None)
+            future = self._pending.get(key) if entry is None else None
+        if entry is not None:
+            self.stats["hits"] += 1
+            tracer.incr("prefetch_hit")
+            return entry[1]
+        if future is not None:
+            try:
+                value = future.result(timeout=self.wait if wait is None else wait)
+            except FutureTimeout:
+                # Spekulasi tersangkut: jangan tahan turn user, hasilnya (kalau siap) luput ikut TTL
+                self.stats["wait_timeouts"] += 1
+                tracer.incr("prefetch_wait_timeout")
+                value = None
+            except Exception:
+                value = None
+            with self._lock:
+                self._cache.pop(key, None)
+            if value is not None:
+                self.stats["inflight_hits"] += 1
+                tracer.incr("prefetch_hit")
+                return value
+        self.stats["misses"] += 1
+        tracer.incr("prefetch_miss")
+        return None
+
+    def get_stats(self):
+        with self._lock:
+            self._expire()
+            cached = len(self._cache)
+            pending = len(self._pending)
+        hits = self.stats["hits"] + self.stats["inflight_hits"]
+        lookups = hits + self.stats["misses"]
+        return {**self.stats, "cached": cached, "pending": pending,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "waste_rate": self.stats["wasted"] / self.stats["scheduled"] if self.stats["scheduled"] else 0.0}
+
+    # ===== INTERNALS =====
+    def _run(self, key, fn, est_tokens):
+        try:
+            value = fn()
+        except Exception:
+            self.stats["errors"] += 1
+            value = None
+        with self._lock:
+            self._pending.pop(key, None)
+            if value is not None:
+                self._cache[key] = (time.monotonic() + self.ttl, value, est_tokens)
+                while len(self._cache) > self.max_entries:
+                    _, (_, _, cost) = self._cache.popitem(last=False)
+                    self._waste(cost)
+        return value
+
+    def _expire(self):
+        now = time.monotonic()
+        # OrderedDict ikut masa masuk, jadi yang paling lama sentiasa di depan
+        while self._cache:
+            key, (expires_at, _, cost) = next(iter(self._cache.items()))
+            if expires_at > now:
+                break
+            del self._cache[key]
+            self._waste(cost)
+
+    def _waste(self, cost):
+        self.stats["wasted"] += 1
+        self.stats["wasted_tokens"] += cost
+        tracer.incr("prefetch_wasted")
+
+    def _take_budget(self):
+        now = time.monotonic()
+        self._budget = min(self.budget_per_min, self._budget + (now - self._budget_at) * self.budget_per_min / 60)
+        self._budget_at = now
+        if self._budget < 1:
+            return False
+        self._budget -= 1
+        return True
+
+
+# For testing
+if __name__ == "__main__":
+    pf = Prefetcher(ttl=0.5, budget_per_min=3)
+    for i in range(5):
+        print(f"schedule story:{i}", pf.schedule(f"story:{i}", lambda i=i: f"sambungan {i}", est_tokens=100))
+    time.sleep(0.1)
+    print("get story:0 ->", pf.get("story:0"))
+    print("get story:9 ->", pf.get("story:9"))
+    time.sleep(0.6)
+    print("get story:1 (expired) ->", pf.get("story:1"))
+    print(pf.get_stats())
@@ -41,4 +41,32 @@ You are Ayra. Be the friend everyone wishes they had—understanding, funny, and
 
 # Specialised prompts for other models
 DEEPSEEK_PROMPT = "You are Jiji, an AI specialised in logic, mathematics, and coding. Provide precise, well-reasoned answers. Use Malaysian English if appropriate."
-CLAUDE_PROMPT = "You are Fikri, an AI focused on ethical reasoning and structured professional writing. Provide thoughtful, balanced perspectives. Use Malaysian English if appropriate."
\ No newline at end of file
+CLAUDE_PROMPT = "You are Fikri, an AI focused on ethical reasoning and structured professional writing. Provide thoughtful, balanced perspectives. Use Malaysian English if appropriate."
+# Bahasa mesej user (utils.language) -> arahan balas. Manglish ikut default persona
+LANGUAGE_HINTS = {
+    "ms": "User tulis dalam Bahasa Melayu. Balas dalam BM santai (boleh selit sikit English).",
+    "en": "User writes in English. Reply mainly in casual Malaysian English, with just a sprinkle of Malay.",
+}
+SUMMARY_PROMPT = """Kemas kini ringkasan perbualan antara user dan AYRA.
+Kekalkan fakta penting (nama, minat, kerja, janji, perasaan, cerita yang sedang berjalan) dan buang basa-basi.
+Tulis dalam ayat pendek, maksimum {max_chars} aksara.
+
+Ringkasan sekarang:
+{summary}
+
+Perbualan baru:
+{text}
+
+Ringkasan baru:"""
+
+STORY_SYNOPSIS_PROMPT = """Kemas kini sinopsis cerita yang AYRA dan user tulis bersama.
+Kekalkan watak, tempat dan plot utama supaya cerita boleh disambung dengan konsisten.
+Maksimum {max_chars} aksara.
+
+Sinopsis sekarang:
+{summary}
+
+Babak baru:
+{text}
+
+Sinopsis baru:"""
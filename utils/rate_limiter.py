@@ -0,0 +1,138 @@
+# utils/rate_limiter.py
+
+"""
+Token-bucket rate limiting for AYRA, persisted in SQLite so limits hold
+across browser tabs, API sessions and worker processes.
+Each check is O(1): one row per bucket, read and updated in a single
+IMMEDIATE transaction. The "recharge" fatigue persona sits on top.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+# Per-user: burst 5 mesej, isi semula 5 token setiap 2 minit
+USER_CAPACITY = 5
+USER_REFILL_PER_SEC = 5 / 120
+# Global: lindungi quota Gemini untuk semua user dalam deployment ni
+GLOBAL_RPM = int(os.getenv("AYRA_GLOBAL_RPM", "60"))
+GLOBAL_KEY = "__global__"
+FATIGUE_COOLDOWN = 300  # saat
+PRUNE_EVERY = 500  # check: buang bucket pelawat yang dah penuh semula (setiap pelawat Streamlit ada id sendiri)
+
+
+class RateLimiter:
+    def __init__(self, db_path, user_capacity=USER_CAPACITY, user_refill_per_sec=USER_REFILL_PER_SEC,
+                 global_rpm=GLOBAL_RPM):
+        self.conn = sqlite3.connect(db_path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL,
+                updated_at REAL
+            )
+        """)
+        self.user_capacity = user_capacity
+        self.user_refill_per_sec = user_refill_per_sec
+        self.global_capacity = global_rpm
+        self.global_refill_per_sec = global_rpm / 60
+        self._lock = threading.Lock()
+        self._checks = 0
+
+    def check(self, user_id, cost=1, now=None):
+        """
+        Take `cost` tokens from the user's bucket and the global bucket.
+        Returns: (allowed, scope) where scope is None, "user" or "global".
+        Nothing is deducted unless both buckets allow it.
+        """
+        now = time.time() if now is None else now
+        user_key = f"user:{user_id}"
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                user_tokens = self._refill(user_key, self.user_capacity, self.user_refill_per_sec, now)
+                if user_tokens < cost:
+                    self._store(user_key, user_tokens, now)
+                    self.conn.execute("COMMIT")
+                    return False, "user"
+                global_tokens = self._refill(GLOBAL_KEY, self.global_capacity, self.global_refill_per_sec, now)
+                if global_tokens < cost:
+                    self._store(GLOBAL_KEY, global_tokens, now)
+                    self.conn.execute("COMMIT")
+                    return False, "global"
+                self._store(user_key, user_tokens - cost, now)
+                self._store(GLOBAL_KEY, global_tokens - cost, now)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self._checks += 1
+            if self._checks % PRUNE_EVERY == 0:
+                self._prune(now)
+            return True, None
+
+    def _prune(self, now):
+        # Bucket yang lama tak guna dah penuh semula = sama macam takde baris
+        self.conn.execute(
+            "DELETE FROM rate_buckets WHERE key LIKE 'user:%' AND updated_at < ?",
+            (now - self.user_capacity / self.user_refill_per_sec,)
+        )
+
+    def _refill(self, key, capacity, refill_per_sec, now):
+        row = self.conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return capacity
+        tokens, updated_at = row
+        return min(capacity, tokens + max(0.0, now - updated_at) * refill_per_sec)
+
+    def _store(self, key, tokens, now):
+        self.conn.execute("REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)", (key, tokens, now))
+
+    def reset(self, user_id):
+        with self._lock:
+            self.conn.execute("DELETE FROM rate_buckets WHERE key = ?", (f"user:{user_id}",))
+
+
+class FatigueEngine:
+    """
+    AYRA's 'recharge' persona on top of RateLimiter.
+    Emptying your own bucket puts AYRA to rest for FATIGUE_COOLDOWN seconds;
+    a global shortage only defers this one message.
+    """
+
+    def __init__(self, limiter, cooldown=FATIGUE_COOLDOWN):
+        self.limiter = limiter
+        self.cooldown = cooldown
+        self.conn = limiter.conn
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS fatigue_state (
+                user_id TEXT PRIMARY KEY,
+                until REAL
+            )
+        """)
+
+    def is_tired(self, user_id, now=None):
+        """Returns True if AYRA should reply with the recharge message"""
+        now = time.time() if now is None else now
+        with self.limiter._lock:
+            row = self.conn.execute("SELECT until FROM fatigue_state WHERE user_id = ?", (user_id,)).fetchone()
+        if row and row[0] > now:
+            return True
+
+        allowed, scope = self.limiter.check(user_id, now=now)
+        if allowed:
+            return False
+        if scope == "user":
+            with self.limiter._lock:
+                self.conn.execute("DELETE FROM fatigue_state WHERE until < ?", (now,))
+                self.conn.execute(
+                    "REPLACE INTO fatigue_state (user_id, until) VALUES (?, ?)", (user_id, now + self.cooldown)
+                )
+        return True
+
+    def tired_until(self, user_id):
+        with self.limiter._lock:
+            row = self.conn.execute("SELECT until FROM fatigue_state WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
@@ -0,0 +1,108 @@
+# utils/singleflight.py
+
+"""
+Single-flight request coalescing.
+Concurrent calls with the same key share one execution: the first caller
+(the leader) runs the function, everyone else waits and receives the same
+result or exception. Works for threads (do) and asyncio (ado).
+"""
+
+import asyncio
+import hashlib
+import re
+import threading
+
+from .tracing import tracer
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def prompt_key(*parts):
+    """Normalized key for a model call: whitespace collapsed, case folded, hashed"""
+    normalized = "\x1f".join(_WHITESPACE.sub(" ", str(p)).strip().casefold() for p in parts)
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name="llm"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self.stats = {"executed": 0, "coalesced": 0}
+
+    def do(self, key, fn):
+        """Threaded mode: run fn() once per key among concurrent callers"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats["executed"] += 1
+            else:
+                call.waiters += 1
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            tracer.incr(f"{self.name}_coalesced")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def ado(self, key, coro_fn):
+        """Asyncio mode: await coro_fn() once per key among concurrent tasks (same event loop)"""
+        loop = asyncio.get_running_loop()
+        loop_key = (id(loop), key)
+        future = self._async_calls.get(loop_key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            tracer.incr(f"{self.name}_coalesced")
+            # shield: kalau satu waiter dibatalkan, leader tetap jalan untuk yang lain
+            return await asyncio.shield(future)
+
+        future = self._async_calls[loop_key] = loop.create_future()
+        self.stats["executed"] += 1
+        try:
+            result = await coro_fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Elak warning "exception never retrieved" kalau takde waiter
+            future.exception()
+            raise
+        finally:
+            del self._async_calls[loop_key]
+
+    def get_stats(self):
+        total = self.stats["executed"] + self.stats["coalesced"]
+        return {**self.stats, "coalesced_ratio": self.stats["coalesced"] / total if total else 0.0}
+
+
+# Process-wide instance shared by every ModelRouter
+llm_singleflight = SingleFlight("llm")
@@ -0,0 +1,231 @@
+# utils/tracing.py
+
+"""
+Lightweight per-turn tracing for AYRA.
+Spans are timed with perf_counter and kept in an in-process ring buffer,
+optionally mirrored to a SQLite metrics table, and exported as JSON or
+Prometheus text for the admin panel / metrics endpoint.
+"""
+
+import atexit
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RING_SIZE = 5000
+SQLITE_FLUSH_EVERY = 50
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current_trace = ContextVar("ayra_trace_id", default=None)
+
+
+class Tracer:
+    def __init__(self, capacity=RING_SIZE):
+        self.spans = deque(maxlen=capacity)
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+        self._db = None
+        self._pending = []
+
+    # ===== RECORDING =====
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time a block: `with tracer.span("router.call", prompt_chars=n) as s: s["attrs"][...] = ...`"""
+        trace_id = _current_trace.get()
+        token = None
+        if trace_id is None:
+            trace_id = uuid.uuid4().hex[:12]
+            token = _current_trace.set(trace_id)
+        record = {"name": name, "trace_id": trace_id, "attrs": attrs}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["duration_ms"] = (time.perf_counter() - start) * 1000
+            record["ts"] = time.time()
+            self._add(record)
+            if token is not None:
+                _current_trace.reset(token)
+
+    def traced(self, name=None):
+        """Decorator version of span()"""
+        def decorator(func):
+            span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name, duration_ms, **attrs):
+        """Record a duration measured elsewhere (e.g. across a Streamlit rerun)"""
+        self._add({
+            "name": name,
+            "trace_id": _current_trace.get(),
+            "attrs": attrs,
+            "duration_ms": duration_ms,
+            "ts": time.time(),
+        })
+
+    def incr(self, name, n=1):
+        """Bump an event counter (cache hits, coalesced calls, ...)"""
+        with self._lock:
+            self.counters[name] += n
+
+    def _add(self, record):
+        with self._lock:
+            self.spans.append(record)
+            if self._db is not None:
+                self._pending.append(record)
+                if len(self._pending) >= SQLITE_FLUSH_EVERY:
+                    self._flush_locked()
+
+    # ===== SQLITE SINK =====
+    def enable_sqlite(self, db_path):
+        with self._lock:
+            if self._db is not None:
+                return
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS metrics (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ts REAL,
+                    trace_id TEXT,
+                    name TEXT,
+                    duration_ms REAL,
+                    attrs TEXT
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_metrics_name_ts ON metrics (name, ts)")
+            self._db.commit()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._db is None or not self._pending:
+            return
+        rows = [
+            (r["ts"], r["trace_id"], r["name"], r["duration_ms"], json.dumps(r["attrs"], default=str))
+            for r in self._pending
+        ]
+        self._pending = []
+        self._db.executemany(
+            "INSERT INTO metrics (ts, trace_id, name, duration_ms, attrs) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        self._db.commit()
+
+    # ===== AGGREGATION =====
+    def summary(self):
+        """Per-span count, mean and p50/p95/p99 over the ring buffer"""
+        with self._lock:
+            spans = list(self.spans)
+        durations = defaultdict(list)
+        prompt_chars = defaultdict(list)
+        for record in spans:
+            durations[record["name"]].append(record["duration_ms"])
+            if "prompt_chars" in record["attrs"]:
+                prompt_chars[record["name"]].append(record["attrs"]["prompt_chars"])
+
+        stats = {}
+        for name, values in durations.items():
+            values.sort()
+            stats[name] = {
+                "count": len(values),
+                "sum_ms": sum(values),
+                "mean_ms": sum(values) / len(values),
+                **{f"p{int(q * 100)}_ms": _quantile(values, q) for q in QUANTILES},
+            }
+            if prompt_chars[name]:
+                stats[name]["mean_prompt_chars"] = sum(prompt_chars[name]) / len(prompt_chars[name])
+        return stats
+
+    def export_json(self):
+        return json.dumps({"stages": self.summary(), "counters": dict(self.counters)}, indent=2)
+
+    def export_prometheus(self):
+        lines = [
+            "# HELP ayra_stage_duration_ms Per-stage latency in milliseconds",
+            "# TYPE ayra_stage_duration_ms summary",
+        ]
+        for name, s in sorted(self.summary().items()):
+            for q in QUANTILES:
+                lines.append(f'ayra_stage_duration_ms{{stage="{name}",quantile="{q}"}} {s[f"p{int(q * 100)}_ms"]:.3f}')
+            lines.append(f'ayra_stage_duration_ms_sum{{stage="{name}"}} {s["sum_ms"]:.3f}')
+            lines.append(f'ayra_stage_duration_ms_count{{stage="{name}"}} {s["count"]}')
+        lines.append("# HELP ayra_events_total Event counters (cache hits, coalesced calls, ...)")
+        lines.append("# TYPE ayra_events_total counter")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'ayra_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+
+
+def _quantile(sorted_values, q):
+    # Nearest-rank, cukup untuk dashboard
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+# -------------------------------------------------------------------
+# Process-wide tracer
+# -------------------------------------------------------------------
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
+
+if os.getenv("AYRA_METRICS_DB"):
+    tracer.enable_sqlite(os.getenv("AYRA_METRICS_DB"))
+atexit.register(tracer.flush)
+
+
+# -------------------------------------------------------------------
+# Metrics endpoint (GET /metrics -> Prometheus, GET /metrics.json -> JSON)
+# -------------------------------------------------------------------
+_server = None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, content_type = tracer.export_json(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, content_type = tracer.export_prometheus(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """Start the metrics endpoint once per process (daemon thread)"""
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
@@ -0,0 +1,286 @@
+# utils/tts.py
+
+"""
+Text-to-speech for AYRA replies.
+Replies are cut into sentences and each sentence is synthesized on a small
+thread pool, so the first clip is ready long before the last one. Text can
+be pushed while the model is still streaming (SpeechStream): every finished
+sentence starts synthesizing immediately and clips come back in order.
+Clips are cached on disk by hash(voice, text) in a size-bounded LRU, since
+many AYRA replies (fatigue, crisis, easter eggs) repeat word for word.
+
+Backends are callables (text, voice) -> WAV bytes: StubTTS (quiet test
+tone, no dependencies) or EspeakTTS (espeak-ng binary, local).
+"""
+
+import hashlib
+import io
+import os
+import re
+import subprocess
+import threading
+import time
+import wave
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .tracing import tracer
+
+TTS_BACKEND = os.getenv("AYRA_TTS_BACKEND", "stub")  # stub | espeak
+TTS_VOICE = os.getenv("AYRA_TTS_VOICE", "ms")
+CACHE_DIR = os.getenv("AYRA_TTS_CACHE", "tts_cache")
+CACHE_MAX_BYTES = int(float(os.getenv("AYRA_TTS_CACHE_MB", "64")) * 1024 * 1024)
+MAX_WORKERS = 3
+MIN_SENTENCE_CHARS = 16  # ayat pendek ("Wah!") digabung dengan ayat seterusnya
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+_MARKUP = re.compile(r"[*_#`>|]+")
+# Satu kitaran gelombang segi tiga kecil (64 sampel PCM16) untuk StubTTS
+_STUB_PERIOD = b"".join((((i % 64) - 32) * 64).to_bytes(2, "little", signed=True) for i in range(64))
+
+
+def clean_for_speech(text):
+    """Drop markdown symbols that engines would read out loud"""
+    return _MARKUP.sub("", text).strip()
+
+
+def split_sentences(text):
+    """Complete sentences, short ones merged forward; the last piece may be unfinished"""
+    sentences, current = [], ""
+    for piece in _SENTENCE_END.split(text):
+        current = f"{current} {piece}".strip() if current else piece.strip()
+        if len(current) >= MIN_SENTENCE_CHARS:
+            sentences.append(current)
+            current = ""
+    if current:
+        sentences.append(current)
+    return sentences
+
+
+# ===== BACKENDS =====
+class StubTTS:
+    """No engine: a quiet 16 kHz tone, ~60 ms per character"""
+    name = "stub"
+
+    def __init__(self, latency_ms=0.0, rate=16000):
+        self.latency = latency_ms / 1000
+        self.rate = rate
+
+    def __call__(self, text, voice):
+        if self.latency:
+            time.sleep(self.latency)
+        frames = int(self.rate * 0.06 * len(text))
+        return make_wav((_STUB_PERIOD * (frames // 64 + 1))[:frames * 2], self.rate)
+
+
+class EspeakTTS:
+    """espeak-ng on the local machine (apt install espeak-ng); one process per sentence"""
+    name = "espeak"
+
+    def __call__(self, text, voice):
+        result = subprocess.run(["espeak-ng", "--stdout", "-v", voice, text],
+                                capture_output=True, check=True, timeout=30)
+        return result.stdout
+
+
+def get_tts_backend(name=TTS_BACKEND):
+    return EspeakTTS() if name == "espeak" else StubTTS()
+
+
+# ===== WAV =====
+def make_wav(pcm, rate, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def join_wav(clips):
+    """Concatenate WAV clips of the same format into one WAV"""
+    pcm, params = [], None
+    for clip in clips:
+        with wave.open(io.BytesIO(clip)) as wav:
+            params = params or (wav.getframerate(), wav.getnchannels())
+            pcm.append(wav.readframes(wav.getnframes()))
+    if params is None:
+        return b""
+    return make_wav(b"".join(pcm), *params)
+
+
+# ===== CACHE =====
+class AudioCache:
+    """On-disk LRU of clips bounded by total bytes; recency is the file mtime"""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # name -> size, paling lama dulu
+        self.size = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            entries = [(e.stat().st_mtime, e.name, e.stat().st_size) for e in os.scandir(directory)
+                       if e.name.endswith(".wav")]
+            for _, name, size in sorted(entries):
+                self._files[name] = size
+                self.size += size
+
+    @staticmethod
+    def key(text, voice):
+        return hashlib.sha256(f"{voice}\x1f{text}".encode()).hexdigest()[:32] + ".wav"
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._files:
+                self.stats["misses"] += 1
+                return None
+            self._files.move_to_end(name)
+            self.stats["hits"] += 1
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.size -= self._files.pop(name, 0)
+            return None
+        return data
+
+    def put(self, name, data):
+        if not self.directory or len(data) > self.max_bytes:
+            return
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.size += len(data) - self._files.pop(name, 0)
+            self._files[name] = len(data)
+            while self.size > self.max_bytes:
+                old, size = self._files.popitem(last=False)
+                self.size -= size
+                self.stats["evictions"] += 1
+                try:
+                    os.remove(os.path.join(self.directory, old))
+                except FileNotFoundError:
+                    pass
+
+    def get_stats(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "files": len(self._files), "bytes": self.size,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0}
+
+
+# ===== SERVICE =====
+class TTSService:
+    def __init__(self, backend=None, voice=TTS_VOICE, cache=None, max_workers=MAX_WORKERS):
+        self.backend = backend or get_tts_backend()
+        self.voice = voice
+        self.cache = cache if cache is not None else AudioCache()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ayra-tts")
+
+    def submit(self, sentence, voice=None):
+        """Future of one sentence's WAV clip (cached)"""
+        return self._executor.submit(self._synthesize, clean_for_speech(sentence), voice or self.voice)
+
+    def stream(self, text, voice=None):
+        """Yield one WAV clip per sentence, in order, as soon as each is ready"""
+        speech = SpeechStream(self, voice)
+        speech.push(text)
+        yield from speech.finish()
+
+    def synthesize(self, text, voice=None):
+        """Whole reply as a single WAV"""
+        return join_wav(self.stream(text, voice))
+
+    def _synthesize(self, sentence, voice):
+        name = self.cache.key(sentence, voice)
+        data = self.cache.get(name)
+        if data is not None:
+            tracer.incr("tts_cache_hit")
+            return data
+        start = time.perf_counter()
+        data = self.backend(sentence, voice)
+        tracer.record("tts.synthesize", (time.perf_counter() - start) * 1000, chars=len(sentence))
+        self.cache.put(name, data)
+        return data
+
+
+class SpeechStream:
+    """
+    Incremental TTS for a reply that is still streaming: push() text chunks,
+    take finished clips with ready() (non-blocking), then finish() for the rest.
+    """
+
+    def __init__(self, service, voice=None):
+        self.service = service
+        self.voice = voice
+        self._buffer = ""
+        self._futures = deque()
+        self._started = time.perf_counter()
+        self._first = True
+
+    def push(self, text):
+        self._buffer += text
+        sentences = split_sentences(self._buffer)
+        # Ayat terakhir mungkin belum habis; tunggu chunk seterusnya
+        if sentences and not _SENTENCE_END.search(self._buffer[-2:] if self._buffer else ""):
+            self._buffer = sentences.pop()
+        else:
+            self._buffer = ""
+        for sentence in sentences:
+            self._futures.append(self.service.submit(sentence, self.voice))
+
+    def ready(self):
+        while self._futures and self._futures[0].done():
+            yield self._take()
+
+    def finish(self):
+        if self._buffer.strip():
+            self._futures.append(self.service.submit(self._buffer, self.voice))
+            self._buffer = ""
+        while self._futures:
+            yield self._take()
+
+    def _take(self):
+        clip = self._futures.popleft().result()
+        if self._first:
+            self._first = False
+            tracer.record("tts.first_audio", (time.perf_counter() - self._started) * 1000)
+        return clip
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_tts():
+    """Process-wide TTSService, created on first use"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = TTSService()
+        return _default
+
+
+# For testing
+if __name__ == "__main__":
+    import tempfile
+
+    reply = ("Wah, best soalan tu! Esok cuaca KL panas sikit, tapi petang mungkin hujan. "
+             "Bawa payung ya sayang. Kalau nak, AYRA boleh ingatkan pagi esok?")
+    service = TTSService(StubTTS(latency_ms=150), cache=AudioCache(tempfile.mkdtemp(prefix="ayra-tts-")))
+    for label in ("cold", "cached"):
+        start = time.perf_counter()
+        for i, clip in enumerate(service.stream(reply)):
+            if i == 0:
+                first = time.perf_counter() - start
+        total = time.perf_counter() - start
+        print(f"{label:7s} {i + 1} sentences, first audio {first * 1000:6.1f} ms, all {total * 1000:6.1f} ms")
+    print("sequential would be ~", 150 * len(split_sentences(reply)), "ms")
+    print(service.cache.get_stats())
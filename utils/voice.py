@@ -1,7 +1,339 @@
-# This module will handle speech-to-text and text-to-speech.
-# For now, it's a placeholder.
-def transcribe_audio(audio_bytes):
-    return "Audio diterima, tapi fungsi STT belum aktif."
+# utils/voice.py
 
-def synthesize_speech(text):
-    return b"audio_data"  # placeholder
\ No newline at end of file
+"""
+Streaming voice input for AYRA.
+Audio arrives in chunks (PCM16, any rate / channel count). Each chunk is
+downmixed and resampled to 16 kHz incrementally, cut into 30 ms frames and
+passed through an energy VAD with an adaptive noise floor, so silence never
+reaches the STT backend. While the user speaks, partial transcripts are
+produced in the background; on a short pause a tentative final transcript
+is started, so when the end of speech is confirmed the text is usually
+ready and the turn starts immediately.
+
+STT backends are callables samples (float32, 16 kHz) -> text:
+StubSTT (no model) or WhisperSTT (faster-whisper on CPU, optional).
+"""
+
+import io
+import os
+import time
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .tracing import span, tracer
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+VAD_MARGIN_DB = 12.0  # berapa dB atas noise floor dikira suara
+VAD_MIN_DB = -50.0    # lebih senyap dari ni sentiasa senyap
+PREROLL_MS = 210      # audio sebelum onset yang disimpan (suku kata pertama)
+MIN_SPEECH_MS = 150   # lebih pendek dari ni = klik / batuk, buang
+PAUSE_MS = 210        # senyap sekejap: mula transkripsi final secara tentatif
+SILENCE_MS = 600      # senyap selama ni = user habis cakap
+PARTIAL_EVERY_MS = 690
+STT_BACKEND = os.getenv("AYRA_STT_BACKEND", "stub")  # stub | whisper
+STT_MODEL = os.getenv("AYRA_STT_MODEL", "tiny")
+
+
+# ===== AUDIO =====
+def pcm16_to_float(data, channels=1):
+    """Little-endian PCM16 bytes (whole frames: 2 * channels bytes each) -> mono float32 in [-1, 1]"""
+    samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+class Resampler:
+    """Streaming linear-interpolation resampler; state carries over between chunks"""
+
+    def __init__(self, src_rate, dst_rate=SAMPLE_RATE):
+        self.step = src_rate / dst_rate
+        self._pos = 0.0  # kedudukan output seterusnya, relatif kepada _tail
+        self._tail = np.zeros(0, dtype=np.float32)
+
+    def process(self, samples):
+        if self.step == 1.0:
+            return samples
+        x = np.concatenate([self._tail, samples])
+        if len(x) < 2:
+            self._tail = x
+            return np.zeros(0, dtype=np.float32)
+        count = int(np.floor((len(x) - 1 - self._pos) / self.step)) + 1
+        positions = self._pos + np.arange(count) * self.step
+        out = np.interp(positions, np.arange(len(x)), x).astype(np.float32)
+        # Simpan sampel terakhir untuk interpolasi merentas sempadan chunk
+        self._pos = positions[-1] + self.step - (len(x) - 1)
+        self._tail = x[-1:]
+        return out
+
+
+class EnergyVAD:
+    """Frame-level speech/silence from RMS energy against an adaptive noise floor"""
+
+    def __init__(self, margin_db=VAD_MARGIN_DB, min_db=VAD_MIN_DB):
+        self.margin_db = margin_db
+        self.min_db = min_db
+        self.noise_db = min_db
+
+    def is_speech(self, frame):
+        level = 10 * np.log10(float(np.mean(frame * frame)) + 1e-10)
+        speech = level > max(self.min_db, self.noise_db + self.margin_db)
+        if not speech:
+            # Floor turun cepat, naik perlahan (kipas / aircond berubah)
+            self.noise_db = level if level < self.noise_db else 0.95 * self.noise_db + 0.05 * level
+        return speech
+
+
+# ===== STT BACKENDS =====
+class StubSTT:
+    """No model: 'hears' a fixed transcript at ~3 words per second of speech"""
+    name = "stub"
+
+    def __init__(self, transcript="Audio diterima", words_per_sec=3.0, latency_ms=0.0):
+        self.words = transcript.split()
+        self.words_per_sec = words_per_sec
+        self.latency = latency_ms / 1000
+
+    def __call__(self, samples):
+        if self.latency:
+            time.sleep(self.latency)
+        heard = int(len(samples) / SAMPLE_RATE * self.words_per_sec) + 1
+        return " ".join(self.words[:heard])
+
+
+class WhisperSTT:
+    """faster-whisper on CPU (int8). pip install faster-whisper"""
+
+    def __init__(self, model=STT_MODEL, language=None):
+        from faster_whisper import WhisperModel
+
+        self.name = f"whisper-{model}"
+        self.language = language
+        self.model = WhisperModel(model, device="cpu", compute_type="int8")
+
+    def __call__(self, samples):
+        segments, _ = self.model.transcribe(samples, language=self.language, beam_size=1, vad_filter=False)
+        return " ".join(s.text.strip() for s in segments).strip()
+
+
+def get_stt_backend(name=STT_BACKEND):
+    return WhisperSTT() if name == "whisper" else StubSTT()
+
+
+# ===== STREAM =====
+class VoiceStream:
+    """
+    Feed audio chunks, get events back:
+    {"type": "speech_start"}, {"type": "partial", "text"},
+    {"type": "final", "text", "duration_s", "speech_end"} (speech_end = perf_counter
+    when the last voiced frame arrived, for end-of-speech latency).
+    """
+
+    def __init__(self, stt=None, sample_rate=SAMPLE_RATE, channels=1, vad=None):
+        self.stt = stt or get_stt_backend()
+        self.channels = channels
+        self.resampler = Resampler(sample_rate)
+        self.vad = vad or EnergyVAD()
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._leftover = b""  # bait yang belum cukup satu frame PCM (semua channel)
+        self._preroll = deque(maxlen=PREROLL_MS // FRAME_MS)
+        self._segment = None  # senarai frame semasa bercakap
+        self._voiced_len = 0  # frame sehingga frame bersuara terakhir
+        self._voiced_frames = 0
+        self._silence_ms = 0
+        self._since_partial_ms = 0
+        self._speech_end = None
+        self._partial = None     # Future transkrip separa
+        self._tentative = None   # (voiced_len, Future) transkrip final tentatif
+        self._last_partial = ""
+        # Satu worker: transkrip separa tak pernah berbaris, yang lambat dilangkau
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ayra-stt")
+        self.stats = {"frames": 0, "speech_frames": 0, "segments": 0, "dropped_segments": 0,
+                      "partials": 0, "stt_calls": 0, "tentative_used": 0}
+
+    def feed(self, chunk):
+        # Chunk WebSocket tak semestinya habis di sempadan sampel / frame stereo
+        data = self._leftover + chunk
+        usable = len(data) - len(data) % (2 * self.channels)
+        self._leftover = data[usable:]
+        samples = self.resampler.process(pcm16_to_float(data[:usable], self.channels))
+        self._pending = np.concatenate([self._pending, samples])
+        events = []
+        usable = len(self._pending) - len(self._pending) % FRAME_SAMPLES
+        for start in range(0, usable, FRAME_SAMPLES):
+            self._frame(self._pending[start:start + FRAME_SAMPLES], events)
+        self._pending = self._pending[usable:]
+        self._collect_partial(events)
+        return events
+
+    def close(self):
+        """Flush: whatever is still being spoken is finalized"""
+        events = []
+        if self._segment is not None:
+            self._end_segment(events)
+        self._executor.shutdown(wait=False)
+        return events
+
+    def get_stats(self):
+        frames = self.stats["frames"]
+        return {**self.stats, "silence_dropped": 1 - self.stats["speech_frames"] / frames if frames else 0.0}
+
+    # ===== INTERNALS =====
+    def _frame(self, frame, events):
+        self.stats["frames"] += 1
+        speech = self.vad.is_speech(frame)
+        if self._segment is None:
+            if not speech:
+                self._preroll.append(frame)
+                return
+            self._segment = list(self._preroll)
+            self._preroll.clear()
+            self._silence_ms = self._since_partial_ms = self._voiced_frames = 0
+            self._last_partial = ""
+            events.append({"type": "speech_start"})
+        self._segment.append(frame)
+        self._since_partial_ms += FRAME_MS
+        if speech:
+            self.stats["speech_frames"] += 1
+            self._voiced_frames += 1
+            self._voiced_len = len(self._segment)
+            self._speech_end = time.perf_counter()
+            self._silence_ms = 0
+            self._tentative = None  # user sambung cakap; tentatif tak sah lagi
+            if self._since_partial_ms >= PARTIAL_EVERY_MS and self._partial is None:
+                self._since_partial_ms = 0
+                self._partial = self._submit(self._segment)
+            return
+        self._silence_ms += FRAME_MS
+        if self._silence_ms == PAUSE_MS:
+            self._tentative = (self._voiced_len, self._submit(self._segment[:self._voiced_len]))
+        if self._silence_ms >= SILENCE_MS:
+            self._end_segment(events)
+
+    def _end_segment(self, events):
+        voiced = self._segment[:self._voiced_len]
+        duration = len(voiced) * FRAME_MS / 1000
+        self._segment = None
+        if self._voiced_frames * FRAME_MS < MIN_SPEECH_MS:
+            self._tentative = None
+            self.stats["dropped_segments"] += 1
+            return
+        with span("voice.final_stt", duration_s=duration):
+            if self._tentative is not None and self._tentative[0] == self._voiced_len:
+                text = self._tentative[1].result()
+                self.stats["tentative_used"] += 1
+            else:
+                text = self._submit(voiced).result()
+        self._tentative = None
+        self.stats["segments"] += 1
+        events.append({"type": "final", "text": text, "duration_s": duration, "speech_end": self._speech_end})
+
+    def _collect_partial(self, events):
+        if self._partial is None or not self._partial.done():
+            return
+        text = self._partial.result()
+        self._partial = None
+        if self._segment is not None and text and text != self._last_partial:
+            self._last_partial = text
+            self.stats["partials"] += 1
+            events.append({"type": "partial", "text": text})
+
+    def _submit(self, frames):
+        self.stats["stt_calls"] += 1
+        audio = np.concatenate(frames) if frames else np.zeros(0, dtype=np.float32)
+        return self._executor.submit(self.stt, audio)
+
+
+def voice_turn(engine, session, chunks, stt=None, sample_rate=SAMPLE_RATE, channels=1):
+    """
+    Drive engine turns from a stream of audio chunks. Yields the VoiceStream
+    events, then the engine's stream_turn events for every final transcript;
+    each "done" carries eos_latency_ms (end of speech -> first reply token).
+    """
+    stream = VoiceStream(stt, sample_rate, channels)
+
+    def turn(event):
+        yield event
+        eos_ms = None  # kekal None kalau model tak pulangkan apa-apa chunk
+        for reply in engine.stream_turn(session, event["text"]):
+            if eos_ms is None and reply["type"] == "chunk":
+                eos_ms = (time.perf_counter() - event["speech_end"]) * 1000
+                tracer.record("voice.eos_to_first_token", eos_ms)
+            if reply["type"] == "done":
+                reply = {**reply, "eos_latency_ms": eos_ms}
+            yield reply
+
+    for chunk in chunks:
+        for event in stream.feed(chunk):
+            yield from turn(event) if event["type"] == "final" and event["text"] else (event,)
+    for event in stream.close():
+        if event["text"]:
+            yield from turn(event)
+
+
+def read_wav(audio_bytes):
+    """(pcm16 bytes, sample_rate, channels) from WAV bytes; raw bytes are taken as 16 kHz mono PCM16"""
+    if audio_bytes[:4] != b"RIFF":
+        return audio_bytes, SAMPLE_RATE, 1
+    with wave.open(io.BytesIO(audio_bytes)) as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError("only 16-bit PCM WAV is supported")
+        return wav.readframes(wav.getnframes()), wav.getframerate(), wav.getnchannels()
+
+
+def transcribe_audio(audio_bytes, stt=None):
+    """Whole recording -> text, through the same VAD + STT pipeline"""
+    data, rate, channels = read_wav(audio_bytes)
+    stream = VoiceStream(stt, rate, channels)
+    step = rate * channels * 2 // 10  # 100 ms setiap chunk
+    events = []
+    for start in range(0, len(data), step):
+        events += stream.feed(data[start:start + step])
+    events += stream.close()
+    return " ".join(e["text"] for e in events if e["type"] == "final" and e["text"])
+
+
+def synthesize_speech(text, voice=None):
+    """Reply text -> one WAV (sentence-parallel, cached); see utils.tts for streaming"""
+    from .tts import default_tts
+
+    return default_tts().synthesize(text, voice)
+
+
+# Simulation: synthetic speech bursts in background noise, fed in real time
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    rate = 44100
+
+    def tone(seconds, amp):
+        t = np.arange(int(rate * seconds)) / rate
+        return amp * np.sin(2 * np.pi * 220 * t) * (1 + 0.5 * np.sin(2 * np.pi * 3 * t))
+
+    def noise(seconds, amp=0.003):
+        return amp * rng.standard_normal(int(rate * seconds))
+
+    audio = np.concatenate([noise(1.0), tone(1.5, 0.3) + noise(1.5), noise(0.3), tone(0.8, 0.3) + noise(0.8),
+                            noise(1.2), tone(0.05, 0.5), noise(1.0)])
+    pcm = (np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes()
+    chunk_bytes = rate * 2 // 50  # 20 ms chunks macam mic sebenar
+
+    stt = StubSTT("saya nak tanya pasal cuaca esok dekat KL", latency_ms=80)
+    stream = VoiceStream(stt, sample_rate=rate)
+    start = time.perf_counter()
+    for offset in range(0, len(pcm), chunk_bytes):
+        for event in stream.feed(pcm[offset:offset + chunk_bytes]):
+            at = time.perf_counter() - start
+            if event["type"] == "final":
+                lag = (time.perf_counter() - event["speech_end"]) * 1000
+                print(f"{at:5.2f}s final   {event['text']!r} ({event['duration_s']:.2f}s speech, "
+                      f"ready {lag:.0f} ms after end of speech)")
+            else:
+                print(f"{at:5.2f}s {event['type']:8s}{event.get('text', '')!r}")
+        time.sleep(0.02)
+    stream.close()
+    print(stream.get_stats())